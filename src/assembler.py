@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sys
+from array import array
+from functools import lru_cache
+
+from instr import Instr
+from validator import ValidateARM
+
+# Assembles decoded programs (see decoder.py) into 32-bit LEGv8 machine
+# code words and back. Formats (most significant bit first):
+#   R:  opcode(11) Rm(5) shamt(6) Rn(5) Rd(5)     ADD, SUB
+#   I:  opcode(10) ALU_immediate(12) Rn(5) Rd(5)  ADDI, SUBI
+#   D:  opcode(11) DT_address(9) op(2) Rn(5) Rt(5) LDUR, STUR
+#   B:  opcode(6) BR_address(26)                  B
+#   CB: opcode(8) COND_BR_address(19) Rt(5)       CBZ, CBNZ
+#
+# Binary images are the words stored as little-endian 32-bit integers.
+
+R_OPCODES = { Instr.OP_ADD: 0b10001011000, Instr.OP_SUB: 0b11001011000 }
+I_OPCODES = { Instr.OP_ADDI: 0b1001000100, Instr.OP_SUBI: 0b1101000100 }
+D_OPCODES = { Instr.OP_LDUR: 0b11111000010, Instr.OP_STUR: 0b11111000000 }
+B_OPCODES = { Instr.OP_B: 0b000101 }
+CB_OPCODES = { Instr.OP_CBZ: 0b10110100, Instr.OP_CBNZ: 0b10110101 }
+
+# (opcode field -> opcode id) for each format, keyed by opcode field width
+FIELDS = {
+    11: { v: k for k, v in { **R_OPCODES, **D_OPCODES }.items() },
+    10: { v: k for k, v in I_OPCODES.items() },
+    8: { v: k for k, v in CB_OPCODES.items() },
+    6: { v: k for k, v in B_OPCODES.items() },
+}
+
+OP_NAMES = { op: name for name, op in Instr.OPCODES.items() }
+
+def to_field(value: int, bits: int) -> int:
+    return value & ((1 << bits) - 1)
+
+def from_field(value: int, bits: int) -> int:
+    # Sign-extends a two's complement field
+    if value >= 1 << (bits - 1): value -= 1 << bits
+    return value
+
+class Assembler:
+    def encode(instr: tuple) -> int:
+        op, a, b, c = instr
+
+        if op in R_OPCODES:
+            return (R_OPCODES[op] << 21) | (c << 16) | (b << 5) | a
+        if op in I_OPCODES:
+            return (I_OPCODES[op] << 22) | (c << 10) | (b << 5) | a
+        if op in D_OPCODES:
+            return (D_OPCODES[op] << 21) | (to_field(c, 9) << 12) | (b << 5) | a
+        if op in B_OPCODES:
+            return (B_OPCODES[op] << 26) | to_field(c, 26)
+        if op in CB_OPCODES:
+            return (CB_OPCODES[op] << 24) | (to_field(c, 19) << 5) | a
+
+        error_msg = f'''
+        Can not encode instruction. Recieved {instr}.
+        '''
+        raise ValueError(error_msg)
+
+    def decode(word: int) -> tuple:
+        for bits, opcodes in FIELDS.items():
+            op = opcodes.get(word >> (32 - bits))
+            if op is None: continue
+
+            rd, rn = word & 0x1F, (word >> 5) & 0x1F
+            if op in R_OPCODES: return (op, rd, rn, (word >> 16) & 0x1F)
+            if op in I_OPCODES: return (op, rd, rn, (word >> 10) & 0xFFF)
+            if op in D_OPCODES: return (op, rd, rn, from_field((word >> 12) & 0x1FF, 9))
+            if op in B_OPCODES: return (op, 0, 0, from_field(word & 0x3FFFFFF, 26))
+            return (op, rd, 0, from_field((word >> 5) & 0x7FFFF, 19))
+
+        error_msg = f'''
+        Invalid machine code word. Recieved {word:#010x}.
+        '''
+        raise ValueError(error_msg)
+
+    # Returns the assembly text of a decoded instruction
+    def disassemble(instr: tuple) -> str:
+        op, a, b, c = instr
+        reg = lambda r: 'XZR' if r == 31 else f'X{r}'
+        name = OP_NAMES[op]
+
+        if op in R_OPCODES: return f"{name} {reg(a)}, {reg(b)}, {reg(c)}"
+        if op in I_OPCODES: return f"{name} {reg(a)}, {reg(b)}, #{c}"
+        if op in D_OPCODES: return f"{name} {reg(a)}, [{reg(b)}, #{c}]"
+        if op in B_OPCODES: return f"{name} #{c}"
+        return f"{name} {reg(a)}, #{c}"
+
+    # Validates a program and returns its machine code words
+    def assemble(code: list[str]) -> array:
+        return array('I', [Assembler.encode(instr) for instr in ValidateARM.decode_code(code)])
+
+    def to_bytes(words: array) -> bytes:
+        words = array('I', words)
+        if sys.byteorder != 'little': words.byteswap()
+        return words.tobytes()
+
+    def from_bytes(image) -> array:
+        words = array('I')
+        words.frombytes(bytes(image))
+        if sys.byteorder != 'little': words.byteswap()
+        return words
+
+    # Decodes a binary image (bytes, or a sequence of words) into
+    # (decoded program, assembly text)
+    def decode_image(image) -> tuple:
+        if isinstance(image, array) and image.typecode == 'I':
+            image = Assembler.to_bytes(image)
+        return Assembler.decode_image_bytes(bytes(image))
+
+    @lru_cache(maxsize=1024)
+    def decode_image_bytes(image: bytes) -> tuple:
+        if len(image) % 4 != 0:
+            error_msg = f'''
+            Invalid binary image.
+            Recieved {len(image)} bytes, expected a multiple of 4.
+            '''
+            raise ValueError(error_msg)
+
+        decoded = tuple(Assembler.decode(word) for word in Assembler.from_bytes(image))
+        code = [Assembler.disassemble(instr) for instr in decoded]
+        return decoded, code
+
+    def write_binary(code: list[str], file_name: str) -> None:
+        # Assembles first, so invalid code never creates the file
+        image = Assembler.to_bytes(Assembler.assemble(code))
+        with open(file_name, 'wb') as f:
+            f.write(image)
+
+    # Returns the image of a binary file. CPU copies images into bytes to
+    # decode them, so a memory map would only hold a file descriptor open.
+    def read_binary(file_name: str) -> bytes:
+        with open(file_name, 'rb') as f:
+            return f.read()
+
+# On-disk cache of assembled programs, keyed by a hash of the source.
+class AssemblyCache:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(code: list[str]) -> str:
+        return hashlib.sha256("\n".join(code).encode()).hexdigest()
+
+    def path(self, code: list[str]) -> str:
+        return os.path.join(self.directory, AssemblyCache.key(code) + '.bin')
+
+    # Returns the binary image of code, assembling and storing it first if
+    # it is not cached yet
+    def load(self, code: list[str]) -> bytes:
+        path = self.path(code)
+        if not os.path.exists(path):
+            # Write to a temporary file first, so readers never see a partial image
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                Assembler.write_binary(code, tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+
+        return Assembler.read_binary(path)
@@ -0,0 +1,360 @@
+import copy
+import time
+
+import numpy as np
+
+from cpu import CPU, CHUNK, RunResult
+
+# Runs one program across N initial CPU states in lockstep.
+#
+# Registers are stored as an (N, 32) uint64 array and data memory as an
+# (N, MEMSIZE) uint8 array. Every step executes the instruction at the
+# lowest PC among the running lanes, for all lanes at that PC, so lanes
+# that diverge on CBZ/CBNZ reconverge as soon as possible.
+#
+# The scalar CPU keeps registers as unbounded Python ints. Registers are
+# held as their low 64 bits in the uint64 array and, once an ADD/SUB/ADDI/
+# SUBI in any lane first leaves [0, 2^64), their high words in an (N, 32)
+# int64 array, so a value is high * 2^64 + low. Arithmetic carries into
+# the high words, so every lane stays on the vectorized path with exactly
+# the scalar CPU's results (STUR stores the low 64 bits, as the scalar CPU
+# does). wide_rate() reports the share of lanes that left [0, 2^64).
+#
+# Only lanes doing something the arrays can not mirror (a negative or out
+# of range memory access, a negative PC, a high word beyond HIGH_LIMIT) are
+# set aside and re-run from their initial state with the scalar CPU.
+# fallback_rate() reports their share.
+#
+# run() takes the max_instrs and deadline of CPU.run. Lanes reaching
+# max_instrs stop there, and all running lanes stop once the deadline
+# passes. statuses() reports why each lane stopped.
+
+U64 = np.uint64
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+# Largest high word held. Adding two high words of at most this size and
+# a carry can not overflow int64.
+HIGH_LIMIT = 2 ** 61
+BYTE_OFFSETS = np.arange(8)
+
+class BatchCPU:
+    def __init__(self, id: any, cpus: list[CPU]) -> None:
+        if len(cpus) == 0:
+            raise ValueError("BatchCPU requires at least one CPU state.")
+
+        code = cpus[0].code
+        mem_size = cpus[0].mem_size
+        for cpu in cpus:
+            if not isinstance(cpu.memory, bytearray):
+                error_msg = f'''
+                BatchCPU does not support paged memory.
+                CPU '{cpu.id}' uses {type(cpu.memory).__name__}.
+                '''
+                raise ValueError(error_msg)
+
+            if cpu.code != code or cpu.mem_size != mem_size:
+                error_msg = f'''
+                All CPU states must run the same program with the same memory size.
+                CPU '{cpu.id}' differs from CPU '{cpus[0].id}'.
+                '''
+                raise ValueError(error_msg)
+
+        self.id = id
+        self.code = code
+        self.decoded = cpus[0].decoded
+        self.n = len(cpus)
+        self.mem_size = mem_size
+
+        self.pcs = np.zeros(self.n, dtype=np.int64)
+        # Instructions executed by each lane (see instr_counts)
+        self.instrs = np.zeros(self.n, dtype=np.int64)
+
+        # Lanes that must be re-run with the scalar CPU
+        self.fallback = np.zeros(self.n, dtype=bool)
+        # Lanes that held a register outside [0, 2^64)
+        self.wide = np.zeros(self.n, dtype=bool)
+        # High words of the registers, or None while all are 0
+        self.high = None
+
+        # Initial states of lanes that do not fit in the arrays
+        self.wide_states = {}
+
+        mem = b''.join(cpu.memory for cpu in cpus)
+        self.data_mem = np.frombuffer(mem, dtype=np.uint8).reshape(self.n, self.mem_size).copy()
+
+        try:
+            self.registers = np.array([cpu.registers for cpu in cpus], dtype=U64)
+        except OverflowError:
+            self.load_registers(cpus)
+
+        for i, cpu in enumerate(cpus):
+            if cpu.pc != 0: self.set_wide(i, cpu)
+
+        self.init_registers = self.registers.copy()
+        self.init_high = None if self.high is None else self.high.copy()
+        self.init_data_mem = self.data_mem.copy()
+
+        self.errors = {}
+        # Lane index -> RunResult of its scalar re-run
+        self.scalar_results = {}
+        self.lane_cpus = None
+
+        # Limits of the last run(), also applied to scalar re-runs
+        self.max_instrs = None
+        self.deadline = None
+        # Lane index -> status of lanes that stopped before halting
+        self.stopped = {}
+
+    def set_wide(self, i: int, cpu: CPU) -> None:
+        self.wide_states[i] = (cpu.pc, list(cpu.registers), bytes(cpu.memory))
+        self.fallback[i] = True
+
+    # States with registers outside [0, 2^64) start with high words
+    def load_registers(self, cpus: list[CPU]) -> None:
+        self.registers = np.array([[r & MASK_64 for r in cpu.registers] for cpu in cpus], dtype=U64)
+        self.widen()
+        for i, cpu in enumerate(cpus):
+            high = [r >> 64 for r in cpu.registers]
+            self.wide[i] = any(high)
+            if any(abs(h) > HIGH_LIMIT for h in high): self.set_wide(i, cpu)
+            else: self.high[i] = high
+
+    # Starts holding high words, once a register first leaves [0, 2^64)
+    def widen(self) -> None:
+        self.high = np.zeros((self.n, 32), dtype=np.int64)
+
+    # Sets the high words of register XA for lanes
+    def set_high(self, lanes: np.ndarray, rows, XA: int, high: np.ndarray) -> None:
+        self.high[rows, XA] = high
+        nonzero = high != 0
+        if nonzero.any():
+            self.wide[lanes[nonzero]] = True
+            big = np.abs(high) > HIGH_LIMIT
+            if big.any(): self.fallback[lanes[big]] = True
+
+    # Share of lanes re-run with the scalar CPU
+    def fallback_rate(self) -> float:
+        return float(self.fallback.mean())
+
+    # Share of lanes that held a register outside [0, 2^64), whether they
+    # ran in the batch or were re-run
+    def wide_rate(self) -> float:
+        return float(self.wide.mean())
+
+    def lanes_arg(self, lanes: np.ndarray):
+        # Plain slices are much faster than fancy indexing when no lane diverged
+        return slice(None) if len(lanes) == self.n else lanes
+
+    def exec_add(self, lanes: np.ndarray, XA: int, XB: int, XC: int) -> None:
+        rows = self.lanes_arg(lanes)
+        b, c = self.registers[rows, XB], self.registers[rows, XC]
+        res = b + c
+        carry = res < b
+        if self.high is None and carry.any(): self.widen()
+        if self.high is not None:
+            self.set_high(lanes, rows, XA, self.high[rows, XB] + self.high[rows, XC] + carry)
+        self.registers[rows, XA] = res
+        self.pcs[rows] += 1
+
+    def exec_sub(self, lanes: np.ndarray, XA: int, XB: int, XC: int) -> None:
+        rows = self.lanes_arg(lanes)
+        b, c = self.registers[rows, XB], self.registers[rows, XC]
+        borrow = c > b
+        if self.high is None and borrow.any(): self.widen()
+        if self.high is not None:
+            self.set_high(lanes, rows, XA, self.high[rows, XB] - self.high[rows, XC] - borrow)
+        self.registers[rows, XA] = b - c
+        self.pcs[rows] += 1
+
+    def exec_addi(self, lanes: np.ndarray, XA: int, XB: int, IMM: int) -> None:
+        rows = self.lanes_arg(lanes)
+        b = self.registers[rows, XB]
+        res = b + U64(IMM)
+        carry = res < b
+        if self.high is None and carry.any(): self.widen()
+        if self.high is not None:
+            self.set_high(lanes, rows, XA, self.high[rows, XB] + carry)
+        self.registers[rows, XA] = res
+        self.pcs[rows] += 1
+
+    def exec_subi(self, lanes: np.ndarray, XA: int, XB: int, IMM: int) -> None:
+        rows = self.lanes_arg(lanes)
+        b = self.registers[rows, XB]
+        borrow = b < U64(IMM)
+        if self.high is None and borrow.any(): self.widen()
+        if self.high is not None:
+            self.set_high(lanes, rows, XA, self.high[rows, XB] - borrow)
+        self.registers[rows, XA] = b - U64(IMM)
+        self.pcs[rows] += 1
+
+    # Returns the lanes whose access is in bounds and aligned, and their
+    # addresses. All other lanes are sent to the scalar CPU.
+    def access_lanes(self, lanes: np.ndarray, XB: int, IMM: int) -> tuple:
+        base = self.registers[lanes, XB]
+        if self.high is None:
+            in_range = base <= U64(self.mem_size + 256)
+            addr = np.where(in_range, base, 0).astype(np.int64) + IMM
+        else:
+            # Bases in [-256, 0) have a high word of -1
+            high = self.high[lanes, XB]
+            signed = base.view(np.int64)
+            in_range = ((high == 0) & (base <= U64(self.mem_size + 256))) | ((high == -1) & (signed >= -256) & (signed < 0))
+            addr = np.where(in_range, signed, 0) + IMM
+
+        ok = in_range & (addr >= 0) & (addr + 7 < self.mem_size) & (addr % 8 == 0)
+
+        self.fallback[lanes[~ok]] = True
+        return lanes[ok], addr[ok]
+
+    def exec_ldur(self, lanes: np.ndarray, XA: int, XB: int, IMM: int) -> None:
+        lanes, addr = self.access_lanes(lanes, XB, IMM)
+        data = self.data_mem[lanes[:, None], addr[:, None] + BYTE_OFFSETS]
+        self.registers[lanes, XA] = data.view('>u8').ravel()
+        if self.high is not None: self.high[lanes, XA] = 0
+        self.pcs[lanes] += 1
+
+    def exec_stur(self, lanes: np.ndarray, XA: int, XB: int, IMM: int) -> None:
+        lanes, addr = self.access_lanes(lanes, XB, IMM)
+        data = self.registers[lanes, XA].astype('>u8').view(np.uint8)
+        self.data_mem[lanes[:, None], addr[:, None] + BYTE_OFFSETS] = data.reshape(-1, 8)
+        self.pcs[lanes] += 1
+
+    def exec_b(self, lanes: np.ndarray, _: int, __: int, IMM: int) -> None:
+        self.pcs[self.lanes_arg(lanes)] += IMM
+
+    def exec_cbz(self, lanes: np.ndarray, XA: int, _: int, IMM: int) -> None:
+        rows = self.lanes_arg(lanes)
+        taken = self.registers[rows, XA] == 0
+        if self.high is not None: taken &= self.high[rows, XA] == 0
+        self.pcs[rows] += np.where(taken, IMM, 1)
+
+    def exec_cbnz(self, lanes: np.ndarray, XA: int, _: int, IMM: int) -> None:
+        rows = self.lanes_arg(lanes)
+        taken = self.registers[rows, XA] != 0
+        if self.high is not None: taken |= self.high[rows, XA] != 0
+        self.pcs[rows] += np.where(taken, IMM, 1)
+
+    # Handlers indexed by opcode id (see Instr.OPCODES)
+    EXECUTE = [
+        exec_add, exec_sub, exec_ldur, exec_stur, exec_addi, exec_subi,
+        exec_b, exec_cbz, exec_cbnz
+    ]
+
+    # Runs every lane until it halts, or until it has executed max_instrs
+    # instructions or time.monotonic() passes deadline
+    def run(self, max_instrs: int = None, deadline: float = None) -> None:
+        decoded = self.decoded
+        execute = BatchCPU.EXECUTE
+        end = len(decoded)
+        self.max_instrs, self.deadline = max_instrs, deadline
+        steps = 0
+
+        while True:
+            # Lanes with a negative PC follow Python's negative list indexing
+            # in the scalar CPU, so they are left to it
+            self.fallback |= self.pcs < 0
+
+            active = (self.pcs < end) & ~self.fallback
+            if max_instrs is not None: active &= self.instrs < max_instrs
+            running = np.flatnonzero(active)
+            if len(running) == 0: break
+
+            if deadline is not None and steps % CHUNK == 0 and time.monotonic() >= deadline: break
+            steps += 1
+
+            pcs = self.pcs[running]
+            pc = pcs.min()
+            lanes = running if pcs.max() == pc else running[pcs == pc]
+
+            op, a, b, c = decoded[pc]
+            execute[op](self, lanes, a, b, c)
+            self.instrs[lanes] += 1
+
+        self.stopped = {}
+        for i in np.flatnonzero((self.pcs < end) & ~self.fallback).tolist():
+            limited = max_instrs is not None and self.instrs[i] >= max_instrs
+            self.stopped[i] = RunResult.MAX_INSTRS if limited else RunResult.DEADLINE
+        self.lane_cpus = None
+
+    def run_scalar(self, i: int, template: CPU) -> CPU:
+        cpu = copy.copy(template)
+        cpu.id = (self.id, i)
+
+        if i in self.wide_states:
+            pc, regs, mem = self.wide_states[i]
+            cpu.pc, cpu.registers, cpu.memory = pc, list(regs), bytearray(mem)
+        else:
+            cpu.pc = 0
+            cpu.registers = self.init_registers[i].tolist()
+            if self.init_high is not None:
+                cpu.registers = [(h << 64) + r for h, r in zip(self.init_high[i].tolist(), cpu.registers)]
+            cpu.memory = bytearray(self.init_data_mem[i].tobytes())
+
+        try:
+            # Bounded runs count instructions, and run without limit when
+            # given none
+            self.scalar_results[i] = CPU.BOUNDED_ENGINES['interp'](cpu, self.max_instrs, self.deadline)
+        except Exception as e:
+            self.errors[i] = e
+            self.scalar_results[i] = None
+
+        return cpu
+
+    # Returns the final state of every lane as a scalar CPU
+    def to_cpus(self) -> list[CPU]:
+        if self.lane_cpus is not None:
+            return self.lane_cpus
+
+        template = self.template_cpu()
+        self.errors = {}
+        self.scalar_results = {}
+
+        registers = self.registers.tolist()
+        if self.high is not None:
+            rows, cols = np.nonzero(self.high)
+            for i, j, h in zip(rows.tolist(), cols.tolist(), self.high[rows, cols].tolist()):
+                registers[i][j] += h << 64
+        pcs = (self.pcs * 4).tolist()
+        fallback = self.fallback.tolist()
+        memory = memoryview(self.data_mem.tobytes())
+        mem_size = self.mem_size
+
+        cpus = []
+        for i in range(self.n):
+            if fallback[i]:
+                cpus.append(self.run_scalar(i, template))
+                continue
+
+            cpu = CPU.__new__(CPU)
+            cpu.__dict__.update(template.__dict__)
+            cpu.id = (self.id, i)
+            cpu.pc = pcs[i]
+            cpu.registers = registers[i]
+            cpu.memory = bytearray(memory[mem_size * i:mem_size * (i + 1)])
+            cpus.append(cpu)
+
+        self.lane_cpus = cpus
+        return cpus
+
+    # Returns the number of instructions each lane executed, or None for
+    # lanes that raised an exception
+    def instr_counts(self) -> list[int]:
+        self.to_cpus()
+        counts = self.instrs.tolist()
+        for i, result in self.scalar_results.items():
+            counts[i] = None if result is None else result.instrs
+        return counts
+
+    # Returns the RunResult status of each lane (see CPU.run), or None for
+    # lanes that raised an exception
+    def statuses(self) -> list[str]:
+        self.to_cpus()
+        res = [self.stopped.get(i, RunResult.HALTED) for i in range(self.n)]
+        for i, result in self.scalar_results.items():
+            res[i] = None if result is None else result.status
+        return res
+
+    def template_cpu(self) -> CPU:
+        return CPU(self.id, self.code, randomize=False, mem_size=self.mem_size)
+
+    def lane_cpu(self, i: int) -> CPU:
+        return self.to_cpus()[i]
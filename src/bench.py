@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from compact import CompactCPU
+from cpu import CPU
+from validator import ValidateARM
+
+# BatchCPU needs NumPy, so its benchmark is only available with it
+try:
+    from batch import BatchCPU
+except ImportError:
+    BatchCPU = None
+
+# Benchmark suite for the emulator.
+#
+# Each benchmark has a setup step (not timed) that returns the function to
+# time and the number of operations it performs: executed instructions for
+# the program benchmarks, or calls for the construction, validation and
+# rendering benchmarks. Every benchmark is run `warmup` times untimed, then
+# `trials` times timed, and reported as ops/second and us/op from the median
+# trial. Results can be saved as JSON and compared against an earlier run.
+# With --memory, the bytes held per CPU and per CompactCPU instance are
+# measured as well.
+#
+# Program benchmarks run with fast_forward=False, so counted loops are
+# executed iteration by iteration and the results measure instruction
+# dispatch. count_loop_ff times the counting loop in closed form instead
+# (see loops.py), where the run takes constant time whatever the count.
+#
+# Before timing a program, its setup checks that every engine (see
+# engine_results) reaches the same final state and instruction count on a
+# small instance of it, so a benchmark never times a wrong result.
+
+# Tight counting loop: X1 iterations of SUBI / ADDI / CBNZ
+COUNT_LOOP = [
+    'SUBI X1, X1, #1',
+    'ADDI X2, X2, #1',
+    'CBNZ X1, #-2',
+]
+
+# Array sum from main.py: X2 double words starting at X1
+ARRAY_SUM = [
+    'ADD X4, XZR, XZR',
+    'LDUR X5, [X1, #0]',
+    'ADD X4, X4, X5',
+    'ADDI X1, X1, #8',
+    'SUBI X2, X2, #1',
+    'CBNZ X2, #-4',
+    'STUR X4, [X3, #8]',
+]
+
+# Copies X2 double words from X1 to X3
+MEM_COPY = [
+    'LDUR X5, [X1, #0]',
+    'STUR X5, [X3, #0]',
+    'ADDI X1, X1, #8',
+    'ADDI X3, X3, #8',
+    'SUBI X2, X2, #1',
+    'CBNZ X2, #-5',
+]
+
+# Counts X1 down, taking a different path on every other iteration
+BRANCHY = [
+    'SUBI X1, X1, #1',
+    'CBZ X1, #7',
+    'CBZ X3, #3',
+    'ADDI X3, XZR, #0',
+    'B #-4',
+    'ADDI X3, XZR, #1',
+    'ADDI X4, X4, #1',
+    'B #-7',
+]
+
+# Counts X2 up forever, storing it to the same double word every time
+STORE_LOOP = [
+    'ADDI X2, X2, #1',
+    'STUR X2, [X1, #0]',
+    'B #-2',
+]
+
+# Returns the number of instructions a CPU executes until it halts
+def count_instrs(cpu: CPU) -> int:
+    return cpu.fork().run(max_instrs=10 ** 12).instrs
+
+# Scale of the program instances compared by check_engines, small enough
+# for a one-lane BatchCPU
+CHECK_SCALE = 0.01
+
+# Returns the (state digest, instructions) reached on a fork of cpu by
+# run(**kwargs). Unbounded runs do not count instructions.
+def run_engine(cpu: CPU, **kwargs) -> tuple:
+    cpu = cpu.fork()
+    instrs = cpu.run(**kwargs).instrs
+    return cpu.state_digest(), instrs
+
+# Returns the (state digest, instructions) each engine reaches from cpu,
+# by engine name. BatchCPU is included if NumPy is installed.
+def engine_results(cpu: CPU) -> dict:
+    res = {
+        'interp': run_engine(cpu),
+        'interp, no fast-forward': run_engine(cpu, fast_forward=False),
+        'block': run_engine(cpu, engine='block'),
+        'bounded interp': run_engine(cpu, max_instrs=10 ** 12),
+        'bounded interp, no fast-forward': run_engine(cpu, max_instrs=10 ** 12, fast_forward=False),
+        'bounded block': run_engine(cpu, engine='block', max_instrs=10 ** 12),
+    }
+    if BatchCPU is not None:
+        batch = BatchCPU(cpu.id, [cpu])
+        batch.run()
+        res['batch'] = (batch.to_cpus()[0].state_digest(), batch.instr_counts()[0])
+    return res
+
+# Raises AssertionError unless every engine reaches the same state, and
+# every engine that counts instructions the same count
+def check_engines(cpu: CPU) -> None:
+    results = engine_results(cpu)
+    digests = { digest for digest, _ in results.values() }
+    counts = { instrs for _, instrs in results.values() if instrs is not None }
+    if len(digests) != 1 or len(counts) != 1:
+        error_msg = f'''
+        Engines disagree on '{cpu.id}'.
+        Recieved (digest, instrs) by engine: {results}.
+        '''
+        raise AssertionError(error_msg)
+
+# Returns a setup function for a program benchmark. make_cpu(scale) builds
+# the initial CPU, and each trial runs a fresh fork of it.
+def program_benchmark(make_cpu, fast_forward: bool = False):
+    def setup(engine: str, scale: float) -> tuple:
+        check_engines(make_cpu(min(scale, CHECK_SCALE)))
+
+        cpu = make_cpu(scale)
+        instrs = count_instrs(cpu)
+        cpus = []
+
+        def prepare() -> None:
+            cpus.append(cpu.fork())
+
+        def run() -> None:
+            cpus.pop().run(engine=engine, fast_forward=fast_forward)
+
+        return prepare, run, instrs
+    return setup
+
+def count_loop(scale: float) -> CPU:
+    return CPU('count loop', COUNT_LOOP, reg_config={'X1': int(300_000 * scale), 'X2': 0}, randomize=False)
+
+def array_sum(scale: float) -> CPU:
+    n = int(20_000 * scale)
+    # Room for the array and the sum after it, rounded up to 16 bytes
+    mem_size = 16 * (n // 2 + 1)
+    return CPU('array sum', ARRAY_SUM, reg_config={'X1': 0, 'X2': n, 'X3': 8 * (n - 1)}, mem_size=mem_size, seed=1)
+
+def mem_copy(scale: float) -> CPU:
+    n = int(20_000 * scale)
+    return CPU('memory copy', MEM_COPY, reg_config={'X1': 0, 'X2': n, 'X3': 8 * n}, mem_size=16 * n, seed=1)
+
+def branchy(scale: float) -> CPU:
+    return CPU('branch heavy', BRANCHY, reg_config={'X1': int(100_000 * scale), 'X3': 0, 'X4': 0}, randomize=False)
+
+# BatchCPU over randomized array sum states, as in the README example,
+# including the conversion back to CPUs. Also reports the share of lanes
+# re-run with the scalar CPU, and of lanes whose registers left 64 bits.
+def batch_sum(engine: str, scale: float) -> tuple:
+    cpus = CPU.random_batch('batch sum', ARRAY_SUM, int(2_000 * scale), 'X1=16\nX2=5\nX3=48', seed=1)
+    instrs = sum(count_instrs(cpu) for cpu in cpus)
+
+    batch = BatchCPU('batch sum', cpus)
+    batch.run()
+    info = { 'fallback_rate': batch.fallback_rate(), 'wide_rate': batch.wide_rate() }
+
+    def run() -> None:
+        batch = BatchCPU('batch sum', cpus)
+        batch.run()
+        batch.to_cpus()
+
+    return None, run, instrs, info
+
+# Setup for benchmarks timing op() calls
+def call_benchmark(make_op):
+    def setup(engine: str, scale: float) -> tuple:
+        op, calls = make_op(scale)
+
+        def run() -> None:
+            for _ in range(calls): op()
+
+        return None, run, calls
+    return setup
+
+def construct(scale: float) -> tuple:
+    rng = random.Random(1)
+    return lambda: CPU('construct', ARRAY_SUM, seed=rng), int(2_000 * scale)
+
+def validate(scale: float) -> tuple:
+    # ValidateARM.decode, since decode_code caches whole programs
+    lines = COUNT_LOOP + ARRAY_SUM + MEM_COPY + BRANCHY
+    return lambda: [ValidateARM.decode(line) for line in lines], int(1_000 * scale)
+
+def render(hex_mode: bool):
+    def make_op(scale: float) -> tuple:
+        cpu = CPU('render', ARRAY_SUM, seed=1)
+        cpu.set_print_mode(hex_mode)
+        return lambda: str(cpu), int(500 * scale)
+    return make_op
+
+# Renders the state after every instruction, as step() does
+def render_step(scale: float) -> tuple:
+    cpu = CPU('render step', STORE_LOOP, reg_config={'X1': 64, 'X2': 0}, seed=1)
+
+    def op() -> None:
+        cpu.run_instr()
+        str(cpu)
+
+    return op, int(500 * scale)
+
+# name -> (setup, unit of an op)
+BENCHMARKS = {
+    'count_loop': (program_benchmark(count_loop), 'instr'),
+    'count_loop_ff': (program_benchmark(count_loop, fast_forward=True), 'instr'),
+    'array_sum': (program_benchmark(array_sum), 'instr'),
+    'mem_copy': (program_benchmark(mem_copy), 'instr'),
+    'branchy': (program_benchmark(branchy), 'instr'),
+    'construct': (call_benchmark(construct), 'cpu'),
+    'validate': (call_benchmark(validate), 'program'),
+    'str_hex': (call_benchmark(render(True)), 'str'),
+    'str_dec': (call_benchmark(render(False)), 'str'),
+    'str_step': (call_benchmark(render_step), 'str'),
+}
+
+if BatchCPU is not None:
+    BENCHMARKS['batch_sum'] = (batch_sum, 'instr')
+
+def run_benchmark(name: str, engine: str, scale: float, warmup: int, trials: int) -> dict:
+    setup, unit = BENCHMARKS[name]
+    # Setups may return a dict of extra results after the op count
+    prepare, run, ops, *info = setup(engine, scale)
+
+    times = []
+    for i in range(warmup + trials):
+        if prepare: prepare()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        if i >= warmup: times.append(seconds)
+
+    median = statistics.median(times)
+    res = {
+        'unit': unit,
+        'ops': ops,
+        'median_s': median,
+        'best_s': min(times),
+        'ops_per_s': ops / median,
+        'us_per_op': median / ops * 1e6,
+    }
+    if info: res.update(info[0])
+    return res
+
+# Returns the bytes allocated per instance by make_batch(n), as measured
+# by tracemalloc, keeping only what the instances hold
+def bytes_per_instance(make_batch, n: int) -> float:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        batch = make_batch(n)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del batch
+    return (after - before) / n
+
+# Bytes per randomized array sum instance, held as CPU and as CompactCPU
+def memory_usage(n: int) -> dict:
+    reg_config = 'X1=0\nX2=4\nX3=24'
+    # Builds the shared program outside the measurement
+    CompactCPU.random_batch('memory', ARRAY_SUM, 1, reg_config, seed=1)
+    return {
+        'instances': n,
+        'cpu': bytes_per_instance(lambda n: CPU.random_batch('memory', ARRAY_SUM, n, reg_config, seed=1), n),
+        'compact': bytes_per_instance(lambda n: CompactCPU.random_batch('memory', ARRAY_SUM, n, reg_config, seed=1), n),
+    }
+
+def run_suite(names: list[str], engine: str = 'interp', scale: float = 1.0, warmup: int = 1, trials: int = 5) -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'engine': engine,
+        'scale': scale,
+        'warmup': warmup,
+        'trials': trials,
+        'results': { name: run_benchmark(name, engine, scale, warmup, trials) for name in names },
+    }
+
+# Returns (name, old us/op, new us/op, ratio) for benchmarks in both runs
+def compare(old: dict, new: dict) -> list[tuple]:
+    res = []
+    for name, result in new['results'].items():
+        if name in old['results']:
+            before, after = old['results'][name]['us_per_op'], result['us_per_op']
+            res.append((name, before, after, after / before))
+    return res
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the emulator.")
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS), help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument('--engine', default='interp', choices=list(CPU.ENGINES), help="execution engine for the program benchmarks")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies the size of every workload")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs before the trials")
+    parser.add_argument('--trials', type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--memory', type=int, default=0, metavar='N', help="also report bytes per instance of N randomized CPU and CompactCPU instances")
+    parser.add_argument('--threshold', type=float, default=0.10, help="slowdown reported as a regression when comparing")
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS: parser.error(f"unknown benchmark '{name}'")
+
+    suite = run_suite(args.benchmarks, args.engine, args.scale, args.warmup, args.trials)
+
+    print(f"{'benchmark': <12} {'ops': >10} {'ops/s': >14} {'us/op': >10}")
+    for name, result in suite['results'].items():
+        line = f"{name: <12} {result['ops']: >10} {result['ops_per_s']: >14,.0f} {result['us_per_op']: >10.3f}  ({result['unit']})"
+        if 'fallback_rate' in result:
+            line += f"  {result['fallback_rate']:.1%} of lanes on the scalar CPU, {result['wide_rate']:.1%} wide"
+        print(line)
+
+    if args.memory:
+        suite['memory'] = memory_usage(args.memory)
+        print(f"\n{'instance': <12} {'bytes': >10}")
+        for name in ('cpu', 'compact'):
+            print(f"{name: <12} {suite['memory'][name]: >10,.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(suite, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        regressions = 0
+        print(f"\n{'benchmark': <12} {'old us/op': >10} {'new us/op': >10} {'change': >8}")
+        for name, before, after, ratio in compare(old, suite):
+            flag = ""
+            if ratio > 1 + args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{name: <12} {before: >10.3f} {after: >10.3f} {ratio - 1: >+8.1%}{flag}")
+
+        if regressions: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
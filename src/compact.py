@@ -0,0 +1,185 @@
+import copy
+import random
+from array import array
+from functools import lru_cache
+
+from cpu import CPU, MEMSIZE, RunResult
+from memory import PagedMemory
+
+# Compact CPUs, for holding very many CPU states at once (e.g. randomized
+# instances kept for batch comparison).
+#
+# A CompactCPU only holds its id, pc, registers, memory and a reference to
+# a shared Program, in __slots__ rather than a __dict__. Registers are held
+# in an array('Q') (8 bytes each, instead of a pointer and an int object).
+# Programs can leave 64-bit arithmetic (e.g. a SUBI below zero); those
+# registers are held as a tuple of ints instead, so no state is lost.
+#
+# The Program holds everything derived from the code: the validated and
+# decoded instructions, and the fused program and compiled blocks once
+# they are built. Running a CompactCPU runs an ordinary CPU over its state,
+# so results are exactly those of CPU.
+
+class Program:
+    def __init__(self, code: list[str] | bytes) -> None:
+        # CPU holding the decoded program, and its fused program and
+        # compiled blocks once an instance has run. Never run itself.
+        self.template = CPU('program', code, randomize=False)
+
+    # Returns the shared Program for code, creating it the first time
+    def get(code: list[str] | bytes) -> 'Program':
+        if isinstance(code, (bytes, bytearray, memoryview, array)):
+            return Program.get_cached(bytes(code))
+        return Program.get_cached(tuple(code))
+
+    @lru_cache(maxsize=1024)
+    def get_cached(code: tuple | bytes) -> 'Program':
+        return Program(code if isinstance(code, bytes) else list(code))
+
+    @property
+    def code(self) -> list[str]:
+        return self.template.code
+
+    @property
+    def decoded(self) -> tuple:
+        return self.template.decoded
+
+    # Returns a CPU running this program over registers and memory
+    def cpu(self, id: any, pc: int, registers: list[int], memory) -> CPU:
+        cpu = copy.copy(self.template)
+        cpu.id = id
+        cpu.pc = pc
+        cpu.registers = registers
+        cpu.memory = memory
+        cpu.mem_size = len(memory)
+        return cpu
+
+    # Keeps the fused program and compiled blocks built by a run of cpu
+    def keep_caches(self, cpu: CPU) -> None:
+        if self.template.fused is None: self.template.fused = cpu.fused
+        if self.template.blocks is None: self.template.blocks = cpu.blocks
+
+# Returns registers as an array('Q'), or a tuple if any value is outside
+# 64-bit unsigned range
+def pack_registers(registers: list[int]):
+    try:
+        return array('Q', registers)
+    except OverflowError:
+        return tuple(registers)
+
+def copy_memory(memory):
+    if isinstance(memory, PagedMemory): return memory.copy()
+    return bytearray(memory)
+
+class CompactCPU:
+    __slots__ = ('id', 'program', 'pc', 'registers', 'memory')
+
+    def __init__(self,
+                 id: any,
+                 program: Program,
+                 registers: list[int] = None,
+                 memory: bytes = None,
+                 mem_size: int = MEMSIZE,
+                 pc: int = 0
+                ) -> None:
+        self.id = id
+        self.program = program
+        self.pc = pc
+        self.registers = array('Q', bytes(8 * 32)) if registers is None else pack_registers(registers)
+        self.memory = bytearray(mem_size) if memory is None else bytearray(memory)
+
+    def from_cpu(cpu: CPU, program: Program = None) -> 'CompactCPU':
+        res = CompactCPU.__new__(CompactCPU)
+        res.id = cpu.id
+        res.program = Program.get(cpu.code) if program is None else program
+        res.pc = cpu.pc
+        res.registers = pack_registers(cpu.registers)
+        res.memory = copy_memory(cpu.memory)
+        return res
+
+    # Returns an independent CPU with the same program and state
+    def to_cpu(self) -> CPU:
+        return self.program.cpu(self.id, self.pc, list(self.registers), copy_memory(self.memory))
+
+    # Returns n CompactCPUs running code, with the same initial states as
+    # CPU.random_batch(id, code, n, ...) for the same seed
+    def random_batch(id: any,
+                     code: list[str] | bytes,
+                     n: int,
+                     reg_config: str = "",
+                     mem_config: str = "",
+                     mem_size: int = MEMSIZE,
+                     seed: int | random.Random = None
+                    ) -> list['CompactCPU']:
+        rng = CPU.make_rng(seed)
+        program = Program.get(code)
+
+        registers = rng.randbytes(8 * 31 * n)
+        memory = rng.randbytes(mem_size * n)
+
+        # Configs are applied through one CPU, reused for every instance
+        work = program.cpu(id, 0, [0] * 32, bytearray(mem_size))
+
+        cpus = []
+        for i in range(n):
+            cpu = CompactCPU.__new__(CompactCPU)
+            cpu.id = (id, i)
+            cpu.program = program
+            cpu.pc = 0
+            cpu.registers = array('Q', registers[8 * 31 * i:8 * 31 * (i + 1)])
+            cpu.registers.append(0)
+            cpu.memory = bytearray(memory[mem_size * i:mem_size * (i + 1)])
+
+            if reg_config != "":
+                work.registers[:] = cpu.registers
+                work.config_reg(reg_config)
+                cpu.registers = pack_registers(work.registers)
+            if mem_config != "":
+                work.memory = cpu.memory
+                work.config_mem(mem_config)
+
+            cpus.append(cpu)
+
+        return cpus
+
+    # Same as CPU.run. The CPU state is updated in place.
+    def run(self, **kwargs) -> RunResult:
+        cpu = self.program.cpu(self.id, self.pc, list(self.registers), self.memory)
+        try:
+            return cpu.run(**kwargs)
+        finally:
+            self.pc = cpu.pc
+            self.registers = pack_registers(cpu.registers)
+            self.program.keep_caches(cpu)
+
+    def run_for(self, n: int, engine: str = 'interp') -> RunResult:
+        cpu = self.program.cpu(self.id, self.pc, list(self.registers), self.memory)
+        try:
+            return cpu.run_for(n, engine)
+        finally:
+            self.pc = cpu.pc
+            self.registers = pack_registers(cpu.registers)
+            self.program.keep_caches(cpu)
+
+    # Equal to a CPU or CompactCPU with the same registers and data memory
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CompactCPU):
+            if type(self.registers) == type(other.registers):
+                return self.registers == other.registers and self.memory == other.memory
+            return list(self.registers) == list(other.registers) and self.memory == other.memory
+        if isinstance(other, CPU):
+            return list(self.registers) == other.registers and self.memory == other.memory
+        return NotImplemented
+
+    def __ne__(self, other) -> bool:
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    __hash__ = None
+
+    # Same digest as CPU.state_digest() of the same state
+    def state_digest(self) -> str:
+        return self.program.cpu(self.id, self.pc, list(self.registers), self.memory).state_digest()
+
+    def __str__(self) -> str:
+        return str(self.program.cpu(self.id, self.pc, list(self.registers), self.memory))
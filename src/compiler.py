@@ -0,0 +1,87 @@
+from functools import lru_cache
+
+from instr import Instr
+
+# Compiles decoded programs (see decoder.py) into one Python function per
+# basic block. Each block function has the signature:
+#
+#   block(cpu, R) -> next_pc
+#
+# where R is cpu.registers. Register numbers and immediates are baked into
+# the generated source as constants. Before any instruction that can raise
+# (LDUR, STUR) the block stores that instruction's PC in
+# cpu.pc, so errors leave the CPU in the same state as the interpreter.
+#
+# Blocks only depend on the program, so compiled programs are memoized and
+# shared by every CPU running the same code.
+
+class BlockCompiler:
+    BRANCHES = [ Instr.OP_B, Instr.OP_CBZ, Instr.OP_CBNZ ]
+
+    # Returns the sorted indices of the first instruction of every block
+    def find_leaders(decoded: list[tuple]) -> list[int]:
+        leaders = {0} if decoded else set()
+        for i, (op, _, _, imm) in enumerate(decoded):
+            if op in BlockCompiler.BRANCHES:
+                if 0 <= i + imm < len(decoded): leaders.add(i + imm)
+                if i + 1 < len(decoded): leaders.add(i + 1)
+        return sorted(leaders)
+
+    def gen_instr(i: int, instr: tuple) -> list[str]:
+        op, a, b, c = instr
+        pc = i * 4
+
+        if op == Instr.OP_ADD: return [f"R[{a}] = R[{b}] + R[{c}]"]
+        if op == Instr.OP_SUB: return [f"R[{a}] = R[{b}] - R[{c}]"]
+        if op == Instr.OP_ADDI: return [f"R[{a}] = R[{b}] + {c}"]
+        if op == Instr.OP_SUBI: return [f"R[{a}] = R[{b}] - {c}"]
+
+        if op in (Instr.OP_LDUR, Instr.OP_STUR):
+            lines = [
+                f"cpu.pc = {pc}",
+                f"m = R[{b}] + {c}",
+                "if m % 8 != 0: type(cpu).validate_access_index(m)",
+            ]
+            if op == Instr.OP_LDUR: lines.append(f"R[{a}] = cpu.get_double_word(m)")
+            else: lines.append(f"cpu.set_double_word(m, R[{a}])")
+            return lines
+
+        if op == Instr.OP_B: return [f"return {pc + 4 * c}"]
+        if op == Instr.OP_CBZ:
+            return [f"return {pc + 4 * c} if R[{a}] == 0 else {pc + 4}"]
+        return [f"return {pc + 4 * c} if R[{a}] != 0 else {pc + 4}"]
+
+    def gen_block(decoded: list[tuple], start: int, end: int) -> str:
+        lines = [f"def block_{start * 4}(cpu, R):"]
+        for i in range(start, end):
+            body = BlockCompiler.gen_instr(i, decoded[i])
+            lines.extend(f"    {line}" for line in body)
+
+        # Fall through to the next block
+        if decoded[end - 1][0] not in BlockCompiler.BRANCHES:
+            lines.append(f"    return {end * 4}")
+
+        return "\n".join(lines)
+
+    # Returns a dict mapping the PC of each block to its compiled function.
+    # Results are memoized by program, and must not be modified.
+    @lru_cache(maxsize=1024)
+    def compile_program(decoded: tuple) -> dict:
+        leaders = BlockCompiler.find_leaders(decoded)
+        bounds = list(zip(leaders, leaders[1:] + [len(decoded)]))
+
+        source = "\n\n".join(
+            BlockCompiler.gen_block(decoded, start, end)
+            for start, end in bounds
+        )
+
+        namespace = {}
+        exec(compile(source, "<compiled blocks>", "exec"), namespace)
+
+        blocks = {}
+        for start, end in bounds:
+            block = namespace[f"block_{start * 4}"]
+            # Number of instructions in the block
+            block.length = end - start
+            blocks[start * 4] = block
+        return blocks
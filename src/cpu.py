@@ -1,126 +1,151 @@
+import copy
+import hashlib
+import mmap
+import os
 import re
 import random
+import time
+from array import array
+from functools import lru_cache
 
 # import instr as Instr
 from instr import Instr
 from validator import ValidateARM
-
-# number of bytes in data memory
+from decoder import Decoder
+from compiler import BlockCompiler
+from fusion import Fusion
+from loops import LoopAnalyzer
+from memory import PagedMemory, update_flat_digest
+from assembler import Assembler
+from render import Renderer
+
+# default number of bytes in data memory
 MEMSIZE = 256 
 
+# reg_config / mem_config rules: 'XA=VAL' and '[MEM]=VAL'
+REG_CONFIG_PATTERN = re.compile(r'X\d+=-?\d+')
+MEM_CONFIG_PATTERN = re.compile(r'\[\d+\]=-?\d+')
+
+# instructions executed between deadline checks in bounded runs
+CHUNK = 4096
+
+class RunResult:
+    HALTED = 'halted'
+    MAX_INSTRS = 'max_instrs'
+    DEADLINE = 'deadline'
+    LOOP = 'loop'
+    BREAKPOINT = 'breakpoint'
+    WATCHPOINT = 'watchpoint'
+    YIELDED = 'yielded'
+
+    def __init__(self, status: str, instrs: int) -> None:
+        # Why the run stopped (one of the statuses above)
+        self.status = status
+        # Instructions executed, or None if the run was not counted
+        self.instrs = instrs
+
+    def halted(self) -> bool:
+        return self.status == RunResult.HALTED
+
+    def __repr__(self) -> str:
+        return f"RunResult({self.status!r}, {self.instrs})"
+
+# Immutable CPU state, returned by CPU.snapshot(). Memory is held as bytes,
+# or as a copy-on-write PagedMemory copy that nothing writes to.
+class Snapshot:
+    def __init__(self, pc: int, registers: tuple, memory) -> None:
+        object.__setattr__(self, 'pc', pc)
+        object.__setattr__(self, 'registers', registers)
+        object.__setattr__(self, 'memory', memory)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("Snapshot is immutable.")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Snapshot): return NotImplemented
+        return (self.pc, self.registers) == (other.pc, other.registers) and self.memory == other.memory
+
+    # Memory is left out, as hashing it would read every page, so equal
+    # snapshots still have equal hashes
+    def __hash__(self) -> int:
+        return hash((self.pc, self.registers))
+
 class CPU:
     def __init__(self, 
                  id: any, 
-                 code: list[str], 
+                 code: list[str] | bytes, 
                  reg_config: str = "", 
                  mem_config: str = "", 
-                 randomize: bool = True
+                 randomize: bool = True,
+                 mem_size: int = MEMSIZE,
+                 paged: bool = False,
+                 seed: int | random.Random = None
                 ) -> None:
-        # Validate Arm Code
-        ValidateARM.validate_code(code)
+        # Validate and decode Arm Code, or decode a binary image
+        # (see assembler.py) into its assembly text
+        if isinstance(code, (bytes, bytearray, memoryview, array)):
+            decoded, code = Assembler.decode_image(code)
+        else:
+            decoded = ValidateARM.decode_code(code)
+
+        if mem_size <= 0 or mem_size % 16 != 0:
+            error_msg = f'''
+            Invalid memory size. Recieved mem_size = {mem_size}.
+            mem_size must be a positive multiple of 16.
+            '''
+            raise ValueError(error_msg)
 
         self.id = id
         self.pc = 0
 
         self.code = code
+        self.decoded = decoded
+        self.fused = None
+        self.blocks = None
+        # Renderer holding the rendered rows of the last str(self)
+        self.render_cache = None
 
         self.registers = [0] * 32
-        self.data_mem = [0] * MEMSIZE
+        self.mem_size = mem_size
+        self.memory = PagedMemory(mem_size) if paged else bytearray(mem_size)
         self.print_mode_hex = True
 
-        if randomize: self.randomize_cpu()
+        if randomize: self.randomize_cpu(seed)
         if reg_config != "": self.config_reg(reg_config)
         if mem_config != "": self.config_mem(mem_config)
 
-    def str_hex(self) -> str:
-        def twos_complement_hex(number, num_bits):
-            # Calculate the two's complement
-            if number < 0: 
-                number = (1 << num_bits) + number
-            
-            # Convert to hexadecimal
-            hex_str = hex(number & ((1 << num_bits) - 1))
-            
-            # Pad with zeros if needed
-            hex_str = hex_str[2:].zfill(num_bits // 4)
-            hex_str = hex_str.upper()
-            
-            return ' '.join([hex_str[i:i+2] for i in range(0, len(hex_str), 2)])
-        
-        def pad_hex(num, length):
-            return twos_complement_hex(num, length * 4)
-
-        def pad_left(data, length, char=' '): 
-            data_str = str(data)
-            if len(data_str) >= length: return data_str[:length]
-            else: return char * (length - len(data_str)) + data_str
-
+    # Data memory as a memoryview over the underlying bytearray
+    # (or the PagedMemory itself for paged CPUs)
+    @property
+    def data_mem(self) -> memoryview:
+        if isinstance(self.memory, PagedMemory): return self.memory
+        return memoryview(self.memory)
 
-        res = f"\nCPU ID: {self.id} {'-' * (65 - len(str(self.id)))}\n\n"
-        
-        res += f"PC = {self.pc}\n\n"
-
-        res += f"Registers:\n"
-        for i in range(0, 16):
-            res += f"\t{pad_left(f'X{i}', 4)}: {pad_hex(self.registers[i], 16)}\t||   {pad_left(f'X{i + 16}', 3)}: {pad_hex(self.registers[i + 16], 16)}\n"
-        
-        res += "\nData Memory:\n"
-        for i in range(0, MEMSIZE // 2, 8):
-            c_w = MEMSIZE // 2
-            c1, c2 = c_w * 0, c_w * 1
+    @data_mem.setter
+    def data_mem(self, values) -> None:
+        self.memory = bytearray(values)
+        self.mem_size = len(self.memory)
 
-            d_hex = lambda x: pad_hex(self.data_mem[x], 2)
+    def renderer(self) -> Renderer:
+        if self.render_cache is None: self.render_cache = Renderer()
+        return self.render_cache
 
-            res += f"\t{pad_left(c1 + i, 4)}: {d_hex(c1 + i + 0)} {d_hex(c1 + i + 1)} {d_hex(c1 + i + 2)} {d_hex(c1 + i + 3)} {d_hex(c1 + i + 4)} {d_hex(c1 + i + 5)} {d_hex(c1 + i + 6)} {d_hex(c1 + i + 7)}"
-            res += f"   ||  {pad_left(c2 + i, 4)}: {d_hex(c2 + i + 0)} {d_hex(c2 + i + 1)} {d_hex(c2 + i + 2)} {d_hex(c2 + i + 3)} {d_hex(c2 + i + 4)} {d_hex(c2 + i + 5)} {d_hex(c2 + i + 6)} {d_hex(c2 + i + 7)}"
-            res += "\n"
-
-        res += f"\n{'-' * 74}\n\n"
+    def str_hex(self) -> str:
+        return self.renderer().render(self, True)
 
-        return res
-        
     def str_dec(self) -> str:
-        def pad_left(data, length, char=' '): 
-            data_str = str(data)
-            if len(data_str) >= length: return data_str[:length]
-            else: return char * (length - len(data_str)) + data_str
+        return self.renderer().render(self, False)
 
-        def dec_to_twos_comp(n):
-            if n > 0x7FFFFFFFFFFFFFFF:
-                return -1 * ((n ^ (0xFFFFFFFFFFFFFFFF)) +1)
-            return n
+    # Returns the printed memory rows start to stop - 1 in the current
+    # print mode, so large memories can be shown a page of rows at a time.
+    # Rows are laid out as in Renderer.memory_chunks.
+    def str_memory(self, start: int = 0, stop: int = None) -> str:
+        return self.renderer().render_memory(self, self.print_mode_hex, start, stop)
 
-        res = f"\nCPU ID: {self.id} {'-' * (65 - len(str(self.id)))}\n\n"
-        
-        res += f"PC = {self.pc}\n\n"
-
-        res += f"Registers:\n"
-        for i in range(0, 16):
-            num1 = dec_to_twos_comp(self.registers[i])
-            num2 = dec_to_twos_comp(self.registers[i + 16])
-            res += f"\t{pad_left(f'X{i}', 4)}: {pad_left(num1, 23)}\t||   {pad_left(f'X{i + 16}', 3)}: {pad_left(num2, 23)}\n"
-        
-        res += "\nData Memory:\n"
-        for i in range(0, MEMSIZE // 2, 8):
-            c_w = MEMSIZE // 2
-            c1, c2 = c_w * 0, c_w * 1
-            
-            num1, num2 = 0, 0
-            for j in range(8):
-                num1, num2 = num1 << 8, num2 << 8
-                num1 += self.data_mem[c1 + i + j]
-                num2 += self.data_mem[c2 + i + j]
-
-            num1 = dec_to_twos_comp(num1)
-            num2 = dec_to_twos_comp(num2)
-            
-            res += f"\t{pad_left(c1 + i, 4)}: {pad_left(num1, 23)}\t||   "
-            res += f"{pad_left(c2 + i, 4)}: {pad_left(num2, 23)}\n"
-
-        res += f"\n{'-' * 74}\n\n"
+    # Yields str(self) in pieces, without building the whole string
+    def iter_str(self):
+        return self.renderer().iter_render(self, self.print_mode_hex)
 
-        return res
-    
     def set_print_mode(self, hex_mode: bool = True) -> None:
         self.print_mode_hex = hex_mode
     
@@ -134,37 +159,74 @@ class CPU:
         print(str(self))
 
     def reg_eq(cpu1, cpu2) -> bool:
-        for R1, R2 in zip(cpu1.registers, cpu2.registers):
-            if R1 != R2: return False
-        return True
+        return cpu1.registers == cpu2.registers
     
     def mem_eq(cpu1, cpu2) -> bool:
-        for M1, M2 in zip(cpu1.data_mem, cpu2.data_mem):
-            if M1 != M2: return False
-        return True
+        return cpu1.memory == cpu2.memory
 
     def __eq__(cpu1, cpu2) -> bool:
+        # Lets other CPU representations (e.g. CompactCPU) compare themselves
+        if not isinstance(cpu2, CPU): return NotImplemented
         return CPU.reg_eq(cpu1, cpu2) and CPU.mem_eq(cpu1, cpu2)
 
     def __ne__(cpu1, cpu2) -> bool:
-        return CPU.__eq__(cpu1, cpu2) == False
+        res = CPU.__eq__(cpu1, cpu2)
+        return res if res is NotImplemented else res == False
+
+    # Returns a hex digest of the registers and memory (the state compared
+    # by __eq__). Equal CPUs have equal digests whether their memory is
+    # flat or paged (except randomized paged memories larger than
+    # DIGEST_FILL_LIMIT, see PagedMemory.update_digest), and CPUs with equal
+    # digests are equal, so the digest can be used as a dict key to group
+    # many final states.
+    def state_digest(self) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr(self.registers).encode())
+        if isinstance(self.memory, PagedMemory): self.memory.update_digest(h)
+        else: update_flat_digest(h, self.memory)
+        return h.hexdigest()
+
+    # Returns the current state (pc, registers and memory) as a Snapshot
+    def snapshot(self) -> Snapshot:
+        if isinstance(self.memory, PagedMemory): memory = self.memory.copy()
+        else: memory = bytes(self.memory)
+        return Snapshot(self.pc, tuple(self.registers), memory)
+
+    # Sets the state to a Snapshot of a CPU running the same program
+    def restore(self, snapshot: Snapshot) -> None:
+        self.pc = snapshot.pc
+        # In place, since compiled blocks may hold the register list
+        self.registers[:] = snapshot.registers
+        if isinstance(snapshot.memory, PagedMemory): self.memory = snapshot.memory.copy()
+        else: self.memory = bytearray(snapshot.memory)
+        self.mem_size = len(snapshot.memory)
+
+    # Returns an independent CPU with the same program and state. Paged
+    # memory is shared copy-on-write, so a fork only copies the pages it
+    # (or this CPU) writes afterwards.
+    def fork(self, id: any = None) -> 'CPU':
+        res = copy.copy(self)
+        if id is not None: res.id = id
+        res.render_cache = None
+        res.registers = list(self.registers)
+        if isinstance(self.memory, PagedMemory): res.memory = self.memory.copy()
+        else: res.memory = bytearray(self.memory)
+        return res
 
     def write_state(self, file_name: str) -> None:
-        cpu_str = str(self)
-
-        f = open(file_name)
-        f.write(cpu_str)
-        f.close()
-
-    def config_reg(self, reg_config: str) -> None:
-        reg_config_list = list(filter(lambda x: x != "", reg_config.splitlines()))
-        
-        # Regex for: 'X', some number, '=', some number
-        inp_pattern = r'X\d+=-?\d+'
-        for config in reg_config_list:
+        with open(file_name, 'w') as f:
+            f.writelines(self.iter_str())
+
+    # Parses a reg_config string into (register index, value) pairs.
+    # Results are memoized, so repeated test vectors are parsed once.
+    @lru_cache(maxsize=1024)
+    def parse_reg_config(reg_config: str) -> tuple:
+        res = []
+        for config in reg_config.splitlines():
+            if config == "": continue
             formatted_config = config.replace(" ", "").upper()
 
-            if bool(re.match(inp_pattern, formatted_config)) == False:
+            if REG_CONFIG_PATTERN.match(formatted_config) is None:
                 error_msg = f'''
                 Invalid reg_config rule.
                 Recieved: {config}.
@@ -172,22 +234,20 @@ class CPU:
                 Example: 'X1=4'.
                 '''
                 raise ValueError(error_msg)
-            
-            reg, val = formatted_config.split('=')
-            value = int(val)
-            
-            self.set_reg_value(reg, value)
-
-    def config_mem(self, mem_config: str) -> None:
-        mem_config_list = list(filter(lambda x: x != "", mem_config.splitlines()))
 
-        # Regex for: '[', some number, ']', '=', some number
-        inp_pattern = r'\[\d+\]=-?\d+'
-        
-        for config in mem_config_list:
+            reg, val = formatted_config.split('=')
+            res.append((CPU.get_reg_index(reg), int(val)))
+        return tuple(res)
+
+    # Parses a mem_config string into (memory index, double word) pairs
+    @lru_cache(maxsize=1024)
+    def parse_mem_config(mem_config: str) -> tuple:
+        res = []
+        for config in mem_config.splitlines():
+            if config == "": continue
             formatted_config = config.replace(" ", "").upper()
 
-            if bool(re.match(inp_pattern, formatted_config)) == False:
+            if MEM_CONFIG_PATTERN.match(formatted_config) is None:
                 error_msg = f'''
                 Invalid mem_config rule.
                 Recieved rule: '{config}'.
@@ -195,18 +255,64 @@ class CPU:
                 Example: '[8]=32'.
                 '''
                 raise ValueError(error_msg)
-            
+
             mem, val = formatted_config.split('=')
-            
-            mem = mem.replace('[', '')
-            mem = mem.replace(']', '')
+            res.append((int(mem[1:-1]), int(val)))
+        return tuple(res)
+
+    # reg_config is a string ('X1=4' per line), a dict of register name
+    # or index -> value, or a list of values starting at X0
+    def config_reg(self, reg_config: str | dict | list) -> None:
+        if isinstance(reg_config, str):
+            values = CPU.parse_reg_config(reg_config)
+        elif isinstance(reg_config, dict):
+            values = [
+                (CPU.get_reg_index(reg) if isinstance(reg, str) else reg, value)
+                for reg, value in reg_config.items()
+            ]
+        else:
+            values = enumerate(reg_config)
+
+        for reg_index, value in values:
+            self.set_register_val(reg_index, value)
+
+    # mem_config is a string ('[8]=32' per line), a dict of memory index ->
+    # double word, a memory image (bytes-like, loaded at address 0) or the
+    # path of a memory image file (os.PathLike, e.g. pathlib.Path)
+    def config_mem(self, mem_config: str | dict | bytes | os.PathLike) -> None:
+        if isinstance(mem_config, (bytes, bytearray, memoryview)):
+            self.load_memory(mem_config)
+            return
 
-            mem_index = int(mem)
-            value = int(val)
+        if isinstance(mem_config, os.PathLike):
+            self.load_memory_file(mem_config)
+            return
 
+        if isinstance(mem_config, str): values = CPU.parse_mem_config(mem_config)
+        else: values = mem_config.items()
+
+        for mem_index, value in values:
             self.set_double_word(mem_index, value)
-            
-    def get_cur_instr(self) -> str:
+
+    # Copies a memory image into data memory, starting at mem_index
+    def load_memory(self, image: bytes, mem_index: int = 0) -> None:
+        if mem_index < 0 or mem_index + len(image) > self.mem_size:
+            error_msg = f'''
+            Invalid memory image. Recieved {len(image)} bytes at index {mem_index}.
+            Data memory has {self.mem_size} bytes.
+            '''
+            raise ValueError(error_msg)
+
+        self.memory[mem_index:mem_index + len(image)] = image
+
+    # Loads a memory image file through mmap, starting at mem_index
+    def load_memory_file(self, file_name: str | os.PathLike, mem_index: int = 0) -> None:
+        with open(file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0: return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+                self.load_memory(image, mem_index)
+
+    def validate_pc(self) -> None:
         i = (self.pc // 4)
         if i >= len(self.code):
             error_msg = f'''
@@ -215,49 +321,14 @@ class CPU:
             (Expected i < {len(self.code)}. Recieved i = {i}.)'
             '''
             raise IndexError(error_msg)
-        return self.code[self.pc // 4].upper()
-
-    def get_reg_index(reg: str) -> int:
-        reg = reg.upper()
-
-        error_msg = f'''
-            Invalid register. Recieved '{reg}'.
-        '''
-
-        if reg == 'XZR': 
-            return 31
-
-        if len(reg) < 2: 
-            raise ValueError(error_msg)
-        
-        if reg[0] != 'X':
-            raise ValueError(error_msg)
-        
-        try:
-            reg_num = int(reg[1:])
-        except ValueError:
-            raise ValueError(error_msg)
-    
-        if reg_num < 0 or reg_num > 31: 
-            raise ValueError(error_msg)
 
-        return reg_num
-    
-    def get_immediate_value(imm: str) -> int:
-        error_msg = f'''
-            Invalid immediate value. Recieved '{imm}'.
-        '''
+    def get_cur_instr(self) -> str:
+        self.validate_pc()
+        return self.code[self.pc // 4].upper()
 
-        if len(imm) <= 1 or imm[0] != '#':
-            raise ValueError(error_msg)
-        
-        try:
-            imm_num = int(imm[1:])
-        except ValueError:
-            raise ValueError(error_msg)
+    get_reg_index = Decoder.get_reg_index
+    get_immediate_value = Decoder.get_immediate_value
 
-        return imm_num
-    
     def validate_double_word_index(self, mem_index: int) -> None:
         if (mem_index % 8) != 0:
             error_msg = f'''
@@ -267,12 +338,12 @@ class CPU:
             '''
             raise ValueError(error_msg)
 
-        if mem_index + 7 >= len(self.data_mem):
+        if mem_index + 7 >= self.mem_size:
             error_msg = f'''
             Invalid double word index.
             Index out of bounds. 
             Recieved: {mem_index}.
-            Maximum Accepted: {len(self.data_mem) - 8}
+            Maximum Accepted: {self.mem_size - 8}
             '''
             raise ValueError(error_msg)
     
@@ -286,19 +357,26 @@ class CPU:
     
     def get_double_word(self, mem_index: int) -> int:
         self.validate_double_word_index(mem_index)
-        
-        res = 0
-        for i in range(8):
-            res <<= 8
-            res += self.data_mem[mem_index + i]
-        return res
+
+        # Negative indices wrap around from the end of memory
+        if mem_index < 0: mem_index += self.mem_size
+        if mem_index < 0:
+            error_msg = f'''
+            Invalid Memory Index. Recieved {mem_index - self.mem_size}.
+            '''
+            raise IndexError(error_msg)
+
+        return int.from_bytes(self.memory[mem_index:mem_index + 8], 'big')
     
     def set_double_word(self, mem_index: int, value: int) -> None:
         self.validate_double_word_index(mem_index)
-        for i in range(7, -1, -1):
-            temp = value & 0xFF
-            value >>= 8
-            self.set_mem_val(mem_index + i, temp)
+        if mem_index < 0:
+            error_msg = f'''
+            Invalid Memory Index. Recieved {mem_index + 7}.
+            '''
+            raise IndexError(error_msg)
+
+        self.memory[mem_index:mem_index + 8] = (value & 0xFFFFFFFFFFFFFFFF).to_bytes(8, 'big')
 
     def set_register_val(self, reg_index: int, value: int) -> None:
         if reg_index < 0 or reg_index >= len(self.registers):
@@ -310,13 +388,13 @@ class CPU:
         self.registers[reg_index] = value
 
     def set_mem_val(self, mem_index: int, value: int) -> None:
-        if mem_index < 0 or mem_index >= MEMSIZE:
+        if mem_index < 0 or mem_index >= self.mem_size:
             error_msg = f'''
             Invalid Memory Index. Recieved {mem_index}.
             '''
             raise IndexError(error_msg)
         
-        self.data_mem[mem_index] = value
+        self.memory[mem_index] = value & 0xFF
 
     def randomize_register(self, reg_index: int) -> None:
         rand_val = random.randrange(2 ** 64)
@@ -326,241 +404,480 @@ class CPU:
         rand_val = random.randrange(2 ** 8)
         self.set_mem_val(byte_index, rand_val)
 
-    def randomize_registers(self) -> None:
-        for i in range(len(self.registers) - 1):
-            self.randomize_register(i)
+    # Returns the random number generator to use for a seed: the global
+    # random module (None), seed itself (a random.Random or the random
+    # module), or a new random.Random seeded with it
+    def make_rng(seed: int | random.Random = None):
+        if seed is None: return random
+        if seed is random or isinstance(seed, random.Random): return seed
+        return random.Random(seed)
+
+    # n random 64-bit register values, from a single randbytes call
+    def random_registers(rng, n: int = 31) -> list[int]:
+        return memoryview(rng.randbytes(8 * n)).cast('Q').tolist()
+
+    def randomize_registers(self, seed: int | random.Random = None) -> None:
+        n = len(self.registers) - 1
+        self.registers[:n] = CPU.random_registers(CPU.make_rng(seed), n)
+
+    def randomize_data_memory(self, seed: int | random.Random = None) -> None:
+        rng = CPU.make_rng(seed)
+
+        # Paged memory randomizes each page lazily, when it is first touched
+        if isinstance(self.memory, PagedMemory):
+            self.memory.randomize(rng.getrandbits(64))
+            return
+
+        self.memory[:] = rng.randbytes(self.mem_size)
+
+    def randomize_cpu(self, seed: int | random.Random = None) -> None:
+        rng = CPU.make_rng(seed)
+        self.randomize_registers(rng)
+        self.randomize_data_memory(rng)
+
+    # Returns n CPUs running code, each with its own random initial state,
+    # drawn with one randbytes call for all registers and one for all
+    # memory. Configured values are set in every CPU.
+    def random_batch(id: any,
+                     code: list[str] | bytes,
+                     n: int,
+                     reg_config: str = "",
+                     mem_config: str = "",
+                     mem_size: int = MEMSIZE,
+                     paged: bool = False,
+                     seed: int | random.Random = None
+                    ) -> list['CPU']:
+        rng = CPU.make_rng(seed)
+        template = CPU(id, code, randomize=False, mem_size=mem_size, paged=paged)
+
+        registers = CPU.random_registers(rng, 31 * n)
+        memory = None if paged else rng.randbytes(mem_size * n)
+
+        cpus = []
+        for i in range(n):
+            cpu = CPU.__new__(type(template))
+            cpu.__dict__.update(template.__dict__)
+            cpu.id = (id, i)
+            cpu.registers = registers[31 * i:31 * (i + 1)] + [0]
+            if paged:
+                cpu.memory = PagedMemory(mem_size)
+                cpu.memory.randomize(rng.getrandbits(64))
+            else:
+                cpu.memory = bytearray(memory[mem_size * i:mem_size * (i + 1)])
 
-    def randomize_data_memory(self) -> None:
-        for i in range(len(self.data_mem)):
-            self.randomize_mem_byte(i)
+            if reg_config != "": cpu.config_reg(reg_config)
+            if mem_config != "": cpu.config_mem(mem_config)
+            cpus.append(cpu)
 
-    def randomize_cpu(self) -> None:
-        self.randomize_registers()
-        self.randomize_data_memory()
+        return cpus
     
-    def run_instr(self) -> None:
-        # Get current Instruction
-        instr_values = Instr.extract(self.get_cur_instr())
-        
-        # Seperate Instruction and Instruction Args
-        instr, args = instr_values.instr, instr_values.args
-
-        def run_r_type() -> None:
-            try:
-                XA, XB, XC = args
-            except:
-                error_msg = f'''
-                Invalid args.
-                Recieved {args}.
-                Expected type: ['XA', 'XB', 'XC'].
-                '''
-                raise ValueError(error_msg)
+    def exec_add(self, XA: int, XB: int, XC: int) -> None:
+        self.registers[XA] = self.registers[XB] + self.registers[XC]
+        self.pc += 4
 
-            XA = CPU.get_reg_index(XA)
-            XB = CPU.get_reg_index(XB)
-            XC = CPU.get_reg_index(XC)
+    def exec_sub(self, XA: int, XB: int, XC: int) -> None:
+        self.registers[XA] = self.registers[XB] - self.registers[XC]
+        self.pc += 4
 
-            if instr == Instr.ADD:
-                # Compute value to be put in XA
-                new_val = self.registers[XB] + self.registers[XC]
-            elif instr == Instr.SUB:
-                # Compute value to be put in XA
-                new_val = self.registers[XB] - self.registers[XC]
-            else:
-                error_msg = f'''
-                Unknown R-type instruction. Recieved '{instr}'
-                '''
-                raise ValueError(error_msg)
-            
-            # Place new value in XA
-            self.set_register_val(XA, new_val)
-            
-            # Increment PC to next instruction
-            self.pc += 4
-
-        def run_d_type() -> None:
-            try:
-                XA, XB, IMM = args
-            except:
-                error_msg = f'''
-                Invalid args.
-                Recieved {args}.
-                Expected type: ['XA', 'XB', 'IMM'].
-                '''
-                raise ValueError(error_msg)
+    def validate_access_index(mem_index: int) -> None:
+        # Memory Access must be double word aligned
+        if (mem_index % 8 != 0):
+            error_msg = f'''
+            Memory Access invalid during D-type instruction.
+            Recieved access index = {mem_index}.
+            Access Index must be double-word aligned.
+            '''
+            raise ValueError(error_msg)
 
-            XA = CPU.get_reg_index(XA)
-            XB = CPU.get_reg_index(XB)
-            IMM = CPU.get_immediate_value(IMM)
+    def exec_ldur(self, XA: int, XB: int, IMM: int) -> None:
+        mem_index = self.registers[XB] + IMM
+        CPU.validate_access_index(mem_index)
+
+        self.registers[XA] = self.get_double_word(mem_index)
+        self.pc += 4
+
+    def exec_stur(self, XA: int, XB: int, IMM: int) -> None:
+        mem_index = self.registers[XB] + IMM
+        CPU.validate_access_index(mem_index)
+
+        self.set_double_word(mem_index, self.registers[XA])
+        self.pc += 4
+
+    def exec_addi(self, XA: int, XB: int, IMM: int) -> None:
+        self.registers[XA] = self.registers[XB] + IMM
+        self.pc += 4
+
+    def exec_subi(self, XA: int, XB: int, IMM: int) -> None:
+        self.registers[XA] = self.registers[XB] - IMM
+        self.pc += 4
+
+    def exec_b(self, _: int, __: int, IMM: int) -> None:
+        self.pc += 4 * IMM
+
+    def exec_cbz(self, XA: int, _: int, IMM: int) -> None:
+        if self.registers[XA] == 0: self.pc += 4 * IMM
+        else: self.pc += 4
+
+    def exec_cbnz(self, XA: int, _: int, IMM: int) -> None:
+        if self.registers[XA] != 0: self.pc += 4 * IMM
+        else: self.pc += 4
+
+    # Superinstructions (see fusion.py). SUBI is fused as ADDI of the
+    # negated immediate, and branch offsets are relative to the first PC.
+    def exec_addi_addi(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, XD, IMM2 = args
+        R = self.registers
+        R[XA] = R[XB] + IMM
+        R[XC] = R[XD] + IMM2
+        self.pc += 8
+
+    def exec_addi_cbz(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, OFFSET = args
+        R = self.registers
+        R[XA] = R[XB] + IMM
+        if R[XC] == 0: self.pc += OFFSET
+        else: self.pc += 8
+
+    def exec_addi_cbnz(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, OFFSET = args
+        R = self.registers
+        R[XA] = R[XB] + IMM
+        if R[XC] != 0: self.pc += OFFSET
+        else: self.pc += 8
+
+    def exec_addi_addi_cbz(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, XD, IMM2, XE, OFFSET = args
+        R = self.registers
+        R[XA] = R[XB] + IMM
+        R[XC] = R[XD] + IMM2
+        if R[XE] == 0: self.pc += OFFSET
+        else: self.pc += 12
+
+    def exec_addi_addi_cbnz(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, XD, IMM2, XE, OFFSET = args
+        R = self.registers
+        R[XA] = R[XB] + IMM
+        R[XC] = R[XD] + IMM2
+        if R[XE] != 0: self.pc += OFFSET
+        else: self.pc += 12
+
+    def exec_ldur_add(self, XA: int, XB: int, args: tuple) -> None:
+        IMM, XC, XD, XE = args
+        R = self.registers
+        mem_index = R[XB] + IMM
+        CPU.validate_access_index(mem_index)
+
+        R[XA] = self.get_double_word(mem_index)
+        R[XC] = R[XD] + R[XE]
+        self.pc += 8
+
+    # Runs a counted loop (see loops.py) in closed form if its trip count
+    # is known, else executes the instruction it replaced
+    def exec_affine_loop(self, _: int, __: int, args: tuple) -> None:
+        loop, instr = args
+        n = self.trip_count(loop)
+        if n == 0:
+            op, a, b, c = instr
+            CPU.EXECUTE[op](self, a, b, c)
+            return
+
+        self.advance_loop(loop, n)
+
+    # Returns the number of iterations a counted loop entered now runs, or
+    # 0 if its counter never reaches 0
+    def trip_count(self, loop: tuple) -> int:
+        counter, step, _, _ = loop
+        count = self.registers[counter]
+        if count <= 0 or count % step != 0: return 0
+        return count // step
+
+    # Runs n iterations of a counted loop in closed form, leaving the PC at
+    # the start of the loop unless the counter reached 0
+    def advance_loop(self, loop: tuple, n: int) -> None:
+        counter, step, updates, length = loop
+        R = self.registers
+
+        for XA, IMM, regs, is_set in updates:
+            value = IMM
+            for sign, XI in regs: value += sign * R[XI]
+            if is_set: R[XA] = value
+            else: R[XA] += n * value
+
+        R[counter] -= n * step
+        if R[counter] == 0: self.pc += 4 * length
+
+    # Handlers indexed by opcode id (see Instr.OPCODES)
+    EXECUTE = [
+        exec_add, exec_sub, exec_ldur, exec_stur, exec_addi, exec_subi,
+        exec_b, exec_cbz, exec_cbnz,
+        exec_addi_addi, exec_addi_cbz, exec_addi_cbnz,
+        exec_addi_addi_cbz, exec_addi_addi_cbnz, exec_ldur_add,
+        exec_affine_loop
+    ]
+
+    # Instructions executed by each handler of EXECUTE, or 0 if it varies
+    LENGTHS = [
+        1, 1, 1, 1, 1, 1,
+        1, 1, 1,
+        2, 2, 2,
+        3, 3, 2,
+        0
+    ]
 
-            #Enforcing IMM bounds
-            if not (-256 <= IMM <= 255):
-                error_msg = f'''
-                Immediete Value invalid. 
-                Recieved IMM = {IMM}.
-                Expected -256 <= IMM <= 255.
-                '''
-                raise ValueError(error_msg)
-            
-            mem_index = self.registers[XB] + IMM
-
-            # Memory Access must be double word aligned
-            if (mem_index % 8 != 0):
-                error_msg = f'''
-                Memory Access invalid during D-type instruction.
-                Recieved access index = {mem_index}.
-                Access Index must be double-word aligned.
-                '''
-                raise ValueError(error_msg)
-
-            if instr == Instr.LDUR:
-                mem_value = self.get_double_word(mem_index)
-                self.set_register_val(XA, mem_value)
-            elif instr == Instr.STUR:
-                reg_val = self.registers[XA]
-                self.set_double_word(mem_index, reg_val)
+    def run_instr(self) -> None:
+        self.validate_pc()
+
+        op, a, b, c = self.decoded[self.pc // 4]
+        CPU.EXECUTE[op](self, a, b, c)
+
+    # Returns the program the interpreter runs: the fused program, with
+    # counted loops run in closed form (see loops.py) if fast_forward
+    def interp_program(self, fast_forward: bool) -> tuple:
+        if not fast_forward: return Fusion.fuse_program(self.decoded)
+
+        if self.fused is None:
+            self.fused = LoopAnalyzer.fast_forward_program(self.decoded)
+        return self.fused
+
+    def run_interp(self, fast_forward: bool = True) -> None:
+        decoded = self.interp_program(fast_forward)
+        execute = CPU.EXECUTE
+        end = len(decoded) * 4
+
+        while self.pc < end:
+            op, a, b, c = decoded[self.pc // 4]
+            execute[op](self, a, b, c)
+
+    # Blocks are always executed instruction by instruction, so fast_forward
+    # does not apply
+    def run_blocks(self, _: bool = True) -> None:
+        if self.blocks is None:
+            self.blocks = BlockCompiler.compile_program(self.decoded)
+
+        blocks = self.blocks
+        registers = self.registers
+        end = len(self.decoded) * 4
+
+        while self.pc < end:
+            block = blocks.get(self.pc)
+            if block is None:
+                # PC is not the start of a block (e.g. negative PC)
+                self.run_instr()
             else:
-                error_msg = f'''
-                Unknown D-type instruction. Recieved '{instr}'
-                '''
-                raise ValueError(error_msg)
-            
-            # Increment PC to next instruction
-            self.pc += 4
-
-        def run_i_type() -> None:
-            try:
-                XA, XB, IMM = args
-            except:
-                error_msg = f'''
-                Invalid args.
-                Recieved {args}.
-                Expected type: ['XA', 'XB', 'IMM'].
-                '''
-                raise ValueError(error_msg)
+                self.pc = block(self, registers)
+
+    # Returns a RunResult if max_instrs or deadline was reached, else None
+    def check_limits(count: int, max_instrs: int, deadline: float) -> RunResult:
+        if max_instrs is not None and count >= max_instrs:
+            return RunResult(RunResult.MAX_INSTRS, count)
+        if deadline is not None and time.monotonic() >= deadline:
+            return RunResult(RunResult.DEADLINE, count)
+        return None
+
+    # Runs the fused program like run_interp, adding the length of every
+    # superinstruction to the count. Instructions that would overrun
+    # max_instrs are executed one at a time (see step_within).
+    def run_interp_bounded(self, max_instrs: int, deadline: float, fast_forward: bool = True) -> RunResult:
+        fused = self.interp_program(fast_forward)
+        execute = CPU.EXECUTE
+        lengths = CPU.LENGTHS
+        end = len(fused) * 4
+        limit = float('inf') if max_instrs is None else max_instrs
+        count = 0
+
+        while self.pc < end:
+            stopped = CPU.check_limits(count, max_instrs, deadline)
+            if stopped: return stopped
+
+            stop = min(count + CHUNK, limit)
+            while self.pc < end and count < stop:
+                op, a, b, c = fused[self.pc // 4]
+                length = lengths[op]
+                if 0 < length and count + length <= limit:
+                    execute[op](self, a, b, c)
+                    count += length
+                else:
+                    count += self.step_within(op, a, b, c, limit - count)
+
+        return RunResult(RunResult.HALTED, count)
+
+    # Executes the fused instruction at the PC, or a prefix of it, running
+    # at most left (> 0) instructions. Returns the number executed.
+    def step_within(self, op: int, a: int, b: int, c: any, left: int) -> int:
+        if op == Instr.OP_AFFINE_LOOP:
+            loop, instr = c
+            length = loop[3]
+            n = min(self.trip_count(loop), left // length)
+            if n > 0:
+                self.advance_loop(loop, n)
+                return n * length
+
+            op, a, b, c = instr
+            if CPU.LENGTHS[op] <= left:
+                CPU.EXECUTE[op](self, a, b, c)
+                return CPU.LENGTHS[op]
+
+        op, a, b, c = self.decoded[self.pc // 4]
+        CPU.EXECUTE[op](self, a, b, c)
+        return 1
+
+    def run_blocks_bounded(self, max_instrs: int, deadline: float, _: bool = True) -> RunResult:
+        if self.blocks is None:
+            self.blocks = BlockCompiler.compile_program(self.decoded)
+
+        blocks = self.blocks
+        registers = self.registers
+        end = len(self.decoded) * 4
+        limit = float('inf') if max_instrs is None else max_instrs
+        count = 0
+
+        while self.pc < end:
+            stopped = CPU.check_limits(count, max_instrs, deadline)
+            if stopped: return stopped
+
+            stop = min(count + CHUNK, limit)
+            while self.pc < end and count < stop:
+                block = blocks.get(self.pc)
+                if block is None or count + block.length > limit:
+                    # Not a block start, or the block would overrun max_instrs
+                    self.run_instr()
+                    count += 1
+                else:
+                    self.pc = block(self, registers)
+                    count += block.length
+
+        return RunResult(RunResult.HALTED, count)
+
+    # Interpreter that also stops when the CPU state at a back-edge repeats.
+    # States are compared with Brent's cycle detection, so only one saved
+    # state is kept, and a loop is found within a small multiple of its
+    # length. Memory is fingerprinted through the addresses stored to
+    # during this run, since all other memory is unchanged.
+    def run_detect_loops(self, max_instrs: int, deadline: float) -> RunResult:
+        decoded = self.decoded
+        execute = CPU.EXECUTE
+        end = len(decoded) * 4
+        branches = (Instr.OP_B, Instr.OP_CBZ, Instr.OP_CBNZ)
+        count = 0
+
+        written = {}
+        saved, power, lam = None, 1, 1
+
+        while self.pc < end:
+            if count % CHUNK == 0 or count == max_instrs:
+                stopped = CPU.check_limits(count, max_instrs, deadline)
+                if stopped: return stopped
+
+            pc = self.pc
+            op, a, b, c = decoded[pc // 4]
+            execute[op](self, a, b, c)
+            count += 1
+
+            if op == Instr.OP_STUR:
+                written[self.registers[b] + c] = None
+            elif op in branches and self.pc <= pc:
+                state = (
+                    self.pc,
+                    tuple(self.registers),
+                    tuple(bytes(self.memory[m:m + 8]) for m in written)
+                )
+                if saved is not None and state == saved:
+                    return RunResult(RunResult.LOOP, count)
+                if lam == power:
+                    saved, power, lam = state, power * 2, 0
+                lam += 1
+
+        return RunResult(RunResult.HALTED, count)
+
+    # Execution engines selectable through run(engine=...)
+    ENGINES = {
+        'interp': run_interp,
+        'block': run_blocks,
+    }
+
+    # Versions of ENGINES that stop at an instruction limit or deadline
+    BOUNDED_ENGINES = {
+        'interp': run_interp_bounded,
+        'block': run_blocks_bounded,
+    }
+
+    # Runs until the program halts. Optionally stops early once max_instrs
+    # instructions have executed, once time.monotonic() passes deadline, or
+    # (with detect_loops, always interpreted) once an exact state repeats.
+    # Passing a Profiler (see profiler.py), a Tracer (see tracer.py), a
+    # Recorder (see timetravel.py) or a Debugger (see debugger.py) runs that
+    # instrumented interpreter instead. With fast_forward=False, the
+    # interpreter executes counted loops iteration by iteration instead of
+    # in closed form (e.g. to measure dispatch speed).
+    def run(self,
+            engine: str = 'interp',
+            max_instrs: int = None,
+            deadline: float = None,
+            detect_loops: bool = False,
+            profile: any = None,
+            trace: any = None,
+            record: any = None,
+            debug: any = None,
+            fast_forward: bool = True
+           ) -> RunResult:
+        if engine not in CPU.ENGINES:
+            error_msg = f'''
+            Unknown execution engine. Recieved '{engine}'.
+            Expected one of: {list(CPU.ENGINES)}.
+            '''
+            raise ValueError(error_msg)
 
-            XA = CPU.get_reg_index(XA)
-            XB = CPU.get_reg_index(XB)
-            IMM = CPU.get_immediate_value(IMM)
+        instrumented = [detect_loops, profile is not None, trace is not None, record is not None, debug is not None]
+        if instrumented.count(True) > 1:
+            raise ValueError("Only one of detect_loops, profile, trace, record and debug can be used at a time.")
 
-            # Enforcing IMM bounds
-            if not (0 <= IMM <= 4095):
-                error_msg = f'''
-                Immediete Value invalid. 
-                Recieved IMM = {IMM}.
-                Expected 0 <= IMM <= 4095.
-                '''
-                raise ValueError(error_msg)
+        if profile is not None:
+            return profile.run(self, max_instrs, deadline)
 
-            if instr == Instr.ADDI:
-                # Compute value to be put in XA
-                new_val = self.registers[XB] + IMM
-            elif instr == Instr.SUBI:
-                # Compute value to be put in XA
-                new_val = self.registers[XB] - IMM
-            else:
-                error_msg = f'''
-                Unknown I-type instruction. Recieved '{instr}'
-                '''
-                raise ValueError(error_msg)
-            
-            # Place new value in XA
-            self.set_register_val(XA, new_val)
-            
-            # Increment PC to next instruction
-            self.pc += 4
-
-        def run_b_type() -> None:
-            try:
-                IMM = args[0]
-            except:
-                error_msg = f'''
-                Invalid args.
-                Recieved {args}.
-                Expected type: ['IMM'].
-                '''
-                raise ValueError(error_msg)
-            
-            IMM = CPU.get_immediate_value(IMM)
-
-            # Enforcing IMM bounds
-            if not (-33554432 <= IMM <= 33554431):
-                error_msg = f'''
-                Immediete Value invalid. 
-                Recieved IMM = {IMM}.
-                Expected -33 554 432 <= IMM <= 33 554 431.
-                '''
-                raise ValueError(error_msg)
+        if trace is not None:
+            return trace.run(self, max_instrs, deadline)
 
-            # Set new PC value
-            self.pc += 4 * IMM
+        if record is not None:
+            return record.run(self, max_instrs, deadline)
 
-        def run_cb_type() -> None:
-            try:
-                XA, IMM = args
-            except:
-                error_msg = f'''
-                Invalid args.
-                Recieved {args}.
-                Expected type: ['XA', 'IMM'].
-                '''
-                raise ValueError(error_msg)
-            
-            XA = CPU.get_reg_index(XA)
-            IMM = CPU.get_immediate_value(IMM)
+        if debug is not None:
+            return debug.run(self, max_instrs, deadline)
 
-            # Enforcing IMM bounds
-            if not (-262144 <= IMM <= 262143):
-                error_msg = f'''
-                Immediete Value invalid. 
-                Recieved IMM = {IMM}.
-                Expected -262 144 <= IMM <= 262 143.
-                ''' 
-                raise ValueError(error_msg)
-            
-            step = 1
-            if instr == Instr.CBZ:
-                if self.registers[XA] == 0: step = IMM
-            elif instr == Instr.CBNZ:
-                if self.registers[XA] != 0: step = IMM
-            else:
-                error_msg = f'''
-                Unknown CB-type instruction. Recieved '{instr}'
-                '''
-                raise ValueError(error_msg)
+        if detect_loops:
+            return self.run_detect_loops(max_instrs, deadline)
 
-            # Set new PC value
-            self.pc += 4 * step
+        if max_instrs is not None or deadline is not None:
+            return CPU.BOUNDED_ENGINES[engine](self, max_instrs, deadline, fast_forward)
 
-        if instr in Instr.R_TYPE: run_r_type()
-        elif instr in Instr.D_TYPE: run_d_type()
-        elif instr in Instr.I_TYPE: run_i_type()
-        elif instr in Instr.B_TYPE: run_b_type()
-        elif instr in Instr.CB_TYPE: run_cb_type()
-        else:
+        CPU.ENGINES[engine](self, fast_forward)
+        return RunResult(RunResult.HALTED, None)
+    
+    # Executes at most n more instructions, returning a HALTED RunResult
+    # if the program finished, or a YIELDED one if it can be resumed by
+    # calling run_for again.
+    def run_for(self, n: int, engine: str = 'interp') -> RunResult:
+        if n < 0:
             error_msg = f'''
-            Invalid Instruction.
-            Recieved '{self.get_cur_instr()}' where:
-                - 'instr' is '{instr}'
-                - 'args' is {args}
+            Invalid instruction count. Recieved {n}.
+            Expected a non-negative integer.
             '''
             raise ValueError(error_msg)
 
-    def run(self) -> None:
-        while self.pc < len(self.code) * 4:
-            self.run_instr()
-    
+        result = self.run(engine=engine, max_instrs=n)
+        if result.status == RunResult.MAX_INSTRS: result.status = RunResult.YIELDED
+        return result
+
     def step(self) -> None:
         print(f"Executing {'=' * 64}\n")
         print("Initial State: ")
         print(self)
+        listing = [f"\t{f'{i * 4: >3}'}: " + f"{instr: <25}" for i, instr in enumerate(self.code)]
         while self.pc < len(self.code) * 4:
             input()
+            lines = list(listing)
+            if self.pc >= 0: lines[self.pc // 4] += "\t<<< Just Executed"
             print("Instructions:")
-            for i, instr in enumerate(self.code):
-                line = f"\t{f'{i * 4: >3}'}: " + f"{instr: <25}"
-                if i == (self.pc // 4): line += "\t<<< Just Executed"
-                print(line)
+            print("\n".join(lines))
             self.run_instr()
             print(self)
         print(f"Finished {'=' * 65}")
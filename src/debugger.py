@@ -0,0 +1,119 @@
+from cpu import CPU, CHUNK, RunResult
+from instr import Instr
+
+# Breakpoints and watchpoints, used through CPU.run(debug=Debugger()).
+#
+# Only the instructions that need checking are instrumented: each run
+# patches a copy of the decoded program, replacing the instructions at
+# breakpoint PCs (and every STUR, if there are watchpoints) with a trap
+# opcode. All other instructions execute exactly as in CPU.run_interp.
+#
+# A breakpoint stops the run before the instruction at its PC executes, if
+# its condition (a predicate on the register list) holds or it has none. A
+# watchpoint stops the run after a STUR writes its double word. Running
+# again continues from where the run stopped.
+
+# Opcode of the trap handler, after the handlers in CPU.EXECUTE
+OP_TRAP = len(CPU.EXECUTE)
+
+class Stop(Exception):
+    def __init__(self, status: str, executed: int, address: int = None) -> None:
+        self.status = status
+        # Instructions executed by the trap before stopping (0 or 1)
+        self.executed = executed
+        self.address = address
+
+class Debugger:
+    def __init__(self) -> None:
+        # PC -> condition (None stops unconditionally)
+        self.breakpoints = {}
+        # Watched double word addresses
+        self.watchpoints = set()
+
+        # (status, pc, address) of the last stop, address is None for breakpoints
+        self.hit = None
+
+    def validate_aligned(value: int, alignment: int, name: str) -> None:
+        if value < 0 or value % alignment != 0:
+            error_msg = f'''
+            Invalid {name}. Recieved {value}.
+            {name} must be a non-negative multiple of {alignment}.
+            '''
+            raise ValueError(error_msg)
+
+    def add_breakpoint(self, pc: int, condition=None) -> None:
+        Debugger.validate_aligned(pc, 4, 'breakpoint PC')
+        self.breakpoints[pc] = condition
+
+    def remove_breakpoint(self, pc: int) -> None:
+        self.breakpoints.pop(pc, None)
+
+    def add_watchpoint(self, address: int) -> None:
+        Debugger.validate_aligned(address, 8, 'watchpoint address')
+        self.watchpoints.add(address)
+
+    def remove_watchpoint(self, address: int) -> None:
+        self.watchpoints.discard(address)
+
+    # Returns the decoded program with trap instructions patched in
+    def patch(self, decoded: tuple) -> list:
+        patched = list(decoded)
+        for i, (op, _, _, _) in enumerate(decoded):
+            if i * 4 in self.breakpoints:
+                patched[i] = (OP_TRAP, i, True, 0)
+            elif op == Instr.OP_STUR and self.watchpoints:
+                patched[i] = (OP_TRAP, i, False, 0)
+        return patched
+
+    def run(self, cpu: CPU, max_instrs: int = None, deadline: float = None) -> RunResult:
+        decoded = cpu.decoded
+        registers = cpu.registers
+        breakpoints, watchpoints = self.breakpoints, self.watchpoints
+
+        def trap(cpu: CPU, i: int, check_break: bool, _: int) -> None:
+            op, a, b, c = decoded[i]
+
+            if check_break:
+                condition = breakpoints[i * 4]
+                if condition is None or condition(registers):
+                    raise Stop(RunResult.BREAKPOINT, 0)
+
+            if op == Instr.OP_STUR:
+                address = registers[b] + c
+                CPU.EXECUTE[op](cpu, a, b, c)
+                if address in watchpoints:
+                    raise Stop(RunResult.WATCHPOINT, 1, address)
+            else:
+                CPU.EXECUTE[op](cpu, a, b, c)
+
+        program = self.patch(decoded)
+        execute = CPU.EXECUTE + [trap]
+        end = len(program) * 4
+        count, i = 0, 0
+
+        # Resuming from a breakpoint: execute its instruction without stopping
+        resume = self.hit is not None and self.hit[0] == RunResult.BREAKPOINT and self.hit[1] == cpu.pc
+        if max_instrs != 0: self.hit = None
+
+        try:
+            if resume and cpu.pc < end and max_instrs != 0:
+                trap(cpu, cpu.pc // 4, False, 0)
+                count += 1
+
+            while cpu.pc < end:
+                stopped = CPU.check_limits(count, max_instrs, deadline)
+                if stopped: return stopped
+
+                n = CHUNK if max_instrs is None else min(CHUNK, max_instrs - count)
+                for i in range(n):
+                    if cpu.pc >= end:
+                        return RunResult(RunResult.HALTED, count + i)
+                    op, a, b, c = program[cpu.pc // 4]
+                    execute[op](cpu, a, b, c)
+                count += n
+        except Stop as e:
+            # A watchpoint stops after its STUR has moved the PC on
+            self.hit = (e.status, cpu.pc - 4 * e.executed, e.address)
+            return RunResult(e.status, count + i + e.executed)
+
+        return RunResult(RunResult.HALTED, count)
@@ -0,0 +1,52 @@
+# Decoded instructions are tuples of the form (opcode, a, b, c):
+#   R-type:  (OP, XA, XB, XC)
+#   D-type:  (OP, XA, XB, IMM)
+#   I-type:  (OP, XA, XB, IMM)
+#   B-type:  (OP, 0, 0, IMM)
+#   CB-type: (OP, XA, 0, IMM)
+#
+# CPU gets its decoded program from ValidateARM.decode_code, which builds
+# these tuples while validating, so every line is decoded (and any error
+# raised as a SyntaxError) when the CPU is constructed.
+
+class Decoder:
+    def get_reg_index(reg: str) -> int:
+        reg = reg.upper()
+
+        error_msg = f'''
+            Invalid register. Recieved '{reg}'.
+        '''
+
+        if reg == 'XZR':
+            return 31
+
+        if len(reg) < 2:
+            raise ValueError(error_msg)
+
+        if reg[0] != 'X':
+            raise ValueError(error_msg)
+
+        try:
+            reg_num = int(reg[1:])
+        except ValueError:
+            raise ValueError(error_msg)
+
+        if reg_num < 0 or reg_num > 31:
+            raise ValueError(error_msg)
+
+        return reg_num
+
+    def get_immediate_value(imm: str) -> int:
+        error_msg = f'''
+            Invalid immediate value. Recieved '{imm}'.
+        '''
+
+        if len(imm) <= 1 or imm[0] != '#':
+            raise ValueError(error_msg)
+
+        try:
+            imm_num = int(imm[1:])
+        except ValueError:
+            raise ValueError(error_msg)
+
+        return imm_num
@@ -0,0 +1,71 @@
+from functools import lru_cache
+
+from instr import Instr
+
+# Peephole pass fusing common instruction sequences of a decoded program
+# (see decoder.py) into superinstructions, executed in one dispatch by the
+# interpreter:
+#
+#   ADDI/SUBI, ADDI/SUBI              pointer bumps, counter updates
+#   ADDI/SUBI, CBZ/CBNZ               counted loops
+#   ADDI/SUBI, ADDI/SUBI, CBZ/CBNZ    counted loops with a pointer bump
+#   LDUR, ADD                         load and accumulate
+#
+# Every index of the fused program starts its own (possibly overlapping)
+# group, and instructions that start no group are kept as they are. So a
+# branch into the middle of a group simply executes the group starting at
+# its target. Only the first instruction of a group can raise (LDUR), so an
+# error leaves the same state as unfused execution.
+#
+# Fused instructions are (opcode, XA, XB, args), with the operands of the
+# following instructions in the args tuple. SUBI is fused as an ADDI of the
+# negated immediate. Branch offsets are in bytes, relative to the group's
+# first instruction.
+#
+# CPU.run_interp and CPU.run_interp_bounded execute the fused program. The
+# bounded interpreter counts each superinstruction as its length (see
+# CPU.LENGTHS), and executes single instructions where a whole group would
+# overrun max_instrs, so its counts stay exact. Instrumented runs dispatch
+# one instruction at a time.
+
+IMM_OPS = [ Instr.OP_ADDI, Instr.OP_SUBI ]
+
+class Fusion:
+    # Immediate of an ADDI/SUBI, as added to its source register
+    def signed_imm(instr: tuple) -> int:
+        op, _, _, imm = instr
+        return imm if op == Instr.OP_ADDI else -imm
+
+    # Returns the superinstruction starting at index i, or None
+    def fuse_at(decoded: tuple, i: int) -> tuple:
+        group = decoded[i:i + 3]
+        ops = [op for op, _, _, _ in group]
+
+        if len(group) == 3 and ops[0] in IMM_OPS and ops[1] in IMM_OPS and ops[2] in (Instr.OP_CBZ, Instr.OP_CBNZ):
+            (_, a, b, _), (_, a1, b1, _), (_, a2, _, k) = group
+            op = Instr.OP_ADDI_ADDI_CBZ if ops[2] == Instr.OP_CBZ else Instr.OP_ADDI_ADDI_CBNZ
+            args = (Fusion.signed_imm(group[0]), a1, b1, Fusion.signed_imm(group[1]), a2, 8 + 4 * k)
+            return (op, a, b, args)
+
+        if len(group) < 2: return None
+
+        if ops[0] in IMM_OPS and ops[1] in IMM_OPS:
+            (_, a, b, _), (_, a1, b1, _) = group[:2]
+            return (Instr.OP_ADDI_ADDI, a, b, (Fusion.signed_imm(group[0]), a1, b1, Fusion.signed_imm(group[1])))
+
+        if ops[0] in IMM_OPS and ops[1] in (Instr.OP_CBZ, Instr.OP_CBNZ):
+            (_, a, b, _), (_, a1, _, k) = group[:2]
+            op = Instr.OP_ADDI_CBZ if ops[1] == Instr.OP_CBZ else Instr.OP_ADDI_CBNZ
+            return (op, a, b, (Fusion.signed_imm(group[0]), a1, 4 + 4 * k))
+
+        if ops[0] == Instr.OP_LDUR and ops[1] == Instr.OP_ADD:
+            (_, a, b, imm), (_, a1, b1, c1) = group[:2]
+            return (Instr.OP_LDUR_ADD, a, b, (imm, a1, b1, c1))
+
+        return None
+
+    # Returns the fused program, with the same length as decoded. Results
+    # are memoized by program.
+    @lru_cache(maxsize=1024)
+    def fuse_program(decoded: tuple) -> tuple:
+        return tuple(Fusion.fuse_at(decoded, i) or instr for i, instr in enumerate(decoded))
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cpu import CPU, MEMSIZE, RunResult
+from results import ResultsCache
+from validator import ValidateARM
+
+# Grades many submissions against a reference program.
+#
+# Every (submission, test vector) pair is one job, spread across a
+# ProcessPoolExecutor. The reference program is run once per test vector
+# in the parent process, and the final reference states are handed to
+# each worker once, through the pool initializer.
+#
+# With a cache directory, every worker keeps a ResultsCache (see
+# results.py) over it, so a submission that is identical to one graded
+# before (up to canonicalization), run on the same initial state and
+# limits, is answered from the cache without emulating.
+#
+# A test vector is a dict with optional keys:
+#   'name':       Name shown in the results table
+#   'reg_config': Register configuration string (see CPU.config_reg)
+#   'mem_config': Memory configuration string (see CPU.config_mem)
+#   'seed':       If given, non-configured values are randomized with this seed
+#   'mem_size':   Data memory size in bytes
+
+PASS = 'PASS'
+FAIL = 'FAIL'
+ERROR = 'ERROR'
+INVALID = 'INVALID'
+LIMIT = 'LIMIT'
+TIMEOUT = 'TIMEOUT'
+LOOP = 'LOOP'
+
+STATUSES = {
+    RunResult.HALTED: PASS,
+    RunResult.MAX_INSTRS: LIMIT,
+    RunResult.DEADLINE: TIMEOUT,
+    RunResult.LOOP: LOOP,
+}
+
+class GradeResult:
+    def __init__(self, submission, vector, status, instrs, seconds, detail="", digest=""):
+        self.submission = submission
+        self.vector = vector
+        self.status = status
+        self.instrs = instrs
+        self.seconds = seconds
+        self.detail = detail
+        # CPU.state_digest() of the final state of halted runs, to group
+        # identical outcomes across submissions
+        self.digest = digest
+
+    def row(self) -> str:
+        return f"{self.submission}\t{self.vector}\t{self.status}\t{self.instrs}\t{self.seconds:.6f}\t{self.detail}\t{self.digest}"
+
+HEADER = "submission\tvector\tstatus\tinstrs\tseconds\tdetail\tdigest"
+
+def make_cpu(id: any, code: list[str], vector: dict) -> CPU:
+    seed = vector.get('seed')
+
+    # ValidateARM prints the error message of invalid code
+    with contextlib.redirect_stdout(io.StringIO()):
+        return CPU(
+            id, code,
+            reg_config=vector.get('reg_config', ""),
+            mem_config=vector.get('mem_config', ""),
+            randomize=seed is not None,
+            mem_size=vector.get('mem_size', MEMSIZE),
+            seed=seed
+        )
+
+# Returns (status, instructions executed)
+def run_bounded(cpu: CPU, max_instrs: int, deadline: float, detect_loops: bool) -> tuple:
+    result = cpu.run(max_instrs=max_instrs, deadline=deadline, detect_loops=detect_loops)
+    return STATUSES[result.status], result.instrs
+
+def vector_name(vector: dict, i: int) -> str:
+    return vector.get('name', f"vector{i}")
+
+# Worker process state, set once by init_worker
+worker_state = {}
+
+def init_worker(references: list[CPU], max_instrs: int, timeout: float, detect_loops: bool, cache_dir: str = None) -> None:
+    worker_state['references'] = references
+    worker_state['reference_digests'] = [reference.state_digest() for reference in references]
+    worker_state['max_instrs'] = max_instrs
+    worker_state['timeout'] = timeout
+    worker_state['detect_loops'] = detect_loops
+    worker_state['cache'] = None if cache_dir is None else ResultsCache(cache_dir)
+
+def grade_job(submission: str, code: list[str], vector_index: int, vector: dict) -> GradeResult:
+    name = vector_name(vector, vector_index)
+    start = time.monotonic()
+    elapsed = lambda: time.monotonic() - start
+
+    try:
+        cpu = make_cpu(submission, code, vector)
+    except (SyntaxError, ValueError, IndexError) as e:
+        return GradeResult(submission, name, INVALID, 0, elapsed(), type(e).__name__)
+
+    cache = worker_state['cache']
+    try:
+        if cache is None:
+            status, instrs = run_bounded(
+                cpu,
+                worker_state['max_instrs'],
+                start + worker_state['timeout'],
+                worker_state['detect_loops']
+            )
+        else:
+            result = cache.run(
+                cpu,
+                worker_state['max_instrs'],
+                start + worker_state['timeout'],
+                worker_state['detect_loops']
+            )
+            status, instrs = STATUSES[result.status], result.instrs
+    except Exception as e:
+        return GradeResult(submission, name, ERROR, 0, elapsed(), type(e).__name__)
+
+    digest = ""
+    if status == PASS:
+        if cache is None:
+            if cpu != worker_state['references'][vector_index]: status = FAIL
+            digest = cpu.state_digest()
+        else:
+            # Cache hits only have the digest of the final state
+            digest = result.digest
+            if digest != worker_state['reference_digests'][vector_index]: status = FAIL
+
+    return GradeResult(submission, name, status, instrs, elapsed(), digest=digest)
+
+class Grader:
+    def __init__(self,
+                 reference: list[str],
+                 vectors: list[dict],
+                 max_instrs: int = 1_000_000,
+                 timeout: float = 10.0,
+                 workers: int = None,
+                 detect_loops: bool = False,
+                 cache_dir: str = None
+                ) -> None:
+        self.reference = reference
+        self.vectors = vectors
+        self.max_instrs = max_instrs
+        self.timeout = timeout
+        self.workers = workers
+        self.detect_loops = detect_loops
+        self.cache_dir = cache_dir
+
+        self.references = [self.run_reference(i, v) for i, v in enumerate(vectors)]
+
+    def run_reference(self, i: int, vector: dict) -> CPU:
+        cpu = make_cpu('Solution', self.reference, vector)
+        status, _ = run_bounded(cpu, self.max_instrs, time.monotonic() + self.timeout, False)
+        if status != PASS:
+            error_msg = f'''
+            Reference program did not halt on {vector_name(vector, i)}.
+            Status: {status}.
+            '''
+            raise ValueError(error_msg)
+
+        # Compiled blocks can not be sent to worker processes
+        cpu.blocks = None
+        return cpu
+
+    # Yields a GradeResult per (submission, vector) as each job finishes
+    def grade(self, submissions: dict[str, list[str]]):
+        initargs = (self.references, self.max_instrs, self.timeout, self.detect_loops, self.cache_dir)
+
+        with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=initargs) as pool:
+            jobs = [
+                pool.submit(grade_job, name, code, i, vector)
+                for name, code in submissions.items()
+                for i, vector in enumerate(self.vectors)
+            ]
+            for job in as_completed(jobs):
+                yield job.result()
+
+def read_submissions(directory: str) -> dict[str, list[str]]:
+    submissions = {}
+    for file_name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, file_name)
+        if os.path.isfile(path):
+            code = ValidateARM.read_file(path)
+            submissions[file_name] = [line for line in code if line != ""]
+    return submissions
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Grade ARM submissions against a reference program.")
+    parser.add_argument('reference', help="file containing the reference program")
+    parser.add_argument('submissions', help="directory with one submission program per file")
+    parser.add_argument('vectors', help="JSON file with a list of test vectors")
+    parser.add_argument('--max-instrs', type=int, default=1_000_000, help="instruction limit per job")
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds allowed per job")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--detect-loops', action='store_true', help="stop submissions as soon as their state repeats")
+    parser.add_argument('--cache', default=None, metavar='DIR', help="reuse results of identical runs, stored in this directory")
+    args = parser.parse_args(argv)
+
+    reference = [line for line in ValidateARM.read_file(args.reference) if line != ""]
+    with open(args.vectors) as f:
+        vectors = json.load(f)
+
+    grader = Grader(
+        reference, vectors, args.max_instrs, args.timeout, args.workers, args.detect_loops, args.cache
+    )
+
+    print(HEADER)
+    for result in grader.grade(read_submissions(args.submissions)):
+        print(result.row())
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
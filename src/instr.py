@@ -29,6 +29,32 @@ class Instr:
     B_TYPE = [ B ]
     CB_TYPE = [ CBZ, CBNZ ]
 
+    # Opcode ids used by decoded instructions
+    OP_ADD = 0
+    OP_SUB = 1
+    OP_LDUR = 2
+    OP_STUR = 3
+    OP_ADDI = 4
+    OP_SUBI = 5
+    OP_B = 6
+    OP_CBZ = 7
+    OP_CBNZ = 8
+
+    # Superinstruction opcode ids (see fusion.py). ADDI also stands for SUBI.
+    OP_ADDI_ADDI = 9
+    OP_ADDI_CBZ = 10
+    OP_ADDI_CBNZ = 11
+    OP_ADDI_ADDI_CBZ = 12
+    OP_ADDI_ADDI_CBNZ = 13
+    OP_LDUR_ADD = 14
+    # Closed-form counted loop (see loops.py)
+    OP_AFFINE_LOOP = 15
+
+    OPCODES = {
+        ADD: OP_ADD, SUB: OP_SUB, LDUR: OP_LDUR, STUR: OP_STUR,
+        ADDI: OP_ADDI, SUBI: OP_SUBI, B: OP_B, CBZ: OP_CBZ, CBNZ: OP_CBNZ
+    }
+
     def extract(instr_str):
         instr_str = instr_str.upper()
 
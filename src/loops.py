@@ -0,0 +1,106 @@
+from functools import lru_cache
+
+from instr import Instr
+from fusion import Fusion
+
+# Finds innermost counted loops that can be fast-forwarded in closed form.
+#
+# A loop is the range from a backward CBNZ's target to the CBNZ, and
+# qualifies if its body (everything before the CBNZ) only contains ADD,
+# SUB, ADDI and SUBI, and:
+#   - The CBNZ register (the counter) is written exactly once, by
+#     SUBI Xc, Xc, #d with d > 0
+#   - Every other register written is either only updated in place by
+#     invariant amounts (ADDI/SUBI Xa, Xa, #imm, ADD Xa, Xa, Xi,
+#     ADD Xa, Xi, Xa or SUB Xa, Xa, Xi), or written once from invariants
+#     (e.g. ADDI Xa, Xi, #imm), where invariant registers are not written
+#     in the body
+#   - No other instruction reads a register written in the body
+#
+# Entering such a loop with a counter value v > 0 divisible by d runs it
+# exactly n = v // d times, adding n times its step to every updated
+# register. Otherwise the counter never reaches 0 and the loop is executed
+# normally.
+#
+# Loops are (counter, d, updates, length), where updates are
+# (XA, IMM, ((sign, XI), ...), is_set) and length is the number of
+# instructions in the loop, including the CBNZ.
+
+ALU_OPS = [ Instr.OP_ADD, Instr.OP_SUB, Instr.OP_ADDI, Instr.OP_SUBI ]
+
+class LoopAnalyzer:
+    # Returns (IMM, ((sign, XI), ...)) if instr adds an invariant amount to
+    # its destination register, else None
+    def self_update(instr: tuple, written: set) -> tuple:
+        op, a, b, c = instr
+        if op in (Instr.OP_ADDI, Instr.OP_SUBI) and b == a:
+            return (c if op == Instr.OP_ADDI else -c, ())
+        if op == Instr.OP_ADD and b == a and c not in written: return (0, ((1, c),))
+        if op == Instr.OP_ADD and c == a and b not in written: return (0, ((1, b),))
+        if op == Instr.OP_SUB and b == a and c not in written: return (0, ((-1, c),))
+        return None
+
+    # Returns (IMM, ((sign, XI), ...)) if instr sets its destination register
+    # from invariants only, else None
+    def invariant_set(instr: tuple, written: set) -> tuple:
+        op, a, b, c = instr
+        if op in (Instr.OP_ADDI, Instr.OP_SUBI) and b not in written:
+            return (c if op == Instr.OP_ADDI else -c, ((1, b),))
+        if op in (Instr.OP_ADD, Instr.OP_SUB) and b not in written and c not in written:
+            return (0, ((1, b), (1 if op == Instr.OP_ADD else -1, c)))
+        return None
+
+    # Returns the loop ending with the CBNZ at index j, or None
+    def analyze_loop(decoded: tuple, j: int) -> tuple:
+        op, counter, _, imm = decoded[j]
+        start = j + imm
+        if op != Instr.OP_CBNZ or imm >= 0 or start < 0: return None
+
+        body = decoded[start:j]
+        if any(op not in ALU_OPS for op, _, _, _ in body): return None
+
+        written = { a for _, a, _, _ in body }
+        writes = {}
+        for instr in body:
+            writes.setdefault(instr[1], []).append(instr)
+
+        # The counter: a single SUBI Xc, Xc, #d
+        counter_writes = writes.pop(counter, [])
+        if len(counter_writes) != 1: return None
+        op, _, b, step = counter_writes[0]
+        if op != Instr.OP_SUBI or b != counter or step <= 0: return None
+
+        updates = []
+        for reg, instrs in writes.items():
+            steps = [LoopAnalyzer.self_update(instr, written) for instr in instrs]
+            if None not in steps:
+                imm = sum(s[0] for s in steps)
+                regs = tuple(r for s in steps for r in s[1])
+                updates.append((reg, imm, regs, False))
+                continue
+
+            value = LoopAnalyzer.invariant_set(instrs[0], written) if len(instrs) == 1 else None
+            if value is None: return None
+            updates.append((reg, value[0], value[1], True))
+
+        return (counter, step, tuple(updates), j - start + 1)
+
+    # Returns the loops of a program by the index of their first instruction
+    def find_loops(decoded: tuple) -> dict[int, tuple]:
+        loops = {}
+        for j, (op, _, _, imm) in enumerate(decoded):
+            if op != Instr.OP_CBNZ: continue
+            loop = LoopAnalyzer.analyze_loop(decoded, j)
+            if loop is not None: loops[j + imm] = loop
+        return loops
+
+    # Returns the fused program (see fusion.py) with an OP_AFFINE_LOOP
+    # instruction at the start of every loop. It holds the loop and the
+    # instruction it replaces, which runs whenever the loop can not be
+    # fast-forwarded. Results are memoized by program.
+    @lru_cache(maxsize=1024)
+    def fast_forward_program(decoded: tuple) -> tuple:
+        program = list(Fusion.fuse_program(decoded))
+        for start, loop in LoopAnalyzer.find_loops(decoded).items():
+            program[start] = (Instr.OP_AFFINE_LOOP, 0, 0, (loop, program[start]))
+        return tuple(program)
@@ -0,0 +1,221 @@
+import random
+from functools import lru_cache
+
+# number of bytes in a page
+PAGE_SIZE = 4096
+
+# Largest randomized PagedMemory whose untouched pages are digested by
+# their contents (see PagedMemory.update_digest)
+DIGEST_FILL_LIMIT = 2 ** 24
+
+# Sparse data memory made of fixed-size pages, allocated on first touch.
+#
+# Untouched pages are either all zeros, or (after randomize()) filled with
+# bytes derived from the memory's seed and the page index, so a page gets
+# the same random contents whenever it first appears. Reading an untouched
+# page does not allocate it.
+#
+# copy() shares all pages with the copy. A shared page is only copied when
+# either memory first writes to it, so copies cost only the pages they write.
+#
+# Supports the parts of the bytearray interface used by CPU: integer and
+# slice indexing and assignment, and equality.
+#
+# Digests (see update_digest and update_flat_digest) hash the size and the
+# index and contents of every page that is not all zeros, so equal paged
+# and flat memories get equal digests whatever their seeds or touched pages.
+# The exception is a randomized PagedMemory larger than DIGEST_FILL_LIMIT,
+# whose digest stands on its seed: it only matches memories of the same
+# size and seed. Digests never depend on which pages have been read.
+
+# Feeds page index of a memory into a hashlib object, unless it is all zeros
+def update_page_digest(h, index: int, page) -> None:
+    if page == ZERO_PAGE[:len(page)]: return
+    h.update(index.to_bytes(8, 'big'))
+    h.update(page)
+
+# Feeds a bytes-like memory into a hashlib object, as
+# PagedMemory.update_digest would the same contents
+def update_flat_digest(h, memory) -> None:
+    h.update(f"{len(memory)}".encode())
+    view = memoryview(memory)
+    for index, start in enumerate(range(0, len(memory), PAGE_SIZE)):
+        update_page_digest(h, index, view[start:start + PAGE_SIZE])
+
+# Random contents of page index of a memory filled from seed. Reads of
+# untouched pages do not keep them, so recent ones are cached here.
+@lru_cache(maxsize=64)
+def random_page(seed: int, index: int) -> bytes:
+    return random.Random(f"{seed}:{index}").randbytes(PAGE_SIZE)
+
+class PagedMemory:
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.pages = {}
+        # Indices of the pages this memory may write in place (not shared)
+        self.owned = set()
+
+        # None: untouched pages are zero-filled
+        self.seed = None
+
+    def randomize(self, seed: int = None) -> None:
+        self.pages = {}
+        self.owned = set()
+        self.seed = random.getrandbits(64) if seed is None else seed
+
+    def num_pages(self) -> int:
+        return (self.size + PAGE_SIZE - 1) // PAGE_SIZE
+
+    # Returns the sorted indices of the allocated pages
+    def touched(self) -> list[int]:
+        return sorted(self.pages)
+
+    # Contents of a page that has not been touched yet
+    def fill_page(self, index: int) -> bytes:
+        if self.seed is None:
+            return bytes(PAGE_SIZE)
+        return random_page(self.seed, index)
+
+    # Returns a page for writing, allocating it or copying a shared page
+    def page(self, index: int) -> bytearray:
+        if index in self.owned: return self.pages[index]
+
+        page = self.pages.get(index)
+        if page is None: page = self.fill_page(index)
+        page = self.pages[index] = bytearray(page)
+        self.owned.add(index)
+        return page
+
+    # Returns a copy sharing this memory's pages (copy-on-write)
+    def copy(self) -> 'PagedMemory':
+        res = PagedMemory(self.size)
+        res.seed = self.seed
+        res.pages = dict(self.pages)
+        # Every page is now shared, so neither memory can write in place
+        self.owned = set()
+        return res
+
+    def read_page(self, index: int):
+        page = self.pages.get(index)
+        if page is not None: return page
+        if self.seed is None: return ZERO_PAGE
+        return self.fill_page(index)
+
+    def validate_range(self, start: int, stop: int) -> None:
+        if start < 0 or stop > self.size or start > stop:
+            error_msg = f'''
+            Invalid Memory Range. Recieved [{start}:{stop}].
+            Expected 0 <= start <= stop <= {self.size}.
+            '''
+            raise IndexError(error_msg)
+
+    def read(self, start: int, stop: int) -> bytes:
+        self.validate_range(start, stop)
+
+        chunks = []
+        while start < stop:
+            index, offset = divmod(start, PAGE_SIZE)
+            end = min(stop, (index + 1) * PAGE_SIZE)
+            chunks.append(self.read_page(index)[offset:offset + end - start])
+            start = end
+        return b''.join(chunks)
+
+    def write(self, start: int, data: bytes) -> None:
+        self.validate_range(start, start + len(data))
+
+        pos = 0
+        while pos < len(data):
+            index, offset = divmod(start + pos, PAGE_SIZE)
+            n = min(len(data) - pos, PAGE_SIZE - offset)
+            self.page(index)[offset:offset + n] = data[pos:pos + n]
+            pos += n
+
+    def index(self, key: int) -> int:
+        if key < 0: key += self.size
+        if key < 0 or key >= self.size:
+            error_msg = f'''
+            Invalid Memory Index. Recieved {key}.
+            '''
+            raise IndexError(error_msg)
+        return key
+
+    def slice_bounds(self, key: slice) -> tuple:
+        if key.step not in (None, 1):
+            raise ValueError("PagedMemory only supports contiguous slices.")
+        start = 0 if key.start is None else key.start
+        stop = self.size if key.stop is None else key.stop
+        return start, stop
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.read(*self.slice_bounds(key))
+
+        index, offset = divmod(self.index(key), PAGE_SIZE)
+        return self.read_page(index)[offset]
+
+    def __setitem__(self, key, value) -> None:
+        if isinstance(key, slice):
+            start, stop = self.slice_bounds(key)
+            if stop - start != len(value):
+                raise ValueError("PagedMemory slice assignment can not change its size.")
+            self.write(start, value)
+            return
+
+        index, offset = divmod(self.index(key), PAGE_SIZE)
+        self.page(index)[offset] = value
+
+    # Feeds the memory contents into a hashlib object. Untouched random
+    # pages are generated to be hashed, but not kept.
+    #
+    # Generating every page of a randomized memory larger than
+    # DIGEST_FILL_LIMIT would take too long, so the seed stands for its
+    # fill instead, and touched pages that still hold their fill are
+    # skipped. The choice depends only on the seed and size, never on which
+    # pages are touched, so the digest of a memory only changes with its
+    # contents.
+    def update_digest(self, h) -> None:
+        h.update(f"{self.size}".encode())
+
+        if self.seed is not None and self.size > DIGEST_FILL_LIMIT:
+            h.update(f":{self.seed}".encode())
+            for index in self.touched():
+                n = min(PAGE_SIZE, self.size - index * PAGE_SIZE)
+                page = self.pages[index]
+                if page[:n] == self.fill_page(index)[:n]: continue
+                h.update(index.to_bytes(8, 'big'))
+                h.update(page[:n])
+            return
+
+        indices = range(self.num_pages()) if self.seed is not None else self.touched()
+        for index in indices:
+            n = min(PAGE_SIZE, self.size - index * PAGE_SIZE)
+            page = self.pages.get(index)
+            if page is None: page = self.fill_page(index)
+            update_page_digest(h, index, page[:n])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (bytes, bytearray, memoryview)):
+            return self.size == len(other) and self.read(0, self.size) == other
+
+        if not isinstance(other, PagedMemory):
+            return NotImplemented
+
+        if self.size != other.size:
+            return False
+
+        touched = set(self.pages) | set(other.pages)
+        for index in touched:
+            n = min(PAGE_SIZE, self.size - index * PAGE_SIZE)
+            if self.read_page(index)[:n] != other.read_page(index)[:n]:
+                return False
+
+        # Pages untouched in both are equal only if they have the same fill
+        if len(touched) < self.num_pages() and self.seed != other.seed:
+            return False
+
+        return True
+
+ZERO_PAGE = bytes(PAGE_SIZE)
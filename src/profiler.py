@@ -0,0 +1,140 @@
+from cpu import CPU, CHUNK, RunResult
+from compiler import BlockCompiler
+from instr import Instr
+
+# Per-PC execution profiler, used through CPU.run(profile=Profiler()).
+#
+# Profiling runs a separate, instrumented interpreter loop, so CPU.run()
+# without a profiler is not slowed down at all. Counts accumulate across
+# runs until reset() is called.
+
+OP_TYPES = [
+    ('R_TYPE', Instr.R_TYPE),
+    ('D_TYPE', Instr.D_TYPE),
+    ('I_TYPE', Instr.I_TYPE),
+    ('B_TYPE', Instr.B_TYPE),
+    ('CB_TYPE', Instr.CB_TYPE),
+]
+
+# Opcode id -> name of its instruction type in Instr
+OP_TYPE_NAMES = {
+    Instr.OPCODES[instr]: name for name, instrs in OP_TYPES for instr in instrs
+}
+
+class Profiler:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        # Executions per instruction index (PC // 4)
+        self.counts = None
+        # Taken / not taken executions per branch index
+        self.taken = {}
+        self.not_taken = {}
+        # Executions per memory address
+        self.loads = {}
+        self.stores = {}
+
+    def run(self, cpu: CPU, max_instrs: int = None, deadline: float = None) -> RunResult:
+        decoded = cpu.decoded
+        execute = CPU.EXECUTE
+        registers = cpu.registers
+        end = len(decoded) * 4
+
+        if self.counts is None or len(self.counts) != len(decoded):
+            self.counts = [0] * len(decoded)
+        counts, taken, not_taken = self.counts, self.taken, self.not_taken
+        loads, stores = self.loads, self.stores
+
+        count = 0
+        while cpu.pc < end:
+            if count % CHUNK == 0 or count == max_instrs:
+                stopped = CPU.check_limits(count, max_instrs, deadline)
+                if stopped: return stopped
+
+            i = cpu.pc // 4
+            op, a, b, c = decoded[i]
+
+            if op == Instr.OP_CBZ or op == Instr.OP_CBNZ or op == Instr.OP_B:
+                is_taken = op == Instr.OP_B or (registers[a] == 0) == (op == Instr.OP_CBZ)
+                execute[op](cpu, a, b, c)
+                if is_taken: taken[i] = taken.get(i, 0) + 1
+                else: not_taken[i] = not_taken.get(i, 0) + 1
+            elif op == Instr.OP_LDUR:
+                address = registers[b] + c
+                execute[op](cpu, a, b, c)
+                loads[address] = loads.get(address, 0) + 1
+            elif op == Instr.OP_STUR:
+                address = registers[b] + c
+                execute[op](cpu, a, b, c)
+                stores[address] = stores.get(address, 0) + 1
+            else:
+                execute[op](cpu, a, b, c)
+
+            counts[i] += 1
+            count += 1
+
+        return RunResult(RunResult.HALTED, count)
+
+    def total(self) -> int:
+        return sum(self.counts) if self.counts else 0
+
+    # Executions per instruction type (see Instr.R_TYPE etc.)
+    def type_counts(self, cpu: CPU) -> dict[str, int]:
+        res = { name: 0 for name, _ in OP_TYPES }
+        for (op, _, _, _), count in zip(cpu.decoded, self.counts or []):
+            if op in OP_TYPE_NAMES: res[OP_TYPE_NAMES[op]] += count
+        return res
+
+    # Returns loops as (start index, branch index, instructions executed),
+    # hottest first. A loop is the range from a backward branch's target to
+    # the branch itself.
+    def hot_loops(self, cpu: CPU) -> list[tuple]:
+        loops = []
+        for i in self.taken:
+            op, _, _, imm = cpu.decoded[i]
+            start = i + imm
+            if op in BlockCompiler.BRANCHES and imm <= 0 and start >= 0:
+                loops.append((start, i, sum(self.counts[start:i + 1])))
+        return sorted(loops, key=lambda loop: -loop[2])
+
+    def report(self, cpu: CPU, num_loops: int = 3, num_addresses: int = 8) -> str:
+        total = self.total()
+        percent = lambda n: f"{100 * n / total:5.1f}%" if total else "  0.0%"
+
+        loops = self.hot_loops(cpu)[:num_loops]
+        loop_marks = {}
+        for rank, (start, branch, _) in enumerate(loops):
+            for i in range(start, branch + 1):
+                loop_marks.setdefault(i, f"loop {rank + 1}")
+
+        res = f"\nProfile of CPU {cpu.id}: {total} instructions {'-' * 40}\n\n"
+
+        res += "Instructions:\n"
+        for i, instr in enumerate(cpu.code):
+            count = self.counts[i] if self.counts else 0
+            line = f"\t{f'{i * 4: >3}'}: {count: >10} {percent(count)}  {instr: <25}"
+            if i in self.taken or i in self.not_taken:
+                line += f" taken {self.taken.get(i, 0)} / not taken {self.not_taken.get(i, 0)}"
+            if i in loop_marks:
+                line += f"\t<<< {loop_marks[i]}"
+            res += line + "\n"
+
+        res += "\nHot Loops:\n"
+        for rank, (start, branch, count) in enumerate(loops):
+            # Every run of the body ends at the back-edge, taken or not
+            iterations = self.taken.get(branch, 0) + self.not_taken.get(branch, 0)
+            res += f"\tloop {rank + 1}: PC {start * 4}-{branch * 4}, {iterations} iterations, {count} instructions ({percent(count).strip()})\n"
+
+        res += "\nInstruction Types:\n"
+        for name, count in self.type_counts(cpu).items():
+            res += f"\t{name: <8} {count: >10} {percent(count)}\n"
+
+        for title, accesses in (("Loads", self.loads), ("Stores", self.stores)):
+            res += f"\n{title} (top {num_addresses} addresses):\n"
+            top = sorted(accesses.items(), key=lambda item: -item[1])[:num_addresses]
+            for address, count in top:
+                res += f"\t[{address}]: {count}\n"
+
+        res += f"\n{'-' * 74}\n\n"
+        return res
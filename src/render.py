@@ -0,0 +1,136 @@
+import struct
+
+from memory import PagedMemory, PAGE_SIZE
+
+# Renders CPU states as text, for CPU.str_hex, CPU.str_dec and step().
+#
+# Memory is formatted in bulk: a chunk of rows is converted with one
+# bytes.hex(' ') call (hex) or one struct.unpack call (decimal), then cut
+# into rows. Rendered register lines and memory chunks are cached with the
+# bytes they were rendered from, so rendering the same CPU again only
+# re-renders the registers and chunks that changed since the last render.
+#
+# Flat memory is printed in two columns: row r holds the double words at
+# 8 * r and mem_size // 2 + 8 * r. Paged memory prints each touched page
+# as rows of two adjacent double words.
+
+# Rows of flat memory rendered and cached together
+CHUNK_ROWS = 64
+
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+def signed_64(n: int) -> int:
+    if n > 0x7FFFFFFFFFFFFFFF:
+        return -1 * ((n ^ MASK_64) + 1)
+    return n
+
+def hex_64(n: int) -> str:
+    return (n & MASK_64).to_bytes(8, 'big').hex(' ').upper()
+
+class Renderer:
+    def __init__(self) -> None:
+        # (hex mode, memory size, paged) the caches were rendered for
+        self.layout = None
+        # Register line i -> ((X{i}, X{i + 16}) values, rendered line)
+        self.register_lines = [None] * 16
+        # Chunk key -> (bytes, rendered rows)
+        self.chunks = {}
+
+    def check_layout(self, cpu, hex_mode: bool) -> None:
+        layout = (hex_mode, cpu.mem_size, isinstance(cpu.memory, PagedMemory))
+        if layout != self.layout:
+            self.layout = layout
+            self.register_lines = [None] * 16
+            self.chunks = {}
+
+    def register_line(self, hex_mode: bool, i: int, values: tuple) -> str:
+        n1, n2 = values
+        if hex_mode:
+            return f"\t{f'X{i}': >4}: {hex_64(n1)}\t||   {f'X{i + 16}': >3}: {hex_64(n2)}\n"
+        # Values wider than 23 characters are cut to 23, as str_dec always did
+        return f"\t{f'X{i}': >4}: {str(signed_64(n1)): >23.23}\t||   {f'X{i + 16}': >3}: {str(signed_64(n2)): >23.23}\n"
+
+    def registers(self, cpu, hex_mode: bool) -> list[str]:
+        registers = cpu.registers
+        lines = self.register_lines
+        res = []
+        for i in range(16):
+            values = (registers[i], registers[i + 16])
+            cached = lines[i]
+            if cached is None or cached[0] != values:
+                cached = lines[i] = (values, self.register_line(hex_mode, i, values))
+            res.append(cached[1])
+        return res
+
+    # Yields (key, data, rows) for the printed memory, where rows holds the
+    # (left address, right address, left offset, right offset) of each row,
+    # the offsets being into data
+    def memory_chunks(cpu):
+        memory = cpu.memory
+        if isinstance(memory, PagedMemory):
+            for page in memory.touched():
+                base = page * PAGE_SIZE
+                stop = min(base + PAGE_SIZE, cpu.mem_size)
+                rows = [(i, i + 8, i - base, i - base + 8) for i in range(base, stop, 16)]
+                yield page, memory[base:stop], rows
+            return
+
+        half = cpu.mem_size // 2
+        num_rows = half // 8
+        for first in range(0, num_rows, CHUNK_ROWS):
+            last = min(first + CHUNK_ROWS, num_rows)
+            n = last - first
+            data = memory[8 * first:8 * last] + memory[half + 8 * first:half + 8 * last]
+            rows = [(8 * r, half + 8 * r, 8 * (r - first), 8 * (r - first + n)) for r in range(first, last)]
+            yield first, bytes(data), rows
+
+    def render_chunk(self, hex_mode: bool, w: int, data: bytes, rows: list[tuple]) -> list[str]:
+        if hex_mode:
+            cells = data.hex(' ').upper()
+            return [
+                f"\t{c1: >{w}}: {cells[3 * o1:3 * o1 + 23]}   ||  {c2: >{w}}: {cells[3 * o2:3 * o2 + 23]}\n"
+                for c1, c2, o1, o2 in rows
+            ]
+
+        values = struct.unpack(f'>{len(data) // 8}q', data)
+        return [
+            f"\t{c1: >{w}}: {values[o1 // 8]: >23}\t||   {c2: >{w}}: {values[o2 // 8]: >23}\n"
+            for c1, c2, o1, o2 in rows
+        ]
+
+    # Yields the rendered memory rows start to stop - 1, numbered in the
+    # order memory_chunks yields them
+    def memory(self, cpu, hex_mode: bool, start: int = 0, stop: int = None):
+        w = max(4, len(str(cpu.mem_size)))
+        chunks = self.chunks
+        row = 0
+        for key, data, rows in Renderer.memory_chunks(cpu):
+            first, row = row, row + len(rows)
+            if row <= start: continue
+            if stop is not None and first >= stop: return
+
+            cached = chunks.get(key)
+            if cached is None or cached[0] != data:
+                cached = chunks[key] = (data, self.render_chunk(hex_mode, w, data, rows))
+
+            lines = cached[1]
+            if first < start or (stop is not None and row > stop):
+                lines = lines[max(0, start - first):None if stop is None else stop - first]
+            yield from lines
+
+    # Yields the text of the whole state in pieces
+    def iter_render(self, cpu, hex_mode: bool):
+        self.check_layout(cpu, hex_mode)
+        id = str(cpu.id)
+        yield f"\nCPU ID: {id} {'-' * (65 - len(id))}\n\nPC = {cpu.pc}\n\nRegisters:\n"
+        yield from self.registers(cpu, hex_mode)
+        yield "\nData Memory:\n"
+        yield from self.memory(cpu, hex_mode)
+        yield f"\n{'-' * 74}\n\n"
+
+    def render(self, cpu, hex_mode: bool) -> str:
+        return ''.join(self.iter_render(cpu, hex_mode))
+
+    def render_memory(self, cpu, hex_mode: bool, start: int = 0, stop: int = None) -> str:
+        self.check_layout(cpu, hex_mode)
+        return ''.join(self.memory(cpu, hex_mode, start, stop))
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+from assembler import Assembler
+from cpu import CPU, RunResult
+from validator import ValidateARM
+
+# Content-addressed cache of run results.
+#
+# A result is keyed by a hash of
+#   - the canonical program: each instruction disassembled from its decoded
+#     form, so programs that only differ in whitespace, letter case, commas
+#     or XZR / X31 spelling share results
+#   - the initial state: the PC and CPU.state_digest() (registers and memory)
+#   - the limits: max_instrs and detect_loops
+# and holds the final status, instruction count and state digest. Runs
+# stopped by a deadline depend on timing, so they are never cached.
+#
+# Results are kept in an in-memory LRU tier and, if a directory is given,
+# an on-disk tier of small JSON files shared between processes and grading
+# sessions. When the files exceed max_bytes, the least recently used ones
+# are removed.
+
+# Returns the canonical text of a program, as a new list
+def canonical_code(code: list[str] | bytes) -> list[str]:
+    if isinstance(code, (bytes, bytearray, memoryview)):
+        return list(Assembler.decode_image(code)[1])
+    return list(canonical_decoded(ValidateARM.decode_code(code)))
+
+@lru_cache(maxsize=1024)
+def canonical_decoded(decoded: tuple) -> tuple[str]:
+    return tuple(Assembler.disassemble(instr) for instr in decoded)
+
+# Returns a hex digest identifying a program up to canonicalization
+@lru_cache(maxsize=1024)
+def program_hash(decoded: tuple) -> str:
+    return hashlib.sha256("\n".join(canonical_decoded(decoded)).encode()).hexdigest()
+
+class CachedResult:
+    def __init__(self, status: str, instrs: int, digest: str, hit: bool = False) -> None:
+        self.status = status
+        self.instrs = instrs
+        # CPU.state_digest() of the final state
+        self.digest = digest
+        # Whether the result came from the cache, in which case the CPU
+        # was not run
+        self.hit = hit
+
+    def to_json(self) -> dict:
+        return { 'status': self.status, 'instrs': self.instrs, 'digest': self.digest }
+
+    def __repr__(self) -> str:
+        return f"CachedResult({self.status!r}, {self.instrs}, {self.digest!r}, hit={self.hit})"
+
+class ResultsCache:
+    def __init__(self, directory: str = None, max_entries: int = 10_000, max_bytes: int = 64 * 2 ** 20) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> CachedResult, least recently used first
+        self.entries = OrderedDict()
+
+        self.directory = directory
+        self.disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in self.disk_entries())
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(cpu: CPU, max_instrs: int = None, detect_loops: bool = False) -> str:
+        parts = (program_hash(cpu.decoded), cpu.pc, cpu.state_digest(), max_instrs, detect_loops)
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def disk_entries(self) -> list:
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+
+    def get(self, key: str) -> CachedResult:
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            return result
+
+        if self.directory is None: return None
+
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                result = CachedResult(**json.load(f))
+            # Marks the file as recently used for eviction
+            os.utime(path)
+        except (OSError, ValueError, TypeError):
+            return None
+
+        self.remember(key, result)
+        return result
+
+    def remember(self, key: str, result: CachedResult) -> None:
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def put(self, key: str, result: CachedResult) -> None:
+        self.remember(key, result)
+        if self.directory is None: return
+
+        path = self.path(key)
+        data = json.dumps(result.to_json())
+        # Write to a temporary file first, so readers never see a partial result
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        try:
+            # Size of the file being replaced, if any
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp_path, path)
+
+        self.disk_bytes += len(data) - old_size
+        if self.disk_bytes > self.max_bytes: self.evict()
+
+    # Removes the least recently used files until the disk tier is below
+    # 90% of max_bytes
+    def evict(self) -> None:
+        entries = sorted(self.disk_entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes * 0.9: break
+            try:
+                os.remove(entry.path)
+                total -= entry.stat().st_size
+            except OSError:
+                # Removed by another process
+                pass
+        self.disk_bytes = total
+
+    # Runs cpu like CPU.run, unless the result for its program, state and
+    # limits is cached. On a hit the CPU is left unchanged.
+    def run(self, cpu: CPU, max_instrs: int = None, deadline: float = None, detect_loops: bool = False) -> CachedResult:
+        key = ResultsCache.key(cpu, max_instrs, detect_loops)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return CachedResult(cached.status, cached.instrs, cached.digest, hit=True)
+
+        self.misses += 1
+        run = cpu.run(max_instrs=max_instrs, deadline=deadline, detect_loops=detect_loops)
+        result = CachedResult(run.status, run.instrs, cpu.state_digest())
+        if run.status != RunResult.DEADLINE: self.put(key, result)
+        return result
@@ -0,0 +1,162 @@
+import asyncio
+from collections import deque
+
+from cpu import CPU, RunResult
+
+# Cooperative round-robin scheduling of many CPUs in one process.
+#
+# Each added CPU becomes a Job. The scheduler runs the ready jobs in turn,
+# one quantum of instructions at a time (through CPU.run_for), so a short
+# program finishes within a few rounds however long the others run. A job
+# ends when its program halts, when it has used its instruction budget, or
+# when it raises an exception.
+#
+# AsyncScheduler does the same from an asyncio task, yielding to the event
+# loop after every quantum, so the loop keeps serving other coroutines while
+# long emulations progress.
+
+class Job:
+    # Job statuses, besides RunResult.HALTED and RunResult.MAX_INSTRS
+    READY = 'ready'
+    ERROR = 'error'
+
+    def __init__(self, cpu: CPU, budget: int = None) -> None:
+        self.cpu = cpu
+        # Maximum instructions the job may execute, or None for no limit
+        self.budget = budget
+        # Instructions executed so far
+        self.instrs = 0
+        # READY, RunResult.HALTED, RunResult.MAX_INSTRS (budget used up) or ERROR
+        self.status = Job.READY
+        # Exception raised by the program, for ERROR jobs
+        self.error = None
+        # Set by AsyncScheduler once the job is done
+        self.finished = None
+
+    def done(self) -> bool:
+        return self.status != Job.READY
+
+    def __repr__(self) -> str:
+        return f"Job({self.cpu.id!r}, {self.status!r}, {self.instrs})"
+
+class Scheduler:
+    def __init__(self, quantum: int = 10_000, engine: str = 'interp') -> None:
+        if quantum <= 0:
+            error_msg = f'''
+            Invalid quantum. Recieved {quantum}.
+            Expected a positive number of instructions.
+            '''
+            raise ValueError(error_msg)
+
+        self.quantum = quantum
+        self.engine = engine
+        # Jobs waiting for their next quantum, in turn order
+        self.ready = deque()
+        # Jobs done as soon as they were added (with no budget left), to be
+        # returned by the next run()
+        self.unreported = []
+
+    # Adds a CPU to the end of the round and returns its Job
+    def add(self, cpu: CPU, budget: int = None) -> Job:
+        job = self.make_job(cpu, budget)
+        if budget is not None and budget <= 0:
+            job.status = RunResult.MAX_INSTRS
+            self.unreported.append(job)
+            self.finish(job)
+        else:
+            self.ready.append(job)
+        return job
+
+    def make_job(self, cpu: CPU, budget: int) -> Job:
+        return Job(cpu, budget)
+
+    # Called once a job is done
+    def finish(self, job: Job) -> None:
+        pass
+
+    # Runs one quantum of the next ready job. Returns the job, or None if
+    # no job is ready.
+    def step(self) -> Job:
+        if not self.ready: return None
+
+        job = self.ready.popleft()
+        n = self.quantum
+        if job.budget is not None: n = min(n, job.budget - job.instrs)
+
+        try:
+            result = job.cpu.run_for(n, self.engine)
+        except Exception as e:
+            job.status = Job.ERROR
+            job.error = e
+            self.finish(job)
+            return job
+
+        job.instrs += result.instrs
+        if result.status == RunResult.HALTED:
+            job.status = RunResult.HALTED
+        elif job.budget is not None and job.instrs >= job.budget:
+            job.status = RunResult.MAX_INSTRS
+        else:
+            self.ready.append(job)
+            return job
+
+        self.finish(job)
+        return job
+
+    # Runs every job until it is done. Returns the jobs in the order they
+    # finished, including jobs done as soon as they were added since the
+    # last run().
+    def run(self) -> list[Job]:
+        finished, self.unreported = self.unreported, []
+        while self.ready:
+            job = self.step()
+            if job.done(): finished.append(job)
+        return finished
+
+class AsyncScheduler(Scheduler):
+    def __init__(self, quantum: int = 10_000, engine: str = 'interp') -> None:
+        super().__init__(quantum, engine)
+        # Set while jobs are ready, so serve() can sleep when idle
+        self.wakeup = asyncio.Event()
+
+    def make_job(self, cpu: CPU, budget: int) -> Job:
+        job = Job(cpu, budget)
+        job.finished = asyncio.Event()
+        return job
+
+    def add(self, cpu: CPU, budget: int = None) -> Job:
+        job = super().add(cpu, budget)
+        if self.ready or self.unreported: self.wakeup.set()
+        return job
+
+    def finish(self, job: Job) -> None:
+        job.finished.set()
+
+    # Adds a CPU and waits until its job is done. Needs serve() or run()
+    # running in another task.
+    async def submit(self, cpu: CPU, budget: int = None) -> Job:
+        job = self.add(cpu, budget)
+        await job.finished.wait()
+        return job
+
+    # Runs every job until it is done, yielding to the event loop after
+    # each quantum. Returns the jobs in the order they finished, as
+    # Scheduler.run does.
+    async def run(self) -> list[Job]:
+        finished, self.unreported = self.unreported, []
+        while self.ready:
+            job = self.step()
+            if job.done(): finished.append(job)
+            await asyncio.sleep(0)
+        return finished
+
+    # Runs jobs as they are added, until cancelled
+    async def serve(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            # Jobs are reported through their finished events instead
+            self.unreported.clear()
+            while self.ready:
+                self.step()
+                await asyncio.sleep(0)
+            self.wakeup.clear()
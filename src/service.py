@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cpu import CPU
+from grader import make_cpu
+from validator import ValidateARM
+
+# Long-lived local grading service, over HTTP on localhost.
+#
+# Jobs are queued on a pool of worker processes that stay up between jobs,
+# so imports are paid once and the memoized validation, config parsing and
+# fusion caches (see ValidateARM.decode_program, CPU.parse_reg_config and
+# Fusion.fuse_program) stay hot for programs and vectors seen before.
+#
+# A job is a JSON object with keys:
+#   'code':         Program, as a list of lines or one multiline string
+#   'reg_config':   Register configuration (see CPU.config_reg), optional
+#   'mem_config':   Memory configuration (see CPU.config_mem), optional
+#   'seed':         If given, non-configured values are randomized with this seed
+#   'mem_size':     Data memory size in bytes, optional
+#   'max_instrs':   Instruction limit, default 1 000 000
+#   'timeout':      Seconds allowed, default 10
+#   'detect_loops': Stop as soon as the state repeats, default false
+#   'engine':       Execution engine for bounded runs, default 'interp'
+#
+# Jobs with keys of the wrong type are rejected with 400 when submitted.
+# JSON object keys are strings, so the memory addresses of a mem_config
+# object (and register numbers of a reg_config object) are converted to
+# ints. Any error while running a job becomes an 'invalid' or 'error'
+# result, and any other failure of a request a 500 response.
+#
+# Endpoints:
+#   POST /run        Runs a job and responds with its result
+#   POST /jobs       Queues a job and responds with {"id": ...}
+#   GET  /jobs/<id>  Result of a queued job, or {"status": "queued"}
+#   GET  /metrics    Queue depth, throughput and latency
+#
+# Results of queued jobs are kept until fetched, or for result_ttl seconds
+# after the job finishes, then forgotten (GET /jobs/<id> responds 404).
+
+INVALID = 'invalid'
+ERROR = 'error'
+QUEUED = 'queued'
+
+DEFAULT_MAX_INSTRS = 1_000_000
+DEFAULT_TIMEOUT = 10.0
+
+# Seconds of completed jobs used for the throughput metrics
+THROUGHPUT_WINDOW = 60.0
+
+# Seconds the result of a queued job is kept unless it is fetched
+DEFAULT_RESULT_TTL = 600.0
+
+def is_int(value: any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def is_number(value: any) -> bool:
+    return is_int(value) or isinstance(value, float)
+
+# Converts a JSON object key holding an integer to an int
+def int_key(key: str) -> int:
+    if is_int(key): return key
+    try:
+        return int(key)
+    except (ValueError, TypeError):
+        error_msg = f'''
+        Invalid job key. Recieved {key!r}.
+        Expected an integer.
+        '''
+        raise ValueError(error_msg)
+
+# Returns the job with config keys converted, or raises ValueError if a
+# key has the wrong type
+def check_job(job: dict) -> dict:
+    if not isinstance(job, dict) or 'code' not in job:
+        error_msg = f'''
+        Invalid job. Recieved {job!r}.
+        Expected a JSON object with at least a 'code' key.
+        '''
+        raise ValueError(error_msg)
+
+    job = dict(job)
+    code = job['code']
+    reg_config = job.get('reg_config', "")
+    mem_config = job.get('mem_config', "")
+
+    if isinstance(reg_config, dict):
+        job['reg_config'] = reg_config = {
+            int_key(reg) if isinstance(reg, str) and reg.isdigit() else reg: value for reg, value in reg_config.items()
+        }
+        reg_values = reg_config.values()
+    else:
+        reg_values = reg_config if isinstance(reg_config, list) else []
+
+    if isinstance(mem_config, dict):
+        job['mem_config'] = mem_config = { int_key(mem): value for mem, value in mem_config.items() }
+
+    checks = {
+        'code': isinstance(code, str) or (isinstance(code, list) and all(isinstance(line, str) for line in code)),
+        'reg_config': isinstance(reg_config, (str, dict, list)) and all(is_int(value) for value in reg_values),
+        'mem_config': isinstance(mem_config, str) or (isinstance(mem_config, dict) and all(is_int(value) for value in mem_config.values())),
+        'seed': job.get('seed') is None or is_int(job['seed']),
+        'mem_size': is_int(job.get('mem_size', 0)),
+        'max_instrs': is_int(job.get('max_instrs', 0)),
+        'timeout': is_number(job.get('timeout', 0)),
+        'detect_loops': isinstance(job.get('detect_loops', False), bool),
+        'engine': isinstance(job.get('engine', 'interp'), str) and job.get('engine', 'interp') in CPU.ENGINES,
+    }
+    for key, ok in checks.items():
+        if not ok:
+            error_msg = f'''
+            Invalid job '{key}'. Recieved {job[key]!r}.
+            See the job keys in service.py.
+            '''
+            raise ValueError(error_msg)
+
+    return job
+
+# Runs one job in a worker process and returns its result as a dict. Never
+# raises: errors are returned as INVALID or ERROR results.
+def run_job(job: dict) -> dict:
+    start = time.monotonic()
+    elapsed = lambda: time.monotonic() - start
+
+    try:
+        code = job['code']
+        if isinstance(code, str): code = ValidateARM.split_string(code)
+        cpu = make_cpu('job', code, job)
+    except Exception as e:
+        return { 'status': INVALID, 'instrs': 0, 'seconds': elapsed(), 'detail': type(e).__name__ }
+
+    try:
+        result = cpu.run(
+            engine=job.get('engine', 'interp'),
+            max_instrs=job.get('max_instrs', DEFAULT_MAX_INSTRS),
+            deadline=start + job.get('timeout', DEFAULT_TIMEOUT),
+            detect_loops=job.get('detect_loops', False)
+        )
+    except Exception as e:
+        return { 'status': ERROR, 'instrs': 0, 'seconds': elapsed(), 'detail': type(e).__name__ }
+
+    return {
+        'status': result.status,
+        'instrs': result.instrs,
+        'seconds': elapsed(),
+        'pc': cpu.pc,
+        'registers': list(cpu.registers),
+        'memory': bytes(cpu.memory).hex(),
+        'digest': cpu.state_digest(),
+    }
+
+def warm_up() -> None:
+    pass
+
+class QueueFull(Exception):
+    pass
+
+class GradingService:
+    def __init__(self, workers: int = None, max_queue: int = 10_000, result_ttl: float = DEFAULT_RESULT_TTL) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers)
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        # Job id -> Future, for jobs queued through /jobs
+        self.jobs = {}
+        # (finish time, id) of finished queued jobs, oldest first
+        self.finished = deque()
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+        # (finish time, instructions) of jobs completed in the last THROUGHPUT_WINDOW
+        self.recent = deque()
+        self.completed = 0
+        self.total_seconds = 0.0
+
+        # Starts every worker now rather than on the first jobs
+        for future in [self.pool.submit(warm_up) for _ in range(self.workers)]:
+            future.result()
+
+    # Queues a job and returns its Future. Raises ValueError for malformed
+    # jobs (see check_job), and QueueFull if max_queue jobs are already
+    # waiting.
+    def submit(self, job: dict):
+        job = check_job(job)
+
+        with self.lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"Queue is full ({self.max_queue} jobs).")
+            self.pending += 1
+            self.submitted += 1
+
+        submitted = time.monotonic()
+        future = self.pool.submit(run_job, job)
+        future.add_done_callback(lambda f: self.job_done(f, submitted))
+        return future
+
+    def job_done(self, future, submitted: float) -> None:
+        now = time.monotonic()
+        instrs = 0
+        if not future.cancelled() and future.exception() is None:
+            instrs = future.result()['instrs'] or 0
+
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += now - submitted
+            self.recent.append((now, instrs))
+            while self.recent and self.recent[0][0] < now - THROUGHPUT_WINDOW:
+                self.recent.popleft()
+
+    # Queues a job and returns its id, for result()
+    def enqueue(self, job: dict) -> int:
+        future = self.submit(job)
+        with self.lock:
+            self.evict_jobs()
+            id = next(self.ids)
+            self.jobs[id] = future
+        # Outside the lock: runs now if the job has already finished
+        future.add_done_callback(lambda f: self.queued_job_done(id))
+        return id
+
+    def queued_job_done(self, id: int) -> None:
+        with self.lock:
+            self.finished.append((time.monotonic(), id))
+
+    # Forgets queued jobs that finished more than result_ttl seconds ago.
+    # Called with the lock held.
+    def evict_jobs(self) -> None:
+        expired = time.monotonic() - self.result_ttl
+        while self.finished and self.finished[0][0] <= expired:
+            _, id = self.finished.popleft()
+            self.jobs.pop(id, None)
+
+    # Returns the result of a queued job, or {'status': QUEUED} if it has
+    # not finished. Finished results are returned once, then forgotten.
+    def result(self, id: int) -> dict:
+        with self.lock:
+            self.evict_jobs()
+            future = self.jobs.get(id)
+            if future is None:
+                raise KeyError(id)
+            if not future.done():
+                return { 'status': QUEUED }
+            del self.jobs[id]
+        return future.result()
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            recent = [r for r in self.recent if r[0] >= now - THROUGHPUT_WINDOW]
+            window = min(THROUGHPUT_WINDOW, now - self.started) or 1.0
+            return {
+                'workers': self.workers,
+                'pending': self.pending,
+                # Jobs waiting for a free worker
+                'queue_depth': max(0, self.pending - self.workers),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'uptime_s': now - self.started,
+                'jobs_per_s': len(recent) / window,
+                'instrs_per_s': sum(instrs for _, instrs in recent) / window,
+                'mean_latency_s': self.total_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # Set by make_server()
+    service = None
+
+    def send_json(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length))
+
+    def do_POST(self) -> None:
+        if self.path not in ('/run', '/jobs'):
+            return self.send_json(404, { 'error': f"Unknown path '{self.path}'" })
+
+        try:
+            job = self.read_json()
+            if self.path == '/run':
+                future = self.service.submit(job)
+                self.send_json(200, future.result())
+            else:
+                self.send_json(202, { 'id': self.service.enqueue(job) })
+        except QueueFull as e:
+            self.send_json(503, { 'error': str(e) })
+        except ValueError as e:
+            # Includes json.JSONDecodeError
+            self.send_json(400, { 'error': str(e).strip() })
+        except Exception as e:
+            self.send_json(500, { 'error': type(e).__name__ })
+
+    def do_GET(self) -> None:
+        if self.path == '/metrics':
+            return self.send_json(200, self.service.metrics())
+
+        if self.path.startswith('/jobs/'):
+            try:
+                return self.send_json(200, self.service.result(int(self.path[len('/jobs/'):])))
+            except (ValueError, KeyError):
+                pass
+            except Exception as e:
+                return self.send_json(500, { 'error': type(e).__name__ })
+
+        self.send_json(404, { 'error': f"Unknown path '{self.path}'" })
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+# Returns an HTTP server for service, listening on host:port (port 0
+# picks a free port, see server.server_address)
+def make_server(service: GradingService, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    handler = type('Handler', (ServiceHandler,), { 'service': service })
+    return ThreadingHTTPServer((host, port), handler)
+
+# Minimal client for the service
+class Client:
+    def __init__(self, url: str = 'http://127.0.0.1:8765') -> None:
+        self.url = url.rstrip('/')
+
+    def request(self, path: str, body: dict = None) -> dict:
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={ 'Content-Type': 'application/json' })
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def run(self, job: dict) -> dict:
+        return self.request('/run', job)
+
+    def enqueue(self, job: dict) -> int:
+        return self.request('/jobs', job)['id']
+
+    def result(self, id: int) -> dict:
+        return self.request(f'/jobs/{id}')
+
+    def metrics(self) -> dict:
+        return self.request('/metrics')
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve grading jobs over HTTP on localhost.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--max-queue', type=int, default=10_000, help="jobs accepted before rejecting with 503")
+    parser.add_argument('--result-ttl', type=float, default=DEFAULT_RESULT_TTL, help="seconds unfetched job results are kept")
+    args = parser.parse_args(argv)
+
+    service = GradingService(args.workers, args.max_queue, args.result_ttl)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == '__main__':
+    main()
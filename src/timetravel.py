@@ -0,0 +1,196 @@
+from collections import deque
+
+from cpu import CPU, CHUNK, RunResult, Snapshot
+from instr import Instr
+from memory import PagedMemory, PAGE_SIZE
+
+# Time-travel debugging, used through CPU.run(record=Recorder()).
+#
+# While recording, every executed instruction appends an undo record
+#   (pc, register written, address written, old value)
+# holding the old register value or the old memory double word, to a ring
+# buffer. Every checkpoint_interval instructions a full Snapshot is kept as
+# well. Stepping back a short distance pops undo records; going back past
+# the oldest record restores the nearest earlier checkpoint and re-executes
+# forward. Either way the work is proportional to the distance travelled.
+#
+# max_bytes caps the (estimated) memory used, split evenly between the undo
+# records and the checkpoints. The oldest of each are dropped first.
+
+# Opcodes that write register XA
+REG_WRITES = [ Instr.OP_ADD, Instr.OP_SUB, Instr.OP_LDUR, Instr.OP_ADDI, Instr.OP_SUBI ]
+
+# Estimated bytes used by one undo record
+RECORD_BYTES = 128
+
+def snapshot_bytes(snapshot: Snapshot) -> int:
+    if isinstance(snapshot.memory, PagedMemory):
+        memory = len(snapshot.memory.pages) * PAGE_SIZE
+    else:
+        memory = len(snapshot.memory)
+    return memory + len(snapshot.registers) * 40
+
+class Recorder:
+    def __init__(self, checkpoint_interval: int = 100_000, max_bytes: int = 64 * 2 ** 20) -> None:
+        self.checkpoint_interval = checkpoint_interval
+        self.max_bytes = max_bytes
+        self.cpu = None
+
+        # Instructions executed by the recorded CPU, up to its current state
+        self.n = 0
+        # Undo records of instructions n - len(records) to n - 1
+        self.records = deque(maxlen=max(1, max_bytes // 2 // RECORD_BYTES))
+        # (instruction number, Snapshot), oldest first
+        self.checkpoints = deque()
+        self.checkpoint_bytes = 0
+
+    def add_checkpoint(self) -> None:
+        if self.checkpoints and self.checkpoints[-1][0] == self.n: return
+
+        snapshot = self.cpu.snapshot()
+        self.checkpoints.append((self.n, snapshot))
+        self.checkpoint_bytes += snapshot_bytes(snapshot)
+
+        while len(self.checkpoints) > 1 and self.checkpoint_bytes > self.max_bytes // 2:
+            _, dropped = self.checkpoints.popleft()
+            self.checkpoint_bytes -= snapshot_bytes(dropped)
+
+    # Forgets checkpoints after the current instruction
+    def drop_future_checkpoints(self) -> None:
+        while self.checkpoints and self.checkpoints[-1][0] > self.n:
+            _, dropped = self.checkpoints.pop()
+            self.checkpoint_bytes -= snapshot_bytes(dropped)
+
+    def run(self, cpu: CPU, max_instrs: int = None, deadline: float = None) -> RunResult:
+        if cpu is not self.cpu:
+            self.cpu = cpu
+            self.n = 0
+            self.records.clear()
+            self.checkpoints.clear()
+            self.checkpoint_bytes = 0
+
+        decoded = cpu.decoded
+        execute = CPU.EXECUTE
+        registers = cpu.registers
+        memory = cpu.memory
+        records = self.records
+        interval = self.checkpoint_interval
+        end = len(decoded) * 4
+
+        self.add_checkpoint()
+
+        count = 0
+        while cpu.pc < end:
+            if count % CHUNK == 0 or count == max_instrs:
+                stopped = CPU.check_limits(count, max_instrs, deadline)
+                if stopped: return stopped
+
+            pc = cpu.pc
+            op, a, b, c = decoded[pc // 4]
+
+            if op in REG_WRITES:
+                old = registers[a]
+                execute[op](cpu, a, b, c)
+                records.append((pc, a, None, old))
+            elif op == Instr.OP_STUR:
+                address = registers[b] + c
+                # Out of range stores raise below, before writing anything
+                old = bytes(memory[address:address + 8]) if 0 <= address <= cpu.mem_size - 8 else None
+                execute[op](cpu, a, b, c)
+                records.append((pc, None, address, old))
+            else:
+                execute[op](cpu, a, b, c)
+                records.append((pc, None, None, None))
+
+            count += 1
+            self.n += 1
+            if self.n % interval == 0: self.add_checkpoint()
+
+        return RunResult(RunResult.HALTED, count)
+
+    # Undoes the newest record
+    def undo(self) -> None:
+        pc, reg, address, old = self.records.pop()
+        if reg is not None: self.cpu.registers[reg] = old
+        elif address is not None: self.cpu.memory[address:address + 8] = old
+        self.cpu.pc = pc
+        self.n -= 1
+
+    # Moves the recorded CPU back to its state before instruction n executed
+    def go_back_to(self, n: int) -> None:
+        if n < 0 or n > self.n:
+            error_msg = f'''
+            Invalid instruction number. Recieved {n}.
+            Expected 0 <= n <= {self.n}.
+            '''
+            raise ValueError(error_msg)
+
+        if n < self.n - len(self.records):
+            # Past the oldest undo record: re-execute from a checkpoint
+            earlier = [(i, snapshot) for i, snapshot in self.checkpoints if i <= n]
+            if not earlier:
+                error_msg = f'''
+                Can not go back to instruction {n}.
+                The oldest recorded state is instruction {self.n - len(self.records)}.
+                '''
+                raise ValueError(error_msg)
+
+            i, snapshot = earlier[-1]
+            self.cpu.restore(snapshot)
+            self.n = i
+            self.records.clear()
+            self.drop_future_checkpoints()
+            self.run(self.cpu, max_instrs=n - i)
+            return
+
+        while self.n > n: self.undo()
+        self.drop_future_checkpoints()
+
+    # Undoes the last count instructions
+    def step_back(self, count: int = 1) -> None:
+        self.go_back_to(self.n - count)
+
+    # Goes back to the last time the CPU was about to execute the
+    # instruction at pc. Returns the number of instructions undone, or
+    # None (leaving the CPU unchanged) if pc was not executed in the
+    # recorded history.
+    def run_back_to(self, pc: int) -> int:
+        start = self.n
+        for back, record in enumerate(reversed(self.records)):
+            if record[0] == pc:
+                self.go_back_to(start - back - 1)
+                return back + 1
+
+        # Search the history before the undo records, one checkpoint
+        # interval at a time, newest first
+        stop = start - len(self.records)
+        for i, snapshot in reversed(self.checkpoints):
+            if i >= stop: continue
+            last = self.find_last_pc(snapshot, i, stop, pc)
+            if last is not None:
+                self.go_back_to(last)
+                return start - last
+            stop = i
+
+        return None
+
+    # Returns the last instruction number in [start, stop) that executed
+    # pc, re-executing from snapshot on a separate CPU
+    def find_last_pc(self, snapshot: Snapshot, start: int, stop: int, pc: int) -> int:
+        cpu = self.cpu.fork()
+        cpu.restore(snapshot)
+
+        last = None
+        for n in range(start, stop):
+            if cpu.pc == pc: last = n
+            cpu.run_instr()
+        return last
+
+    # Returns (instruction number, pc) of the last store to the double word
+    # containing address, or None if it was not written in the recorded
+    # undo history
+    def last_write(self, address: int) -> tuple:
+        for back, (pc, _, written, _) in enumerate(reversed(self.records)):
+            if written is not None and written <= address < written + 8:
+                return (self.n - back - 1, pc)
+        return None
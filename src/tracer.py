@@ -0,0 +1,84 @@
+import gzip
+import itertools
+import json
+
+from cpu import CPU, CHUNK, RunResult
+from instr import Instr
+
+# Execution traces, used through CPU.run(trace=Tracer(path)).
+#
+# Each executed instruction produces one record:
+#   {"n": 1, "pc": 4, "op": "LDUR", "args": [5, 1, 0], "reg": [5, 42]}
+# where "reg" is the register written and its new value, and STUR records
+# carry "mem": [address, double word written] instead. Records are streamed
+# one line at a time as JSON, gzip compressed if the path ends in '.gz', so
+# tracing uses constant memory however long the run is.
+
+OP_NAMES = { op: name for name, op in Instr.OPCODES.items() }
+
+# Opcodes that write register XA
+REG_WRITES = [ Instr.OP_ADD, Instr.OP_SUB, Instr.OP_LDUR, Instr.OP_ADDI, Instr.OP_SUBI ]
+
+def open_trace(path: str, mode: str):
+    if path.endswith('.gz'): return gzip.open(path, mode)
+    return open(path, mode)
+
+class Tracer:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.result = None
+
+    # Executes cpu, yielding a trace record per instruction. Once exhausted,
+    # self.result holds the RunResult of the run.
+    def records(self, cpu: CPU, max_instrs: int = None, deadline: float = None):
+        decoded = cpu.decoded
+        execute = CPU.EXECUTE
+        registers = cpu.registers
+        end = len(decoded) * 4
+        count = 0
+
+        self.result = None
+        while cpu.pc < end:
+            if count % CHUNK == 0 or count == max_instrs:
+                self.result = CPU.check_limits(count, max_instrs, deadline)
+                if self.result: return
+
+            pc = cpu.pc
+            op, a, b, c = decoded[pc // 4]
+            if op == Instr.OP_STUR: address = registers[b] + c
+
+            execute[op](cpu, a, b, c)
+            count += 1
+
+            record = { "n": count, "pc": pc, "op": OP_NAMES[op], "args": [a, b, c] }
+            if op in REG_WRITES:
+                record["reg"] = [a, registers[a]]
+            elif op == Instr.OP_STUR:
+                record["mem"] = [address, registers[a] & 0xFFFFFFFFFFFFFFFF]
+            yield record
+
+        self.result = RunResult(RunResult.HALTED, count)
+
+    # Writes the trace of a run to self.path. If the CPU raises, the records
+    # up to the failing instruction are still written.
+    def run(self, cpu: CPU, max_instrs: int = None, deadline: float = None) -> RunResult:
+        with open_trace(self.path, 'wt') as f:
+            for record in self.records(cpu, max_instrs, deadline):
+                f.write(json.dumps(record, separators=(',', ':')))
+                f.write('\n')
+        return self.result
+
+def read_trace(path: str):
+    with open_trace(path, 'rt') as f:
+        for line in f:
+            yield json.loads(line)
+
+# Returns (record number, record1, record2) for the first records that
+# differ between two trace files, or None if the traces are identical.
+# A trace that ends first is reported with a record of None.
+def diff_traces(path1: str, path2: str) -> tuple:
+    pairs = itertools.zip_longest(read_trace(path1), read_trace(path2))
+    for n, (record1, record2) in enumerate(pairs, 1):
+        if record1 != record2:
+            return n, record1, record2
+    return None
@@ -1,4 +1,45 @@
 import re
+from functools import lru_cache
+
+from instr import Instr
+
+# Register patterns. ADD/SUB/ADDI/SUBI accept a leading zero (e.g. 'X09').
+REG = r'X(?P<{}>[0-2]?[0-9]|30|31|ZR)'
+REG_MEM = r'X(?P<{}>[0-9]|1[0-9]|2[0-9]|30|31|ZR)'
+SEP = r'\s*,*\s*'
+
+# Instruction -> (pattern, immediate range). Patterns name their operands
+# '{name}_a', '{name}_b' and '{name}_c', in the order of the decoded tuple.
+FORMATS = {
+    Instr.ADDI: (r'ADDI\s+' + REG + SEP + REG + SEP + r'#(?P<{}>\d+)', (0, 4095)),
+    Instr.SUBI: (r'SUBI\s+' + REG + SEP + REG + SEP + r'#(?P<{}>\d+)', (0, 4095)),
+    Instr.LDUR: (r'LDUR\s+' + REG_MEM + SEP + r'\[\s*' + REG_MEM + SEP + r'#(?P<{}>-?\d+)\s*]', (-256, 255)),
+    Instr.STUR: (r'STUR\s+' + REG_MEM + SEP + r'\[\s*' + REG_MEM + SEP + r'#(?P<{}>-?\d+)\s*]', (-256, 255)),
+    Instr.CBNZ: (r'CBNZ\s+' + REG_MEM + SEP + r'#(?P<{}>-?\d+)', (-262144, 262143)),
+    Instr.CBZ: (r'CBZ\s+' + REG_MEM + SEP + r'#(?P<{}>-?\d+)', (-262144, 262143)),
+    Instr.B: (r'B\s*\s*#(?P<{}>-?\d+)', (-33554432, 33554431)),
+    Instr.ADD: (r'ADD\s+' + REG + SEP + REG + SEP + REG, None),
+    Instr.SUB: (r'SUB\s+' + REG + SEP + REG + SEP + REG, None),
+}
+
+# Operand group names of each instruction, in decoded tuple order
+OPERANDS = {
+    Instr.ADDI: ('a', 'b', 'c'), Instr.SUBI: ('a', 'b', 'c'),
+    Instr.LDUR: ('a', 'b', 'c'), Instr.STUR: ('a', 'b', 'c'),
+    Instr.CBNZ: ('a', 'c'), Instr.CBZ: ('a', 'c'),
+    Instr.B: ('c',),
+    Instr.ADD: ('a', 'b', 'c'), Instr.SUB: ('a', 'b', 'c'),
+}
+
+def format_pattern(instr: str) -> str:
+    pattern, _ = FORMATS[instr]
+    names = [f"{instr}_{operand}" for operand in OPERANDS[instr]]
+    return f"(?P<{instr}>{pattern.format(*names)})"
+
+# All instruction formats in a single pattern, compiled once
+INSTR_PATTERN = re.compile(
+    r'^\s*(?:' + '|'.join(format_pattern(instr) for instr in FORMATS) + r')\s*$'
+)
 
 class ValidateARM():
     def extract_immediate_value(instruction):
@@ -10,57 +51,33 @@ class ValidateARM():
     def validate_immediate(immediate, lower_limit, upper_limit):
         return lower_limit <= immediate <= upper_limit
 
-    def validate_instruction(instruction, patterns):
-        for pattern, validator in patterns.items():
-            match = re.match(pattern, instruction)
-            if match:
-                return validator(match)
-        raise SyntaxError(f"{instruction} does not follow the instruction format")
-
-    def validate_range(match, lower_limit, upper_limit, instruction):
-        immediate = int(match.group(1))
-        if not ValidateARM.validate_immediate(immediate, lower_limit, upper_limit):
-            raise SyntaxError(f"Immediate value in {instruction} is out of range.")
-        return True
-
-    def validate_add_sub(match):
-        return ValidateARM.validate_range(match, 0, 4095, match.group(0))
+    # Validates one line of arm code and returns its decoded instruction
+    # (see decoder.py)
+    def decode(instruction):
+        instruction = instruction.upper()
 
-    def validate_ldur_stur(match):
-        return ValidateARM.validate_range(match, -256, 255, match.group(0))
+        match = INSTR_PATTERN.match(instruction)
+        if match is None:
+            raise SyntaxError(f"{instruction} does not follow the instruction format")
 
-    def validate_cbnz_cbz(match):
-        return ValidateARM.validate_range(match, -262144, 262143, match.group(0))
+        instr = match.lastgroup
+        values = { operand: match.group(f"{instr}_{operand}") for operand in OPERANDS[instr] }
 
-    def validate_b(match):
-        return ValidateARM.validate_range(match, -33554432, 33554431, match.group(0))
+        imm_range = FORMATS[instr][1]
+        if imm_range is not None:
+            if not ValidateARM.validate_immediate(int(values['c']), *imm_range):
+                raise SyntaxError(f"Immediate value in {instruction} is out of range.")
 
-    def validate_add(match):
-        return True
+        reg = lambda value: 31 if value == 'ZR' else int(value)
+        a = reg(values['a']) if 'a' in values else 0
+        b = reg(values['b']) if 'b' in values else 0
+        c = int(values['c']) if imm_range is not None else reg(values['c'])
 
-    def validate_sub(match):
-        return True
+        return (Instr.OPCODES[instr], a, b, c)
 
     def validate(instruction):
-        instruction = instruction.upper()
-
-        patterns = {
-            r'^\s*ADDI\s+X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*,*\s*#(\d+)\s*$': ValidateARM.validate_add_sub,
-            r'^\s*SUBI\s+X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*,*\s*#(\d+)\s*$': ValidateARM.validate_add_sub,
-            r'^\s*LDUR\s+X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*\[\s*X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*#(-?\d+)\s*]\s*$': ValidateARM.validate_ldur_stur,
-            r'^\s*STUR\s+X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*\[\s*X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*#(-?\d+)\s*]\s*$': ValidateARM.validate_ldur_stur,
-            r'^\s*CBNZ\s+X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*#(-?\d+)\s*$': ValidateARM.validate_cbnz_cbz,
-            r'^\s*CBZ\s+X([0-9]|1[0-9]|2[0-9]|30|31|ZR)\s*,*\s*#(-?\d+)\s*$': ValidateARM.validate_cbnz_cbz,
-            r'^\s*B\s*\s*#(-?\d+)\s*$': ValidateARM.validate_b,
-            r'^\s*ADD\s+X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*$': ValidateARM.validate_add,
-            r'^\s*SUB\s+X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*,*\s*X([0-2]?[0-9]|30|31|ZR)\s*$': ValidateARM.validate_sub,
-        }
-
-        for pattern, validator in patterns.items():
-            if re.match(pattern, instruction):
-                return validator(re.match(pattern, instruction))
-
-        raise SyntaxError(f"{instruction} does not follow the instruction format")
+        ValidateARM.decode(instruction)
+        return True
 
     # Returns list of strings arm code from a file
     def read_file(filename: str):
@@ -73,12 +90,21 @@ class ValidateARM():
     def split_string(arm_code: str):
         return list(filter(lambda x: x != "", arm_code.splitlines()))
 
+    # Validates and decodes a program. Results are memoized by program, so
+    # constructing CPUs for the same code again skips validation.
+    @lru_cache(maxsize=1024)
+    def decode_program(code: tuple) -> tuple:
+        return tuple(ValidateARM.decode(line) for line in code)
+
+    # Takes a list of strings arm code, validates it and returns it decoded
+    def decode_code(code):
+        try:
+            return ValidateARM.decode_program(tuple(code))
+        except SyntaxError as e:
+            print(e)
+            raise SyntaxError()
+
     # Takes a list of strings arm code and validates it
-    def validate_code(code):
-        for line in code:
-            try:
-                ValidateARM.validate(line)
-            except SyntaxError as e:
-                print(e)
-                raise SyntaxError()
-        print('Arm Code Validated!')
+    def validate_code(code, verbose: bool = True):
+        ValidateARM.decode_code(code)
+        if verbose: print('Arm Code Validated!')
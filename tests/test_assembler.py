@@ -0,0 +1,83 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from assembler import Assembler, AssemblyCache
+from cpu import CPU
+from validator import ValidateARM
+
+# Assembling a program and decoding the machine code must give back the
+# decoded program, including the sign-extended immediates of LDUR / STUR
+# and the branch offsets.
+
+CODE = [
+    'LDUR X1, [X2, #-256]',
+    'LDUR X1, [X2, #-8]',
+    'STUR X3, [X4, #-1]',
+    'STUR XZR, [X30, #255]',
+    'ADDI X1, X2, #4095',
+    'SUBI X1, XZR, #0',
+    'ADD X1, X2, XZR',
+    'SUB X30, X0, X1',
+    'B #-1',
+    'B #-33554432',
+    'B #33554431',
+    'CBZ X1, #-1',
+    'CBZ X5, #-262144',
+    'CBNZ X2, #262143',
+    'CBNZ XZR, #-3',
+]
+
+def test_round_trip():
+    words = Assembler.assemble(CODE)
+    decoded, code = Assembler.decode_image(words)
+    assert decoded == tuple(ValidateARM.decode_code(CODE))
+
+    # The disassembly assembles to the same words
+    assert Assembler.assemble(code) == words
+    assert Assembler.decode_image(Assembler.to_bytes(words))[0] == decoded
+
+@pytest.mark.parametrize('instr, word', [
+    ('STUR X1, [X2, #-8]', 0xF81F8041),
+    ('LDUR X0, [X1, #-256]', 0xF8500020),
+    ('B #-1', 0x17FFFFFF),
+    ('CBZ X1, #-1', 0xB4FFFFE1),
+    ('CBNZ X0, #-262144', 0xB5800000),
+])
+def test_negative_fields(instr: str, word: int):
+    assert Assembler.assemble([instr])[0] == word
+    assert Assembler.decode(word) == ValidateARM.decode(instr)
+
+# A backward branch in a binary image runs like the assembly text
+def test_run_image():
+    code = [
+        'ADDI X2, XZR, #80',
+        'STUR X1, [X2, #-8]',
+        'ADDI X1, X1, #3',
+        'LDUR X3, [X2, #-8]',
+        'SUBI X4, X4, #1',
+        'CBNZ X4, #-4',
+        'B #2',
+        'ADDI X5, X5, #1',
+    ]
+    text = CPU('text', code, reg_config='X4=10', randomize=False)
+    image = CPU('image', Assembler.to_bytes(Assembler.assemble(code)), reg_config='X4=10', randomize=False)
+    text.run()
+    image.run()
+    assert text == image
+    assert text.registers[1] == 30 and text.registers[3] == 27 and text.registers[5] == 0
+
+# Invalid programs leave nothing in the cache directory
+def test_cache(tmp_path):
+    cache = AssemblyCache(str(tmp_path))
+    image = cache.load(CODE)
+    assert image == Assembler.to_bytes(Assembler.assemble(CODE))
+    assert cache.load(CODE) == image
+    assert os.listdir(tmp_path) == [AssemblyCache.key(CODE) + '.bin']
+
+    with pytest.raises(SyntaxError):
+        cache.load(['ADDI X1, X2'])
+    assert os.listdir(tmp_path) == [AssemblyCache.key(CODE) + '.bin']
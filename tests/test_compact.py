@@ -0,0 +1,77 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from compact import CompactCPU, Program
+from cpu import CPU
+
+# A CompactCPU must reach the same state as a CPU running the same program
+# from the same initial state, while sharing one Program per code.
+
+CODE = [
+    'ADDI X2, XZR, #16',
+    'LDUR X3, [X2, #0]',
+    'ADD X4, X4, X3',
+    'STUR X4, [X2, #8]',
+    'SUBI X1, X1, #1',
+    'CBNZ X1, #-4',
+]
+
+def test_random_batch_matches_cpu():
+    cpus = CPU.random_batch('batch', CODE, 20, 'X1=10', mem_size=64, seed=1)
+    compact = CompactCPU.random_batch('batch', CODE, 20, 'X1=10', mem_size=64, seed=1)
+    assert compact == cpus
+    assert all(c.program is compact[0].program for c in compact)
+
+    for c, cpu in zip(compact, cpus):
+        assert c.run().status == cpu.run().status
+        assert c == cpu and c.pc == cpu.pc
+        assert c.state_digest() == cpu.state_digest()
+        assert str(c) == str(cpu)
+
+def test_shared_program():
+    assert Program.get(CODE) is Program.get(list(CODE))
+    a = CompactCPU.from_cpu(CPU('a', CODE, reg_config='X1=3', seed=2))
+    b = CompactCPU.from_cpu(CPU('b', CODE, reg_config='X1=3', seed=3))
+    assert a.program is b.program
+    assert a.program.decoded == CPU('c', CODE).decoded
+
+    # Caches built by one instance's run are kept for the others
+    a.run(engine='block')
+    assert a.program.template.blocks is not None
+    assert not hasattr(a, '__dict__')
+
+# Registers that leave 64 bits are kept exactly
+def test_wide_registers():
+    cpu = CPU('wide', ['SUBI X1, X1, #1', 'ADD X2, X3, X3'], reg_config='X1=0', seed=4)
+    cpu.registers[3] = 2 ** 63
+    compact = CompactCPU.from_cpu(cpu)
+    compact.run()
+    cpu.run()
+    assert compact == cpu
+    assert compact.registers[1] == -1 and compact.registers[2] == 2 ** 64
+
+def test_run_for_and_to_cpu():
+    cpu = CPU('steps', CODE, reg_config='X1=3', seed=5)
+    compact = CompactCPU.from_cpu(cpu)
+
+    results = [compact.run_for(5)]
+    while not results[-1].halted(): results.append(compact.run_for(5))
+    assert [r.status for r in results] == ['yielded', 'yielded', 'yielded', 'halted']
+    assert sum(r.instrs for r in results) == 1 + 5 * 3
+
+    cpu.run()
+    copy = compact.to_cpu()
+    assert copy == cpu and copy.pc == cpu.pc
+    # to_cpu copies the state
+    copy.set_double_word(0, 1)
+    assert compact.memory != copy.memory
+
+def test_paged_memory():
+    cpu = CPU('paged', CODE, reg_config='X1=3', mem_size=2 ** 20, paged=True, seed=6)
+    compact = CompactCPU.from_cpu(cpu)
+    compact.run()
+    cpu.run()
+    assert compact == cpu
+    assert compact.state_digest() == cpu.state_digest()
@@ -0,0 +1,63 @@
+import os
+import pathlib
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU
+
+# Every form of reg_config and mem_config must give the same state as the
+# equivalent configuration string.
+
+CODE = ['ADDI X1, X1, #1']
+
+REG_STRING = 'X1=5\nX2=-3\nX30=2'
+MEM_STRING = '[0]=1\n[8]=-1\n[24]=4096'
+
+def make_cpu(reg_config = "", mem_config = "") -> CPU:
+    return CPU('config', CODE, reg_config=reg_config, mem_config=mem_config, randomize=False, mem_size=32)
+
+def state(cpu: CPU) -> tuple:
+    return list(cpu.registers), bytes(cpu.memory)
+
+@pytest.mark.parametrize('reg_config', [
+    { 'X1': 5, 'X2': -3, 'X30': 2 },
+    { 1: 5, 2: -3, 30: 2 },
+    { 'x1': 5, 2: -3, 'X30': 2 },
+    [0, 5, -3] + [0] * 27 + [2],
+])
+def test_reg_config_forms(reg_config):
+    assert state(make_cpu(reg_config=reg_config)) == state(make_cpu(reg_config=REG_STRING))
+
+def test_mem_config_forms(tmp_path):
+    expected = state(make_cpu(mem_config=MEM_STRING))
+    image = bytes(make_cpu(mem_config=MEM_STRING).memory)
+
+    assert state(make_cpu(mem_config={ 0: 1, 8: -1, 24: 4096 })) == expected
+    assert state(make_cpu(mem_config=image)) == expected
+    assert state(make_cpu(mem_config=bytearray(image))) == expected
+    assert state(make_cpu(mem_config=memoryview(image))) == expected
+
+    path = tmp_path / 'memory.bin'
+    path.write_bytes(image)
+    assert state(make_cpu(mem_config=path)) == expected
+
+# Shorter images are loaded at address 0, leaving the rest of memory
+def test_short_memory_image(tmp_path):
+    cpu = make_cpu(mem_config=bytes(range(1, 9)))
+    assert cpu.get_double_word(0) == 0x0102030405060708
+    assert bytes(cpu.memory[8:]) == bytes(24)
+
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    assert state(make_cpu(mem_config=pathlib.Path(path))) == state(make_cpu())
+
+def test_invalid_configs():
+    with pytest.raises(ValueError):
+        make_cpu(mem_config=bytes(33))
+    with pytest.raises(IndexError):
+        make_cpu(reg_config=[0] * 33)
+    with pytest.raises(ValueError):
+        make_cpu(reg_config='X1:5')
@@ -0,0 +1,109 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cpu import CPU, RunResult
+from debugger import Debugger
+
+# Every stop of a Debugger run must leave the CPU in the state reached by
+# single-stepping the instructions reported so far, and running again must
+# resume from there.
+
+# 4 instructions per iteration, 400 in total
+CODE = [
+    'ADDI X1, X1, #1',
+    'STUR X1, [X2, #0]',
+    'SUBI X3, X3, #1',
+    'CBNZ X3, #-3',
+]
+INSTRS = 400
+
+def make_cpu() -> CPU:
+    return CPU('debug', CODE, reg_config='X2=8\nX3=100', randomize=False, mem_size=64)
+
+def state(cpu: CPU) -> tuple:
+    return cpu.pc, list(cpu.registers), bytes(cpu.memory)
+
+# State after the first n instructions
+def state_at(n: int) -> tuple:
+    cpu = make_cpu()
+    for _ in range(n): cpu.run_instr()
+    return state(cpu)
+
+# Runs until the program halts, returning the RunResult of every stop
+def run_stops(cpu: CPU, debugger: Debugger) -> list[RunResult]:
+    results = [cpu.run(debug=debugger)]
+    while not results[-1].halted():
+        results.append(cpu.run(debug=debugger))
+    return results
+
+def test_resume_past_breakpoint():
+    cpu, debugger = make_cpu(), Debugger()
+    debugger.add_breakpoint(4)
+
+    result = cpu.run(debug=debugger)
+    assert (result.status, result.instrs) == (RunResult.BREAKPOINT, 1)
+    assert debugger.hit == (RunResult.BREAKPOINT, 4, None)
+    assert state(cpu) == state_at(1)
+
+    # Running again executes the instruction at the breakpoint, and stops
+    # there in the next iteration
+    result = cpu.run(debug=debugger)
+    assert (result.status, result.instrs) == (RunResult.BREAKPOINT, 4)
+    assert state(cpu) == state_at(5)
+
+    # A run of 0 instructions does not step over the breakpoint
+    assert cpu.run(debug=debugger, max_instrs=0).instrs == 0
+    assert cpu.run(debug=debugger, max_instrs=2).instrs == 2
+    assert state(cpu) == state_at(7)
+
+    debugger.remove_breakpoint(4)
+    result = cpu.run(debug=debugger)
+    assert (result.status, result.instrs) == (RunResult.HALTED, INSTRS - 7)
+    assert state(cpu) == state_at(INSTRS)
+
+def test_conditional_breakpoint():
+    cpu, debugger = make_cpu(), Debugger()
+    debugger.add_breakpoint(12, lambda registers: registers[3] % 25 == 0)
+
+    stops = run_stops(cpu, debugger)
+    # Stops before the CBNZ of iterations 25, 50, 75 and 100
+    assert [result.status for result in stops[:-1]] == [RunResult.BREAKPOINT] * 4
+    assert [result.instrs for result in stops] == [99, 100, 100, 100, 1]
+    assert state(cpu) == state_at(INSTRS)
+
+def test_watchpoint_hit_counts():
+    cpu, debugger = make_cpu(), Debugger()
+    debugger.add_watchpoint(8)
+    debugger.add_watchpoint(16)
+
+    stops = run_stops(cpu, debugger)
+    # Every STUR writes address 8, and none writes 16
+    assert len(stops) == 101
+    assert all(result.status == RunResult.WATCHPOINT for result in stops[:-1])
+    assert all(result.instrs == 4 for result in stops[1:-1])
+    assert stops[-1].instrs == 2
+    assert debugger.hit is None
+    assert state(cpu) == state_at(INSTRS)
+
+    cpu = make_cpu()
+    executed = 0
+    for _ in range(3):
+        executed += cpu.run(debug=debugger).instrs
+        assert debugger.hit == (RunResult.WATCHPOINT, 4, 8)
+        assert state(cpu) == state_at(executed)
+    assert executed == 10
+
+def test_breakpoint_on_watched_store():
+    cpu, debugger = make_cpu(), Debugger()
+    debugger.add_breakpoint(4)
+    debugger.add_watchpoint(8)
+
+    stops = run_stops(cpu, debugger)
+    # Each STUR first stops at the breakpoint, then at the watchpoint once
+    # it has executed
+    expected = [RunResult.BREAKPOINT, RunResult.WATCHPOINT] * 100 + [RunResult.HALTED]
+    assert [result.status for result in stops] == expected
+    assert sum(result.instrs for result in stops) == INSTRS
+    assert state(cpu) == state_at(INSTRS)
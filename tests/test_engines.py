@@ -0,0 +1,185 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+import bench
+from cpu import CPU
+
+# Differential test of the execution engines: every engine must leave a
+# CPU in the state reached by executing one instruction at a time with
+# run_instr, after the same number of instructions, or raise the same
+# exception from the same state.
+
+try:
+    from batch import BatchCPU
+except ImportError:
+    BatchCPU = None
+
+# Instructions single-stepped before a program is considered not to halt
+MAX_STEPS = 2_000
+
+LIMITS = [0, 1, 2, 3, 5, 8, 13, 100, 1_000]
+
+def random_reg(rng: random.Random) -> str:
+    return rng.choice(['X0', 'X1', 'X2', 'X3', 'X4', 'X5', 'XZR'])
+
+def random_instr(rng: random.Random) -> str:
+    XA, XB, XC = random_reg(rng), random_reg(rng), random_reg(rng)
+    kind = rng.randrange(9)
+    if kind == 0: return f"ADD {XA}, {XB}, {XC}"
+    if kind == 1: return f"SUB {XA}, {XB}, {XC}"
+    if kind == 2: return f"LDUR {XA}, [{XB}, #{rng.choice([0, 8, 16, -8, 3])}]"
+    if kind == 3: return f"STUR {XA}, [{XB}, #{rng.choice([0, 8, 16, -8, 3])}]"
+    if kind == 4: return f"ADDI {XA}, {XB}, #{rng.choice([0, 1, 8, 16])}"
+    if kind == 5: return f"SUBI {XA}, {XB}, #{rng.choice([0, 1, 8])}"
+    if kind == 6: return f"B #{rng.randint(-3, 3)}"
+    if kind == 7: return f"CBZ {XA}, #{rng.randint(-3, 3)}"
+    return f"CBNZ {XA}, #{rng.randint(-4, 3)}"
+
+# Random program, sometimes ending with a counted loop that can be
+# fast-forwarded (see loops.py)
+def random_cpu(rng: random.Random) -> CPU:
+    code = [random_instr(rng) for _ in range(rng.randint(1, 8))]
+    if rng.random() < 0.5:
+        body = [rng.choice(['ADDI X1, X1, #8', 'ADD X3, X3, X4', 'SUB X5, X5, X4', 'ADDI X0, X4, #2'])]
+        body.append(f"SUBI X2, X2, #{rng.choice([1, 2])}")
+        rng.shuffle(body)
+        code += body + [f"CBNZ X2, #-{len(body)}"]
+
+    reg_config = { f'X{i}': rng.choice([0, 1, 2, 5, 8, 16, 24, 200]) for i in range(6) }
+    return CPU('random', code, reg_config=reg_config, randomize=False)
+
+def state(cpu: CPU) -> tuple:
+    return cpu.pc, list(cpu.registers), bytes(cpu.memory)
+
+# Returns (state, instructions, exception type) after run(cpu) on a fork
+def outcome(cpu: CPU, run) -> tuple:
+    cpu = cpu.fork()
+    try:
+        instrs, error = run(cpu), None
+    except Exception as e:
+        instrs, error = None, type(e)
+    return state(cpu), instrs, error
+
+def single_step(limit: int):
+    def run(cpu: CPU) -> int:
+        n = 0
+        while cpu.pc < len(cpu.decoded) * 4 and n < limit:
+            cpu.run_instr()
+            n += 1
+        return n
+    return run
+
+def run_batch(cpu: CPU, max_instrs: int = None) -> int:
+    batch = BatchCPU('batch', [cpu])
+    batch.run(max_instrs=max_instrs)
+    lane = batch.to_cpus()[0]
+    cpu.pc, cpu.registers, cpu.memory = lane.pc, lane.registers, lane.memory
+    if 0 in batch.errors: raise batch.errors[0]
+    return batch.instr_counts()[0]
+
+UNBOUNDED = {
+    'interp': lambda cpu: cpu.run(),
+    'interp, no fast-forward': lambda cpu: cpu.run(fast_forward=False),
+    'block': lambda cpu: cpu.run(engine='block'),
+}
+
+def bounded(limit: int) -> dict:
+    res = {
+        'bounded interp': lambda cpu: cpu.run(max_instrs=limit).instrs,
+        'bounded interp, no fast-forward': lambda cpu: cpu.run(max_instrs=limit, fast_forward=False).instrs,
+        'bounded block': lambda cpu: cpu.run(engine='block', max_instrs=limit).instrs,
+    }
+    # Every batch step costs several NumPy calls, so only short budgets
+    if BatchCPU is not None and limit <= 13:
+        res['bounded batch'] = lambda cpu: run_batch(cpu, limit)
+    return res
+
+def check_cpu(cpu: CPU) -> None:
+    for limit in LIMITS:
+        expected = outcome(cpu, single_step(limit))
+        for name, run in bounded(limit).items():
+            assert outcome(cpu, run) == expected, (name, limit, cpu.code)
+
+    expected = outcome(cpu, single_step(MAX_STEPS))
+    ref_state, _, error = expected
+    if error is None and ref_state[0] < len(cpu.decoded) * 4:
+        # Does not halt
+        return
+
+    for name, run in UNBOUNDED.items():
+        res_state, _, res_error = outcome(cpu, run)
+        assert (res_state, res_error) == (ref_state, error), (name, cpu.code)
+
+    if BatchCPU is not None:
+        assert outcome(cpu, run_batch) == expected, ('batch', cpu.code)
+
+def test_random_programs():
+    rng = random.Random(1)
+    for _ in range(500):
+        check_cpu(random_cpu(rng))
+
+# bench.check_engines compares the engines on these programs before timing
+# them, so it must agree with single-stepping
+def test_bench_programs():
+    for make_cpu in (bench.count_loop, bench.array_sum, bench.mem_copy, bench.branchy):
+        cpu = make_cpu(bench.CHECK_SCALE)
+        check_cpu(cpu)
+        bench.check_engines(cpu)
+
+        ref = cpu.fork()
+        instrs = single_step(10 ** 9)(ref)
+        for name, (digest, n) in bench.engine_results(cpu).items():
+            assert digest == ref.state_digest(), name
+            assert n in (None, instrs), name
+
+# Registers leaving [0, 2^64) are held with high words in BatchCPU
+@pytest.mark.skipif(BatchCPU is None, reason="needs NumPy")
+def test_batch_wide_registers():
+    programs = [
+        # Randomized array sums overflow in almost every lane
+        (bench.ARRAY_SUM, 'X1=16\nX2=5\nX3=48'),
+        # Negative base registers, and loads through them
+        (['SUBI X1, X1, #8', 'STUR X2, [X1, #16]', 'LDUR X3, [X1, #16]', 'SUB X4, X3, X2'], 'X1=0'),
+        # Bases in (-2^64, -2^64 + mem_size] have in range low words
+        (['LDUR X0, [X3, #8]', 'STUR X0, [X4, #0]'], 'X3=0\nX4=0'),
+        # Doubling until the high words pass HIGH_LIMIT
+        (['ADD X1, X1, X1', 'SUBI X2, X2, #1', 'CBNZ X2, #-2', 'CBZ X1, #2', 'ADDI X3, X3, #1'], 'X2=130'),
+    ]
+    for code, reg_config in programs:
+        cpus = CPU.random_batch('wide', code, 200, reg_config, seed=2)
+        cpus[0].registers[5] = -3
+        cpus[1].registers[6] = 2 ** 70
+        cpus[2].registers[7] = 2 ** 200
+        cpus[3].registers[3] = -(2 ** 64)
+        cpus[4].registers[4] = -(2 ** 64) + 8
+
+        batch = BatchCPU('wide', cpus)
+        batch.run()
+        for i, (lane, cpu) in enumerate(zip(batch.to_cpus(), cpus)):
+            expected = outcome(cpu, single_step(MAX_STEPS))
+            assert (state(lane), batch.instr_counts()[i]) == expected[:2], (code, i)
+
+    # Only the doubling program needs the scalar CPU
+    assert batch.wide_rate() == 1.0 and batch.fallback_rate() == 1.0
+
+# Lanes that never halt stop at the budget, without holding up the others
+@pytest.mark.skipif(BatchCPU is None, reason="needs NumPy")
+def test_batch_budget():
+    code = ['CBZ X1, #2', 'B #0', 'ADDI X2, X2, #1']
+    cpus = [CPU(i, code, reg_config=f'X1={x}', randomize=False) for i, x in enumerate([0, 1, 0, 5])]
+    batch = BatchCPU('budget', cpus)
+    batch.run(max_instrs=100)
+    assert batch.statuses() == ['halted', 'max_instrs', 'halted', 'max_instrs']
+    assert batch.instr_counts() == [2, 100, 2, 100]
+
+    # Lanes step in lockstep from the lowest PC, so the looping lanes also
+    # keep the others from halting until the deadline
+    batch = BatchCPU('budget', cpus)
+    batch.run(deadline=time.monotonic() + 0.05)
+    assert batch.statuses() == ['deadline'] * 4
@@ -0,0 +1,78 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import grader
+from grader import Grader
+
+# Every submission must be graded against the reference on every vector,
+# with a status telling how its run ended.
+
+REFERENCE = ['ADD X3, X1, X2', 'STUR X3, [XZR, #0]']
+VECTORS = [
+    { 'name': 'small', 'reg_config': 'X1=1\nX2=2', 'mem_size': 64 },
+    { 'name': 'random', 'reg_config': 'X1=5', 'seed': 7, 'mem_size': 64 },
+]
+
+SUBMISSIONS = {
+    'same': ['add x3,x1,x2', 'stur x3, [x31, #0]'],
+    'swapped': ['ADD X3, X2, X1', 'STUR X3, [XZR, #0]'],
+    'wrong': ['SUB X3, X1, X2', 'STUR X3, [XZR, #0]'],
+    'invalid': ['ADD X3, X1'],
+    'crash': ['LDUR X3, [XZR, #4]'],
+    # Loop whose state repeats
+    'spin': ['ADD X3, X1, X2', 'B #0'],
+}
+
+def grade(submissions: dict, **kwargs) -> dict:
+    results = Grader(REFERENCE, VECTORS, max_instrs=1000, workers=1, **kwargs).grade(submissions)
+    return { (r.submission, r.vector): r for r in results }
+
+def test_statuses():
+    results = grade(SUBMISSIONS)
+    assert len(results) == len(SUBMISSIONS) * len(VECTORS)
+
+    statuses = { name: { results[name, v['name']].status for v in VECTORS } for name in SUBMISSIONS }
+    assert statuses == {
+        'same': { grader.PASS },
+        'swapped': { grader.PASS },
+        'wrong': { grader.FAIL },
+        'invalid': { grader.INVALID },
+        'crash': { grader.ERROR },
+        'spin': { grader.LIMIT },
+    }
+
+    # Identical outcomes share a digest
+    for v in VECTORS:
+        assert results['same', v['name']].digest == results['swapped', v['name']].digest != ""
+    assert results['spin', 'small'].instrs == 1000
+
+def test_detect_loops():
+    results = grade({ 'spin': SUBMISSIONS['spin'] }, detect_loops=True)
+    assert all(r.status == grader.LOOP and r.instrs < 1000 for r in results.values())
+
+def test_main_cache(tmp_path, capsys):
+    reference = tmp_path / 'reference.s'
+    reference.write_text("\n".join(REFERENCE))
+    submissions = tmp_path / 'submissions'
+    submissions.mkdir()
+    for name in ('same', 'wrong'):
+        (submissions / name).write_text("\n".join(SUBMISSIONS[name]))
+    vectors = tmp_path / 'vectors.json'
+    vectors.write_text('[{"reg_config": "X1=1\\nX2=2", "mem_size": 64}]')
+    cache = tmp_path / 'cache'
+
+    args = [str(reference), str(submissions), str(vectors), '--workers', '1', '--cache', str(cache)]
+    rows = []
+    for _ in range(2):
+        grader.main(args)
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0] == grader.HEADER
+        # Every column but the time taken
+        rows.append(sorted(tuple(line.split('\t')[:3] + line.split('\t')[5:]) for line in lines[1:]))
+
+    # Cached results are graded the same as emulated ones
+    assert rows[0] == rows[1]
+    assert [row[2] for row in rows[0]] == [grader.PASS, grader.FAIL]
+    assert len(os.listdir(cache)) == 2
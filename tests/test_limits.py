@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU, RunResult
+
+# Bounded runs must stop at max_instrs or the deadline, and detect_loops
+# must stop programs whose state repeats but not programs that halt.
+
+def make_cpu(code: list[str], reg_config: str = "") -> CPU:
+    return CPU('limits', code, reg_config=reg_config, randomize=False, mem_size=64)
+
+@pytest.mark.parametrize('code', [
+    ['B #0'],
+    # Two-instruction cycle
+    ['ADDI X1, X1, #0', 'B #-1'],
+    # Cycle through a store of an unchanging value
+    ['STUR X2, [XZR, #8]', 'CBZ XZR, #-1'],
+])
+def test_detect_loops(code: list[str]):
+    result = make_cpu(code).run(detect_loops=True)
+    assert result.status == RunResult.LOOP
+    assert result.instrs < 100
+
+# Loops that change the state every iteration are not cycles
+def test_detect_loops_halting():
+    code = ['ADDI X1, X1, #1', 'SUBI X2, X2, #1', 'CBNZ X2, #-2']
+    cpu, ref = make_cpu(code, 'X2=1000'), make_cpu(code, 'X2=1000')
+    result = cpu.run(detect_loops=True)
+    ref.run()
+    assert (result.status, result.instrs) == (RunResult.HALTED, 3000)
+    assert cpu == ref
+
+    # Counting up until the register wraps would take 2^64 iterations
+    result = make_cpu(['ADDI X1, X1, #1', 'B #-1']).run(detect_loops=True, max_instrs=10_000)
+    assert (result.status, result.instrs) == (RunResult.MAX_INSTRS, 10_000)
+
+@pytest.mark.parametrize('engine', ['interp', 'block'])
+def test_max_instrs_and_deadline(engine: str):
+    result = make_cpu(['B #0']).run(engine=engine, max_instrs=1000)
+    assert (result.status, result.instrs) == (RunResult.MAX_INSTRS, 1000)
+
+    result = make_cpu(['B #0']).run(engine=engine, deadline=time.monotonic() + 0.05)
+    assert result.status == RunResult.DEADLINE
@@ -0,0 +1,92 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cpu import CPU
+from memory import PAGE_SIZE
+
+# Equal CPU states must get equal state digests, whether their memory is
+# flat or paged, and whatever seed filled a paged memory.
+
+CODE = ['ADDI X1, X1, #1']
+
+def same_registers(*cpus: CPU) -> None:
+    for cpu in cpus[1:]:
+        cpu.registers[:] = cpus[0].registers
+
+def assert_same_digest(a: CPU, b: CPU) -> None:
+    assert a == b
+    assert a.state_digest() == b.state_digest()
+
+def test_zero_paged_and_flat():
+    paged = CPU(0, CODE, randomize=False, mem_size=4 * PAGE_SIZE, paged=True)
+    flat = CPU(0, CODE, randomize=False, mem_size=4 * PAGE_SIZE)
+    assert_same_digest(paged, flat)
+
+    for cpu in (paged, flat):
+        cpu.set_double_word(PAGE_SIZE + 8, 5)
+        # Touches a page, leaving it all zeros
+        cpu.set_double_word(3 * PAGE_SIZE, 0)
+    assert_same_digest(paged, flat)
+
+def test_different_seeds_all_pages_touched():
+    a = CPU(0, CODE, mem_size=2 * PAGE_SIZE, paged=True, seed=1)
+    b = CPU(0, CODE, mem_size=2 * PAGE_SIZE, paged=True, seed=2)
+    same_registers(a, b)
+    assert a.state_digest() != b.state_digest()
+
+    contents = bytes(range(256)) * (2 * PAGE_SIZE // 256)
+    a.memory[0:2 * PAGE_SIZE] = contents
+    b.memory[0:2 * PAGE_SIZE] = contents
+    assert_same_digest(a, b)
+
+def test_randomized_paged_and_flat():
+    paged = CPU(0, CODE, mem_size=3 * PAGE_SIZE + 64, paged=True, seed=3)
+    flat = CPU(0, CODE, randomize=False, mem_size=3 * PAGE_SIZE + 64)
+    same_registers(paged, flat)
+
+    digest = paged.state_digest()
+    # Digesting does not allocate pages
+    assert paged.memory.touched() == []
+
+    flat.memory[:] = paged.memory[0:paged.mem_size]
+    assert_same_digest(paged, flat)
+    assert digest == flat.state_digest()
+
+    flat.set_double_word(PAGE_SIZE, 1)
+    assert paged != flat
+    assert paged.state_digest() != flat.state_digest()
+
+def test_large_randomized_paged():
+    a = CPU(0, CODE, mem_size=2 ** 40, paged=True, seed=4)
+    b = a.fork()
+    # Touches a page of b without changing its contents
+    b.set_double_word(PAGE_SIZE, b.get_double_word(PAGE_SIZE))
+    assert_same_digest(a, b)
+
+    b.set_double_word(8, a.get_double_word(8) ^ 1)
+    assert a.state_digest() != b.state_digest()
+
+def test_reads_do_not_change_digest():
+    for mem_size in (3 * PAGE_SIZE, 2 ** 25):
+        paged = CPU(0, CODE, mem_size=mem_size, paged=True, seed=1)
+        digest = paged.state_digest()
+
+        paged.memory[0:mem_size]
+        paged.get_double_word(PAGE_SIZE)
+        # Reads do not allocate pages
+        assert paged.memory.touched() == []
+        assert paged.state_digest() == digest
+
+def test_equal_flat_and_randomized_paged():
+    paged = CPU(0, CODE, mem_size=4 * PAGE_SIZE, paged=True, seed=5)
+    flat = CPU(0, CODE, mem_size=4 * PAGE_SIZE, seed=6)
+    same_registers(paged, flat)
+    flat.memory[:] = paged.memory[0:paged.mem_size]
+    assert paged.memory.touched() == []
+    assert_same_digest(paged, flat)
+
+    paged.set_double_word(2 * PAGE_SIZE, 7)
+    flat.set_double_word(2 * PAGE_SIZE, 7)
+    assert_same_digest(paged, flat)
@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cpu import CPU
+from profiler import Profiler
+
+# A profiled run must leave the CPU in the state of an unprofiled run, and
+# count every instruction, branch outcome and memory access.
+
+# Loop of 4 instructions run 3 times, between two straight-line parts
+CODE = [
+    'ADDI X2, XZR, #16',
+    'ADDI X1, XZR, #3',
+    'STUR X1, [X2, #0]',
+    'LDUR X3, [X2, #0]',
+    'SUBI X1, X1, #1',
+    'CBNZ X1, #-3',
+    'CBZ X1, #1',
+]
+
+def make_cpu() -> CPU:
+    return CPU('profile', CODE, randomize=False, mem_size=64)
+
+def test_counts():
+    cpu, ref = make_cpu(), make_cpu()
+    profiler = Profiler()
+    result = cpu.run(profile=profiler)
+    ref.run()
+    assert cpu == ref and cpu.pc == ref.pc
+    assert result.halted() and result.instrs == 15
+
+    assert profiler.counts == [1, 1, 3, 3, 3, 3, 1]
+    assert profiler.total() == 15
+    assert (profiler.taken, profiler.not_taken) == ({ 5: 2, 6: 1 }, { 5: 1 })
+    assert (profiler.loads, profiler.stores) == ({ 16: 3 }, { 16: 3 })
+    assert profiler.type_counts(cpu) == { 'R_TYPE': 0, 'D_TYPE': 6, 'I_TYPE': 5, 'B_TYPE': 0, 'CB_TYPE': 4 }
+
+def test_hot_loops_report():
+    cpu = make_cpu()
+    profiler = Profiler()
+    cpu.run(profile=profiler)
+
+    # Forward branches do not close loops
+    assert profiler.hot_loops(cpu) == [(2, 5, 12)]
+    # The body runs once more than the back-edge is taken
+    assert "loop 1: PC 8-20, 3 iterations, 12 instructions" in profiler.report(cpu)
+
+def test_accumulates_until_reset():
+    profiler = Profiler()
+    make_cpu().run(profile=profiler)
+    make_cpu().run(profile=profiler)
+    assert profiler.total() == 30
+
+    profiler.reset()
+    assert profiler.total() == 0 and profiler.taken == {}
+
+def test_max_instrs():
+    cpu = make_cpu()
+    profiler = Profiler()
+    result = cpu.run(profile=profiler, max_instrs=5)
+    assert (result.status, result.instrs) == ('max_instrs', 5)
+    assert profiler.total() == 5
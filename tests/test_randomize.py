@@ -0,0 +1,55 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cpu import CPU
+
+# Randomized states must be reproducible from their seed, differ between
+# seeds, keep XZR at 0 and leave configured values in place.
+
+CODE = ['ADDI X1, X1, #1']
+
+def state(cpu: CPU) -> tuple:
+    return list(cpu.registers), bytes(cpu.memory[0:cpu.mem_size])
+
+def test_seeded_cpu():
+    a = CPU('a', CODE, seed=1)
+    assert state(a) == state(CPU('b', CODE, seed=1))
+    assert state(a) != state(CPU('c', CODE, seed=2))
+
+    assert a.registers[31] == 0
+    assert all(0 <= r < 2 ** 64 for r in a.registers)
+    assert len(set(a.registers[:31])) == 31
+
+    # A random.Random is drawn from, like the seed it was made with
+    assert state(CPU('d', CODE, seed=random.Random(1))) == state(a)
+
+def test_seeded_paged_cpu():
+    a = CPU('a', CODE, mem_size=4096 * 4, paged=True, seed=3)
+    b = CPU('b', CODE, mem_size=4096 * 4, paged=True, seed=3)
+    assert state(a) == state(b)
+    assert state(a) != state(CPU('c', CODE, mem_size=4096 * 4, paged=True, seed=4))
+
+def test_configs_applied_after_randomizing():
+    cpu = CPU('config', CODE, reg_config='X1=5', mem_config='[8]=7', seed=5)
+    assert cpu.registers[1] == 5
+    assert cpu.get_double_word(8) == 7
+
+def test_random_batch():
+    cpus = CPU.random_batch('batch', CODE, 8, 'X2=9', '[16]=3', mem_size=64, seed=6)
+    again = CPU.random_batch('batch', CODE, 8, 'X2=9', '[16]=3', mem_size=64, seed=6)
+    assert [state(cpu) for cpu in cpus] == [state(cpu) for cpu in again]
+    assert [cpu.id for cpu in cpus] == [('batch', i) for i in range(8)]
+
+    # Every CPU has its own registers and memory
+    assert len({ tuple(cpu.registers) for cpu in cpus }) == 8
+    assert len({ bytes(cpu.memory) for cpu in cpus }) == 8
+    for cpu in cpus:
+        assert cpu.registers[2] == 9 and cpu.registers[31] == 0
+        assert cpu.get_double_word(16) == 3
+
+    cpus[0].run()
+    assert cpus[0].registers[1] == again[0].registers[1] + 1
+    assert cpus[1].registers == again[1].registers
@@ -0,0 +1,101 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU
+
+# The bulk, incremental renderer must print exactly what the original
+# per-byte str_hex / str_dec printed, including for registers outside
+# [0, 2^64), and re-rendering after changes must match a fresh render.
+
+CODE = ['ADDI X1, X1, #1']
+
+# The original renderers, for the default 256-byte memory
+def pad_left(data, length: int) -> str:
+    data_str = str(data)
+    if len(data_str) >= length: return data_str[:length]
+    return ' ' * (length - len(data_str)) + data_str
+
+def pad_hex(number: int, length: int) -> str:
+    num_bits = length * 4
+    if number < 0: number = (1 << num_bits) + number
+    hex_str = hex(number & ((1 << num_bits) - 1))[2:].zfill(num_bits // 4).upper()
+    return ' '.join(hex_str[i:i + 2] for i in range(0, len(hex_str), 2))
+
+def twos_comp(n: int) -> int:
+    if n > 0x7FFFFFFFFFFFFFFF: return -1 * ((n ^ 0xFFFFFFFFFFFFFFFF) + 1)
+    return n
+
+def old_render(cpu: CPU, hex_mode: bool) -> str:
+    mem = list(cpu.memory)
+    half = cpu.mem_size // 2
+    res = f"\nCPU ID: {cpu.id} {'-' * (65 - len(str(cpu.id)))}\n\nPC = {cpu.pc}\n\nRegisters:\n"
+    for i in range(16):
+        r1, r2 = cpu.registers[i], cpu.registers[i + 16]
+        if hex_mode: v1, v2 = pad_hex(r1, 16), pad_hex(r2, 16)
+        else: v1, v2 = pad_left(twos_comp(r1), 23), pad_left(twos_comp(r2), 23)
+        res += f"\t{pad_left(f'X{i}', 4)}: {v1}\t||   {pad_left(f'X{i + 16}', 3)}: {v2}\n"
+
+    res += "\nData Memory:\n"
+    for i in range(0, half, 8):
+        if hex_mode:
+            d1 = ' '.join(pad_hex(mem[i + j], 2) for j in range(8))
+            d2 = ' '.join(pad_hex(mem[half + i + j], 2) for j in range(8))
+            res += f"\t{pad_left(i, 4)}: {d1}   ||  {pad_left(half + i, 4)}: {d2}\n"
+        else:
+            n1 = twos_comp(int.from_bytes(bytes(mem[i:i + 8]), 'big'))
+            n2 = twos_comp(int.from_bytes(bytes(mem[half + i:half + i + 8]), 'big'))
+            res += f"\t{pad_left(i, 4)}: {pad_left(n1, 23)}\t||   {pad_left(half + i, 4)}: {pad_left(n2, 23)}\n"
+    res += f"\n{'-' * 74}\n\n"
+    return res
+
+def make_cpu() -> CPU:
+    cpu = CPU('render', CODE, seed=1)
+    cpu.registers[1] = -3
+    cpu.registers[2] = -(2 ** 63)
+    cpu.registers[3] = 2 ** 64
+    cpu.registers[4] = 2 ** 64 + 5
+    cpu.registers[5] = 2 ** 200
+    cpu.registers[6] = -(2 ** 100)
+    cpu.registers[7] = 2 ** 63
+    return cpu
+
+@pytest.mark.parametrize('hex_mode', [True, False])
+def test_matches_original(hex_mode: bool):
+    cpu = make_cpu()
+    render = CPU.str_hex if hex_mode else CPU.str_dec
+    assert render(cpu) == old_render(cpu, hex_mode)
+
+    # Incremental re-render after changes to registers and memory
+    cpu.run()
+    cpu.registers[8] = -(2 ** 70)
+    cpu.set_double_word(128, 2 ** 63 + 1)
+    cpu.set_double_word(0, 7)
+    assert render(cpu) == old_render(cpu, hex_mode)
+
+def test_switching_modes():
+    cpu = make_cpu()
+    for hex_mode in (True, False, True):
+        cpu.set_print_mode(hex_mode)
+        assert str(cpu) == old_render(cpu, hex_mode)
+
+def test_str_memory():
+    cpu = make_cpu()
+    rows = old_render(cpu, True).split("Data Memory:\n")[1].splitlines(keepends=True)[:16]
+    assert cpu.str_memory() == ''.join(rows)
+    assert cpu.str_memory(3, 7) == ''.join(rows[3:7])
+
+    # The chunk cache is refreshed when memory changes
+    cpu.set_double_word(40, 0)
+    assert cpu.str_memory(5, 6) == f"\t{'40': >4}: {'00 ' * 7}00   ||  {'168': >4}: {pad_hex(cpu.get_double_word(168), 16)}\n"
+
+def test_paged_touched_pages():
+    cpu = CPU('paged', CODE, randomize=False, mem_size=2 ** 20, paged=True)
+    cpu.set_double_word(4096 + 16, 5)
+    rows = cpu.str_memory().splitlines()
+    # Only the touched page, as rows of two adjacent double words
+    assert len(rows) == 4096 // 16
+    assert rows[1].split() == ['4112:', '00', '00', '00', '00', '00', '00', '00', '05', '||', '4120:'] + ['00'] * 8
@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from cpu import CPU
+from results import ResultsCache, canonical_code
+
+# Runs of the same canonical program from the same initial state and
+# limits must be answered from the cache, with the result of the first
+# run, and anything else must miss.
+
+CODE = ['ADDI X1, X1, #1', 'SUBI X2, X2, #1', 'CBNZ X2, #-2']
+SPELLED = ['addi x1,x1,#1', '  SUBI  X2, X2, #1', 'cbnz x2 , #-2']
+
+def make_cpu(code: list[str], reg_config: str = 'X2=5') -> CPU:
+    return CPU('results', code, reg_config=reg_config, randomize=False)
+
+def test_equivalent_spellings():
+    assert canonical_code(SPELLED) == canonical_code(CODE)
+    assert canonical_code(['add x1,x31,xzr']) == ['ADD X1, XZR, XZR']
+    assert ResultsCache.key(make_cpu(SPELLED)) == ResultsCache.key(make_cpu(CODE))
+
+    # Different state or limits give different keys
+    assert ResultsCache.key(make_cpu(CODE, 'X2=6')) != ResultsCache.key(make_cpu(CODE))
+    assert ResultsCache.key(make_cpu(CODE), max_instrs=10) != ResultsCache.key(make_cpu(CODE))
+
+def test_canonical_code_is_a_copy():
+    canonical_code(CODE).append('B #0')
+    assert canonical_code(CODE) == ['ADDI X1, X1, #1', 'SUBI X2, X2, #1', 'CBNZ X2, #-2']
+
+def test_hits_and_misses():
+    cache = ResultsCache()
+    first = make_cpu(CODE)
+    result = cache.run(first)
+    assert not result.hit and result.status == 'halted'
+    assert result.digest == first.state_digest()
+
+    # A hit leaves the CPU unchanged
+    second = make_cpu(SPELLED)
+    initial = second.state_digest()
+    hit = cache.run(second)
+    assert hit.hit and hit.to_json() == result.to_json()
+    assert second.state_digest() == initial
+
+    assert not cache.run(make_cpu(CODE, 'X2=6')).hit
+    assert not cache.run(make_cpu(CODE), max_instrs=4).hit
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_disk_tier(tmp_path):
+    ResultsCache(str(tmp_path)).run(make_cpu(CODE))
+
+    # A new cache over the same directory, e.g. in a later session
+    cache = ResultsCache(str(tmp_path))
+    assert cache.disk_bytes > 0
+    assert cache.run(make_cpu(SPELLED)).hit
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU, RunResult
+from scheduler import AsyncScheduler, Job, Scheduler
+
+# CPUs interleaved by a scheduler must reach the same final states as
+# CPUs run one after the other, whatever the quantum.
+
+LOOP = ['ADDI X2, X2, #3', 'SUBI X1, X1, #1', 'CBNZ X1, #-2']
+
+def make_cpus() -> list[CPU]:
+    return [
+        CPU('long', LOOP, reg_config='X1=50', randomize=False),
+        CPU('short', LOOP, reg_config='X1=2', randomize=False),
+        CPU('store', ['ADDI X1, XZR, #8', 'STUR X1, [X1, #0]', 'LDUR X3, [X1, #0]'], randomize=False),
+    ]
+
+@pytest.mark.parametrize('quantum', [1, 2, 7, 10_000])
+@pytest.mark.parametrize('engine', ['interp', 'block'])
+def test_interleaved_states(quantum: int, engine: str):
+    expected = make_cpus()
+    for cpu in expected: cpu.run()
+
+    scheduler = Scheduler(quantum, engine)
+    cpus = make_cpus()
+    jobs = [scheduler.add(cpu) for cpu in cpus]
+    finished = scheduler.run()
+
+    assert sorted(finished, key=jobs.index) == jobs
+    for job, cpu, ref in zip(jobs, cpus, expected):
+        assert job.status == RunResult.HALTED
+        assert cpu == ref and cpu.pc == ref.pc
+    assert [job.instrs for job in jobs] == [150, 6, 3]
+
+# With a small quantum, short programs finish before long ones
+def test_round_robin_order():
+    scheduler = Scheduler(quantum=4)
+    jobs = [scheduler.add(cpu) for cpu in make_cpus()]
+    assert [job.cpu.id for job in scheduler.run()] == ['store', 'short', 'long']
+    assert all(job.done() for job in jobs)
+
+def test_budget_and_errors():
+    scheduler = Scheduler(quantum=3)
+    spin = scheduler.add(CPU('spin', ['B #0'], randomize=False), budget=10)
+    crash = scheduler.add(CPU('crash', ['ADDI X1, XZR, #4', 'LDUR X2, [X1, #0]'], randomize=False))
+    empty = scheduler.add(CPU('empty', ['B #0'], randomize=False), budget=0)
+
+    finished = scheduler.run()
+    assert finished[0] is empty and set(finished) == { spin, crash, empty }
+    assert (spin.status, spin.instrs) == (RunResult.MAX_INSTRS, 10)
+    assert crash.status == Job.ERROR and isinstance(crash.error, ValueError)
+    assert (empty.status, empty.instrs) == (RunResult.MAX_INSTRS, 0)
+
+def test_invalid_quantum():
+    with pytest.raises(ValueError):
+        Scheduler(quantum=0)
+
+def test_run_for():
+    cpu = CPU('run_for', LOOP, reg_config='X1=5', randomize=False)
+    results = [cpu.run_for(4)]
+    while not results[-1].halted(): results.append(cpu.run_for(4))
+    assert [(r.status, r.instrs) for r in results] == [('yielded', 4)] * 3 + [('halted', 3)]
+    assert cpu.registers[2] == 15
+
+    with pytest.raises(ValueError):
+        cpu.run_for(-1)
+
+def test_async_scheduler():
+    async def main() -> list[Job]:
+        scheduler = AsyncScheduler(quantum=5)
+        server = asyncio.create_task(scheduler.serve())
+        try:
+            return await asyncio.gather(*(scheduler.submit(cpu) for cpu in make_cpus()))
+        finally:
+            server.cancel()
+
+    expected = make_cpus()
+    for cpu in expected: cpu.run()
+    jobs = asyncio.run(main())
+    for job, ref in zip(jobs, expected):
+        assert job.status == RunResult.HALTED
+        assert job.cpu == ref and job.finished.is_set()
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from service import GradingService, check_job, make_server
+
+# Malformed jobs must be rejected by check_job with a ValueError, and by
+# the service with a 400 response, before anything is queued.
+
+MALFORMED = [
+    [],
+    'ADDI X1, X1, #1',
+    {},
+    { 'reg_config': 'X1=1' },
+    { 'code': 5 },
+    { 'code': ['ADDI X1, X1, #1', 7] },
+    { 'code': 'B #1', 'reg_config': 3 },
+    { 'code': 'B #1', 'reg_config': { 'X1': '1' } },
+    { 'code': 'B #1', 'reg_config': [1, 2.5] },
+    { 'code': 'B #1', 'mem_config': { 'x': 1 } },
+    { 'code': 'B #1', 'mem_config': { '8': None } },
+    { 'code': 'B #1', 'mem_config': [8] },
+    { 'code': 'B #1', 'seed': '1' },
+    { 'code': 'B #1', 'mem_size': 1.5 },
+    { 'code': 'B #1', 'max_instrs': True },
+    { 'code': 'B #1', 'max_instrs': '100' },
+    { 'code': 'B #1', 'timeout': '1' },
+    { 'code': 'B #1', 'detect_loops': 1 },
+    { 'code': 'B #1', 'engine': 'jit' },
+    { 'code': 'B #1', 'engine': [] },
+]
+
+@pytest.mark.parametrize('job', MALFORMED)
+def test_check_job_malformed(job):
+    with pytest.raises(ValueError):
+        check_job(job)
+
+def test_check_job_converts_keys():
+    job = { 'code': 'B #1', 'reg_config': { '1': 5, 'X2': 6 }, 'mem_config': { '8': 1 }, 'timeout': 2 }
+    checked = check_job(job)
+    assert checked['reg_config'] == { 1: 5, 'X2': 6 }
+    assert checked['mem_config'] == { 8: 1 }
+    # The submitted job is not modified
+    assert job['mem_config'] == { '8': 1 }
+
+@pytest.fixture(scope='module')
+def url():
+    service = GradingService(workers=1)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+# Returns (status code, response body)
+def post(url: str, data: bytes) -> tuple:
+    request = urllib.request.Request(url, data=data, headers={ 'Content-Type': 'application/json' })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+@pytest.mark.parametrize('path', ['/run', '/jobs'])
+def test_malformed_jobs_rejected(url: str, path: str):
+    for job in MALFORMED:
+        code, body = post(url + path, json.dumps(job).encode())
+        assert code == 400, job
+        assert 'error' in body
+
+    # Not JSON
+    assert post(url + path, b'{"code": ')[0] == 400
+
+    with urllib.request.urlopen(url + '/metrics') as response:
+        assert json.load(response)['submitted'] == 0
+
+def test_valid_job(url: str):
+    code, body = post(url + '/run', json.dumps({ 'code': ['ADDI X1, X1, #1'] }).encode())
+    assert code == 200
+    assert body['status'] != 'invalid'
+
+# Unfetched results are forgotten result_ttl seconds after the job finishes
+def test_unfetched_results_evicted():
+    service = GradingService(workers=1, result_ttl=0.1)
+    try:
+        first = service.enqueue({ 'code': ['ADDI X1, X1, #1'] })
+        while not service.finished: time.sleep(0.01)
+        time.sleep(0.1)
+
+        second = service.enqueue({ 'code': ['ADDI X1, X1, #1'] })
+        with pytest.raises(KeyError):
+            service.result(first)
+        while service.result(second)['status'] == 'queued': time.sleep(0.01)
+        assert service.jobs == {}
+    finally:
+        service.shutdown()
@@ -0,0 +1,81 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU
+from memory import PAGE_SIZE
+
+# restore() must bring back exactly the state a snapshot was taken in,
+# however the CPU ran since, and a fork must not share writes with the CPU
+# it was forked from, for flat and paged memory.
+
+CODE = [
+    'ADDI X1, X1, #8',
+    'STUR X1, [X1, #0]',
+    'LDUR X2, [X1, #0]',
+    'SUBI X3, X3, #1',
+    'CBNZ X3, #-4',
+]
+
+def make_cpu(paged: bool) -> CPU:
+    return CPU('snapshot', CODE, reg_config='X1=0\nX3=6', mem_size=2 * PAGE_SIZE, paged=paged, seed=1)
+
+def state(cpu: CPU) -> tuple:
+    return cpu.pc, list(cpu.registers), bytes(cpu.memory[0:cpu.mem_size])
+
+@pytest.mark.parametrize('paged', [False, True])
+def test_restore(paged: bool):
+    cpu = make_cpu(paged)
+    cpu.run(max_instrs=7)
+    before = state(cpu)
+    snapshot = cpu.snapshot()
+
+    cpu.run()
+    cpu.set_double_word(PAGE_SIZE, 5)
+    assert state(cpu) != before
+
+    cpu.restore(snapshot)
+    assert state(cpu) == before
+    # Restoring again gives the same state, even after running from it
+    cpu.run()
+    cpu.restore(snapshot)
+    assert state(cpu) == before
+    assert cpu.snapshot() == snapshot
+
+    cpu.run()
+    ref = make_cpu(paged)
+    ref.run()
+    assert state(cpu) == state(ref)
+
+@pytest.mark.parametrize('paged', [False, True])
+def test_fork_isolation(paged: bool):
+    parent = make_cpu(paged)
+    parent.run(max_instrs=4)
+    before = state(parent)
+
+    child = parent.fork('child')
+    assert child.id == 'child' and state(child) == before
+    child.run()
+    child.set_double_word(PAGE_SIZE + 8, 9)
+    child.registers[5] = 1
+    assert state(parent) == before
+
+    # Writes by the parent do not reach the child either
+    after = state(child)
+    parent.set_double_word(8, 3)
+    parent.registers[6] = 2
+    assert state(child) == after
+
+def test_snapshot_hashable():
+    cpu = make_cpu(False)
+    first = cpu.snapshot()
+    cpu.run(max_instrs=3)
+    snapshots = { first, cpu.snapshot(), cpu.snapshot() }
+    assert len(snapshots) == 2
+    assert { first: 'start' }[make_cpu(False).snapshot()] == 'start'
+
+    with pytest.raises(AttributeError):
+        first.pc = 4
@@ -0,0 +1,127 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU
+from timetravel import Recorder, RECORD_BYTES
+
+# Going back with a Recorder must reach exactly the state single-stepping
+# reaches after the same number of instructions, whether it undoes records
+# or re-executes from a checkpoint.
+
+# 4 instructions per iteration, 400 in total
+CODE = [
+    'ADDI X1, X1, #1',
+    'STUR X1, [X2, #0]',
+    'SUBI X3, X3, #1',
+    'CBNZ X3, #-3',
+]
+INSTRS = 400
+
+def make_cpu() -> CPU:
+    return CPU('tt', CODE, reg_config='X2=8\nX3=100', randomize=False, mem_size=64)
+
+def state(cpu: CPU) -> tuple:
+    return cpu.pc, list(cpu.registers), bytes(cpu.memory)
+
+# State after the first n instructions
+def state_at(n: int) -> tuple:
+    cpu = make_cpu()
+    for _ in range(n): cpu.run_instr()
+    return state(cpu)
+
+def record(recorder: Recorder) -> CPU:
+    cpu = make_cpu()
+    assert cpu.run(record=recorder).instrs == INSTRS
+    return cpu
+
+def test_step_back():
+    recorder = Recorder(checkpoint_interval=50)
+    cpu = record(recorder)
+    assert state(cpu) == state_at(INSTRS)
+
+    for n in range(INSTRS - 1, INSTRS - 10, -1):
+        recorder.step_back()
+        assert recorder.n == n
+        assert state(cpu) == state_at(n)
+
+    recorder.step_back(7)
+    assert state(cpu) == state_at(INSTRS - 16)
+
+    # Recording continues from the restored state
+    cpu.run(record=recorder)
+    assert recorder.n == INSTRS
+    assert state(cpu) == state_at(INSTRS)
+
+def test_go_back_to_checkpoints():
+    recorder = Recorder(checkpoint_interval=10)
+    cpu = record(recorder)
+    for n in [INSTRS, 395, 251, 250, 40, 7, 0]:
+        recorder.go_back_to(n)
+        assert recorder.n == n
+        assert state(cpu) == state_at(n)
+
+    # The recorder does not go forward
+    with pytest.raises(ValueError):
+        recorder.go_back_to(1)
+
+# A small max_bytes keeps 32 undo records and the 3 newest checkpoints
+def test_go_back_to_across_cap():
+    snapshot_bytes = 64 + 32 * 40
+    max_bytes = 2 * max(32 * RECORD_BYTES, 3 * snapshot_bytes + 1)
+    recorder = Recorder(checkpoint_interval=25, max_bytes=max_bytes)
+    cpu = record(recorder)
+
+    assert len(recorder.records) == 32
+    assert [n for n, _ in recorder.checkpoints] == [350, 375, 400]
+
+    # Within the undo records
+    recorder.go_back_to(380)
+    assert state(cpu) == state_at(380)
+
+    # Before the oldest undo record, from the checkpoint at 350
+    recorder.go_back_to(355)
+    assert state(cpu) == state_at(355)
+    assert [n for n, _ in recorder.checkpoints] == [350]
+    recorder.step_back(5)
+    assert state(cpu) == state_at(350)
+
+    # Before the oldest checkpoint
+    with pytest.raises(ValueError):
+        recorder.go_back_to(349)
+    assert state(cpu) == state_at(350)
+
+    cpu.run(record=recorder)
+    assert state(cpu) == state_at(INSTRS)
+
+# Keeps 52 undo records and all 5 checkpoints
+def test_run_back_to_and_last_write():
+    recorder = Recorder(checkpoint_interval=100, max_bytes=10 * (64 + 32 * 40))
+    cpu = record(recorder)
+    assert len(recorder.records) == 52 and len(recorder.checkpoints) == 5
+
+    # The last STUR is instruction 397, before the final SUBI and CBNZ
+    assert recorder.last_write(8) == (397, 4)
+    assert recorder.last_write(15) == (397, 4)
+    assert recorder.last_write(16) is None
+
+    assert recorder.run_back_to(8) == 2
+    assert recorder.n == 398
+    assert state(cpu) == state_at(398)
+
+    assert recorder.run_back_to(0) == 2
+    assert state(cpu) == state_at(396)
+
+    # Going back to 200 restores the checkpoint there, clearing the undo
+    # records, so pc 12 is found by re-executing from the checkpoint at 100
+    recorder.go_back_to(200)
+    assert recorder.run_back_to(12) == 1
+    assert state(cpu) == state_at(199)
+
+    # Not executed before instruction 1
+    recorder.go_back_to(1)
+    assert recorder.run_back_to(12) is None
+    assert state(cpu) == state_at(1)
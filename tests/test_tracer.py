@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from cpu import CPU
+from tracer import Tracer, diff_traces, read_trace
+
+# A traced run must leave the CPU in the state of an untraced run, and
+# write one record per instruction that reads back unchanged.
+
+CODE = [
+    'ADDI X1, X1, #5',
+    'STUR X1, [X2, #8]',
+    'LDUR X3, [X2, #8]',
+    'SUBI X1, X1, #1',
+    'CBNZ X1, #-3',
+]
+
+def make_cpu(reg_config: str = 'X2=0') -> CPU:
+    return CPU('trace', CODE, reg_config=reg_config, randomize=False, mem_size=64)
+
+@pytest.mark.parametrize('name', ['trace.jsonl', 'trace.jsonl.gz'])
+def test_round_trip(tmp_path, name: str):
+    path = str(tmp_path / name)
+    cpu, ref = make_cpu(), make_cpu()
+    result = cpu.run(trace=Tracer(path))
+    ref.run()
+    assert cpu == ref
+    assert result.halted() and result.instrs == 21
+
+    records = list(read_trace(path))
+    assert len(records) == 21
+    assert [record['n'] for record in records] == list(range(1, 22))
+    assert records[0] == { 'n': 1, 'pc': 0, 'op': 'ADDI', 'args': [1, 1, 5], 'reg': [1, 5] }
+    assert records[1] == { 'n': 2, 'pc': 4, 'op': 'STUR', 'args': [1, 2, 8], 'mem': [8, 5] }
+    assert records[-1] == { 'n': 21, 'pc': 16, 'op': 'CBNZ', 'args': [1, 0, -3] }
+
+def test_diff(tmp_path):
+    paths = [str(tmp_path / f'{i}.jsonl') for i in range(3)]
+    make_cpu().run(trace=Tracer(paths[0]))
+    make_cpu().run(trace=Tracer(paths[1]))
+    # Stores to a different address from the second record on
+    make_cpu('X2=16').run(trace=Tracer(paths[2]))
+
+    assert diff_traces(paths[0], paths[1]) is None
+    n, record1, record2 = diff_traces(paths[0], paths[2])
+    assert n == 2
+    assert (record1['mem'], record2['mem']) == ([8, 5], [24, 5])
+
+# A trace that ends first is reported with a record of None
+def test_diff_shorter(tmp_path):
+    short, full = str(tmp_path / 'short.jsonl'), str(tmp_path / 'full.jsonl')
+    result = make_cpu().run(trace=Tracer(short), max_instrs=4)
+    assert (result.status, result.instrs) == ('max_instrs', 4)
+    make_cpu().run(trace=Tracer(full))
+
+    n, record1, record2 = diff_traces(short, full)
+    assert (n, record1) == (5, None)
+    assert record2['n'] == 5